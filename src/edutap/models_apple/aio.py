@@ -0,0 +1,55 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import os
+import typing
+import weakref
+
+
+DEFAULT_CONCURRENCY = os.cpu_count() or 1
+"""number of passes created concurrently per event loop if no limit is given"""
+
+_limits: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+T = typing.TypeVar("T")
+
+
+def default_limit() -> asyncio.Semaphore:
+    """
+    returns the semaphore shared by all async pass creations of the running event loop,
+    it allows DEFAULT_CONCURRENCY creations at a time
+    """
+    loop = asyncio.get_running_loop()
+    limit = _limits.get(loop)
+    if limit is None:
+        limit = _limits[loop] = asyncio.Semaphore(DEFAULT_CONCURRENCY)
+    return limit
+
+
+async def run_blocking(
+    function: typing.Callable[..., T],
+    *args,
+    executor: concurrent.futures.Executor | None = None,
+    limit: asyncio.Semaphore | None = None,
+    **kwargs,
+) -> T:
+    """
+    runs a blocking function in an executor without blocking the event loop
+
+    waits for `limit` first, so that a burst of requests queues up in the event loop
+    instead of oversubscribing the executor.
+
+    :param executor: executor running the function, the default executor of the loop if None.
+        with a ProcessPoolExecutor the function and its arguments must be picklable
+    :param limit: semaphore limiting the concurrent calls, default_limit() if None
+
+    in threads the function runs in a copy of the current context, so the collectors
+    registered with edutap.models_apple.instrumentation.collect see its stages
+    """
+    loop = asyncio.get_running_loop()
+    call = functools.partial(function, *args, **kwargs)
+    if not isinstance(executor, concurrent.futures.ProcessPoolExecutor):
+        call = functools.partial(contextvars.copy_context().run, call)
+    async with limit if limit is not None else default_limit():
+        return await loop.run_in_executor(executor, call)
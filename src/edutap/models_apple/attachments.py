@@ -0,0 +1,95 @@
+from collections import OrderedDict
+import hashlib
+import threading
+
+
+class AttachmentStore:
+    """
+    process wide store of attachment contents and their SHA-1 digests.
+
+    entries are keyed by the content of the attachment, so the same image shipped
+    in many passes is stored once and hashed once.
+    `register` returns the stored instance of the content, passes holding it share
+    one copy and later lookups of that instance are cheap (python caches the hash of
+    a bytes object).
+
+    the store keeps at most `max_bytes` of attachment data, the least recently used
+    entries are evicted first. larger attachments are hashed but not stored.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        """number of bytes currently held by the store"""
+        self.hits = 0
+        self.misses = 0
+        # content -> (stored instance of the content, sha1 hexdigest)
+        self._entries: OrderedDict[bytes, tuple[bytes, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _lookup(self, data: bytes, sha1: str | None = None) -> tuple[bytes, str]:
+        with self._lock:
+            entry = self._entries.get(data)
+            if entry is not None:
+                self.hits += 1
+                self._entries.move_to_end(data)
+                return entry
+            self.misses += 1
+
+        # hash outside of the lock, other threads may look up meanwhile
+        entry = (data, sha1 or hashlib.sha1(data).hexdigest())
+        if len(data) > self.max_bytes:
+            return entry
+
+        with self._lock:
+            entry = self._entries.setdefault(data, entry)
+            if entry[0] is data:
+                self.size += len(data)
+                while self.size > self.max_bytes:
+                    _, (evicted, _) = self._entries.popitem(last=False)
+                    self.size -= len(evicted)
+        return entry
+
+    def register(self, data: bytes, sha1: str | None = None) -> bytes:
+        """
+        registers an attachment and returns the stored instance of its content
+
+        :param sha1: the digest of the content if it is known already, e.g. from hashing.read_attachment
+        """
+        if type(data) is not bytes:
+            data = bytes(data)
+        return self._lookup(data, sha1)[0]
+
+    def sha1(self, data: bytes) -> str:
+        """returns the SHA-1 hexdigest of an attachment, hashing each distinct content once"""
+        if type(data) is not bytes:
+            return hashlib.sha1(data).hexdigest()
+        return self._lookup(data)[1]
+
+    def cached_sha1(self, data: bytes) -> str | None:
+        """returns the SHA-1 hexdigest of an attachment if the store has it, without hashing it"""
+        if type(data) is not bytes:
+            return None
+        with self._lock:
+            entry = self._entries.get(data)
+            if entry is None:
+                return None
+            self.hits += 1
+            self._entries.move_to_end(data)
+            return entry[1]
+
+    def clear(self):
+        """removes all entries from the store"""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __contains__(self, data: bytes) -> bool:
+        return data in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+attachment_store = AttachmentStore()
+"""the store used by Pass and PassTemplate"""
@@ -0,0 +1,263 @@
+from array import array
+import io
+import itertools
+import types
+import typing
+from typing import Any, Callable, Iterable, Iterator, Mapping, Sequence
+
+from jsonpointer import JsonPointer, JsonPointerException
+from pydantic import BaseModel
+
+from edutap.models_apple.models import Pass, pass_model_registry
+from edutap.models_apple.serials import SerialAllocator, default_allocator
+from edutap.models_apple.signing import PassSigner, SignerRegistry
+from edutap.models_apple.template import CompiledPassTemplate, PassTemplateBase
+
+
+_typecodes = {bool: "b", int: "q", float: "d"}
+"""array typecodes of the column types stored in arrays, all other values are kept in lists"""
+
+Mask = bytearray
+"""one byte per row, 1 for the selected rows"""
+
+
+def _unwrap(annotation: Any) -> Any:
+    """strips Annotated and None from a type annotation"""
+    while True:
+        origin = typing.get_origin(annotation)
+        if origin is typing.Annotated:
+            annotation = typing.get_args(annotation)[0]
+        elif origin in (typing.Union, types.UnionType):
+            args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+            if len(args) != 1:
+                return annotation
+            annotation = args[0]
+        else:
+            return annotation
+
+
+def _declared_type(path: str) -> Any:
+    """the type the models declare for the member of pass.json at the json pointer, None if it is unknown"""
+    annotation: Any = Pass
+    for token in JsonPointer(path).parts:
+        annotation = _unwrap(annotation)
+        if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+            if annotation is Pass and token in pass_model_registry:
+                annotation = pass_model_registry[token]
+                continue
+            field = annotation.model_fields.get(token)
+            if field is None:
+                return None
+            annotation = field.annotation
+        elif typing.get_origin(annotation) in (list, typing.List):
+            annotation = typing.get_args(annotation)[0]
+        else:
+            return None
+    return _unwrap(annotation)
+
+
+class _Column:
+    __slots__ = ("name", "path", "op", "default", "type", "values")
+
+    def __init__(self, name: str, path: str, op: str, default: Any):
+        self.name = name
+        self.path = path
+        self.op = op
+        self.default = default
+        # members declared as e.g. str | int | float (Field.value) keep the type of each value
+        declared = _declared_type(path)
+        self.type = declared if declared in _typecodes and default is not None else None
+        self.values: array | list = array(_typecodes[self.type]) if self.type else []
+
+    def convert(self, value: Any) -> Any:
+        if self.type is None:
+            return value
+        try:
+            converted = self.type(value)
+        except (TypeError, ValueError):
+            converted = None
+        # the array would silently change the value, e.g. truncate 10.5 to 10 or turn "no" into True
+        if converted is None or converted != value:
+            raise ValueError(f"{value!r} can not be stored in the {self.type.__name__} column {self.name!r}")
+        return converted
+
+    def get(self, index: int) -> Any:
+        value = self.values[index]
+        return bool(value) if self.type is bool else value
+
+
+class PassBatch:
+    """
+    many passes created from one template, held in columns.
+
+    only the values that vary from pass to pass are stored, one column per json pointer
+    into pass.json. columns of members the models declare as bool, int or float are stored
+    in arrays and reject values they can not hold without loss, the other ones in lists.
+    the template, its attachments and everything not covered by a column are shared by
+    all passes of the batch.
+
+    Pass objects are created from a row only when they are requested (batch[index],
+    iterating, create_pkpass) and are not kept by the batch. with trusted=True they are
+    created from the compiled template in trusted mode, only the values of the columns are
+    validated, but the models they share with the template are read-only.
+
+    :param template: the template of the passes
+    :param columns: json pointers into pass.json by column name, e.g.
+        {"serialNumber": "/serialNumber", "message": "/barcodes/0/message", "name": "/storeCard/primaryFields/0/value"}.
+        the value of the template at the pointer is the default of the column,
+        /serialNumber defaults to a new serial number per row
+    :param trusted: create passes in trusted mode, see CompiledPassTemplate.create_pass_object
+    :param allocator: allocates the serial numbers of the rows, defaults to serials.default_allocator()
+    """
+
+    def __init__(
+        self,
+        template: PassTemplateBase | CompiledPassTemplate,
+        columns: Mapping[str, str],
+        *,
+        trusted: bool = False,
+        allocator: SerialAllocator | None = None,
+    ):
+        self.template = template.compile() if isinstance(template, PassTemplateBase) else template
+        self.trusted = trusted
+        self.allocator = allocator
+        self._columns: dict[str, _Column] = {}
+        self._length = 0
+        for name, path in columns.items():
+            try:
+                default = JsonPointer(path).resolve(self.template.pass_json)
+                op = "replace"
+            except JsonPointerException:
+                # members missing in the template are added, the parent must exist
+                JsonPointer(path.rsplit("/", 1)[0]).resolve(self.template.pass_json)
+                default = None
+                op = "add"
+            self._columns[name] = _Column(name, path, op, default)
+
+    def __len__(self) -> int:
+        return self._length
+
+    @property
+    def columns(self) -> list[str]:
+        return list(self._columns)
+
+    def column(self, name: str) -> array | list:
+        """the values of a column, must not be changed in length"""
+        return self._columns[name].values
+
+    # rows
+
+    def append(self, **values: Any) -> int:
+        """
+        adds a pass with the given column values, missing columns get their default
+
+        :return: the index of the pass
+        """
+        unknown = values.keys() - self._columns.keys()
+        if unknown:
+            raise KeyError(f"unknown columns {sorted(unknown)}")
+        # all values are converted before the first one is appended, the columns stay aligned
+        converted = {name: self._columns[name].convert(value) for name, value in values.items()}
+        for column in self._columns.values():
+            if column.name in converted:
+                value = converted[column.name]
+            elif column.path == "/serialNumber":
+                value = (self.allocator or default_allocator()).allocate()
+            else:
+                value = column.convert(column.default)
+            column.values.append(value)
+        self._length += 1
+        return self._length - 1
+
+    def extend(self, rows: Iterable[Mapping[str, Any]]):
+        """adds a pass per row, see append"""
+        for row in rows:
+            self.append(**row)
+
+    def row(self, index: int) -> dict[str, Any]:
+        """the column values of a pass"""
+        return {name: column.get(index) for name, column in self._columns.items()}
+
+    # bulk updates
+
+    def where(self, name: str, predicate: Callable[[Any], bool] | Any) -> Mask:
+        """
+        returns the mask of the passes whose value in the column equals `predicate`,
+        or for which `predicate` returns true if it is callable.
+        masks are combined like bytes, e.g. bytearray(a & b for a, b in zip(mask1, mask2))
+        """
+        column = self._columns[name]
+        if callable(predicate):
+            return bytearray(bool(predicate(column.get(i))) for i in range(self._length))
+        try:
+            value = column.convert(predicate)
+        except ValueError:
+            # a value the column can not hold
+            return bytearray(self._length)
+        return bytearray(v == value for v in column.values)
+
+    def set(self, name: str, value: Any | Sequence[Any], where: Sequence[int] | None = None):
+        """
+        sets the column to `value` for all passes selected by the mask `where` (all if None).
+        value may also be a sequence with one value per pass of the batch
+        """
+        column = self._columns[name]
+        values = column.values
+        per_row = isinstance(value, Sequence) and not isinstance(value, (str, bytes))
+        if per_row and len(value) != self._length:
+            raise ValueError(f"{len(value)} values for {self._length} passes")
+        if where is None:
+            if per_row:
+                converted = [column.convert(v) for v in value]
+            else:
+                converted = [column.convert(value)] * self._length
+            values[:] = array(values.typecode, converted) if isinstance(values, array) else converted
+            return
+        if len(where) != self._length:
+            raise ValueError(f"mask of {len(where)} rows for {self._length} passes")
+        selected = itertools.compress(range(self._length), where)
+        if per_row:
+            for i in selected:
+                values[i] = column.convert(value[i])
+        else:
+            value = column.convert(value)
+            for i in selected:
+                values[i] = value
+
+    def update(self, name: str, function: Callable[[Any], Any], where: Sequence[int] | None = None):
+        """replaces the value of the column with function(value) for the selected passes"""
+        column = self._columns[name]
+        indexes = range(self._length) if where is None else itertools.compress(range(self._length), where)
+        for i in indexes:
+            column.values[i] = column.convert(function(column.get(i)))
+
+    # materialization
+
+    def patches(self, index: int) -> list[dict[str, Any]]:
+        """the json patch creating the pass `index` from the template"""
+        return [
+            {"op": column.op, "path": column.path, "value": column.get(index)}
+            for column in self._columns.values()
+        ]
+
+    def __getitem__(self, index: int) -> Pass:
+        """creates the Pass of a row"""
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("pass index out of range")
+        return self.template.create_pass_object(pass_patches=self.patches(index), trusted=self.trusted)
+
+    def __iter__(self) -> Iterator[Pass]:
+        for index in range(self._length):
+            yield self[index]
+
+    def passes(self, where: Sequence[int] | None = None) -> Iterator[Pass]:
+        """creates the passes selected by the mask one after the other"""
+        indexes = range(self._length) if where is None else itertools.compress(range(self._length), where)
+        for index in indexes:
+            yield self[index]
+
+    def create_pkpass(self, index: int, *, signer: PassSigner | SignerRegistry, **kwargs) -> io.BytesIO:
+        """creates the .pkpass file of a row, takes the keyword arguments of Pass.create"""
+        return self[index].create(signer=signer, **kwargs)
@@ -0,0 +1,50 @@
+import os
+import zipfile
+
+from pydantic import BaseModel, ConfigDict, Field
+
+
+class CompressionPolicy(BaseModel):
+    """
+    decides how each entry of a .pkpass file is compressed.
+
+    the method of an entry is looked up by its file extension, first in `overrides`,
+    then in `methods`, entries without a matching extension use `default_method`.
+    methods are the zipfile constants ZIP_STORED and ZIP_DEFLATED.
+
+    by default the text entries (pass.json, manifest.json, .strings) are deflated
+    and images, which are compressed already, are stored.
+    """
+
+    model_config = ConfigDict(frozen=True)
+
+    level: int | None = 6
+    """compression level for deflated entries (1-9), None for the zlib default"""
+    default_method: int = zipfile.ZIP_STORED
+    """method for entries without a known extension, e.g. signature"""
+    methods: dict[str, int] = Field(
+        default_factory=lambda: {
+            ".json": zipfile.ZIP_DEFLATED,
+            ".strings": zipfile.ZIP_DEFLATED,
+            ".png": zipfile.ZIP_STORED,
+            ".jpg": zipfile.ZIP_STORED,
+            ".jpeg": zipfile.ZIP_STORED,
+        }
+    )
+    overrides: dict[str, int] = Field(default_factory=dict)
+    """per extension methods taking precedence over `methods`, e.g. {".png": ZIP_DEFLATED}"""
+
+    def method(self, filename: str) -> int:
+        """returns the compression method for an entry"""
+        extension = os.path.splitext(filename)[1].lower()
+        method = self.overrides.get(extension)
+        if method is None:
+            method = self.methods.get(extension, self.default_method)
+        return method
+
+
+DEFAULT_COMPRESSION = CompressionPolicy()
+"""the policy used if none is given: text entries deflated, images stored"""
+
+NO_COMPRESSION = CompressionPolicy(methods={})
+"""stores all entries uncompressed"""
@@ -0,0 +1,193 @@
+"""
+SHA-1 hashing of the attachments of passes for the manifest.
+
+hashlib releases the GIL while it hashes large buffers, attachments are hashed on a
+thread pool when there is enough to hash. below PARALLEL_THRESHOLD bytes they are
+hashed on the calling thread, small passes do not pay for handing work to the pool.
+attachments added as paths are kept as FileAttachment, they are hashed chunk by chunk
+and copied into the archive chunk by chunk without being held in memory.
+"""
+from collections.abc import Mapping
+import concurrent.futures
+import hashlib
+import os
+import threading
+import typing
+
+from edutap.models_apple.attachments import attachment_store
+
+
+CHUNK_SIZE = 1024 * 1024
+"""size of the chunks files are read and hashed in"""
+
+PARALLEL_THRESHOLD = 1024 * 1024
+"""number of bytes to hash from which a thread pool is used"""
+
+MAX_WORKERS = min(8, os.cpu_count() or 1)
+
+AttachmentSource = bytes | str | os.PathLike | typing.BinaryIO
+"""content of an attachment, a path to it or a file object opened in binary mode"""
+
+
+class FileAttachment:
+    """
+    an attachment of a pass kept as the path of its file, see Pass.addFile.
+
+    the file is read when the pass is built: it is hashed with sha1_file and copied into
+    the archive chunk by chunk. the digest is kept as long as the size and the modification
+    time of the file do not change. the file must not change while a pass is built.
+    """
+
+    __slots__ = ("path", "_stat", "_sha1")
+
+    def __init__(self, path: str | os.PathLike):
+        self.path = os.fspath(path)
+        self._sha1: str | None = None
+        # raises for missing files, like reading them did
+        self._stat = self._signature()
+
+    def _signature(self) -> tuple[int, int]:
+        stat = os.stat(self.path)
+        return stat.st_size, stat.st_mtime_ns
+
+    def __len__(self) -> int:
+        return os.stat(self.path).st_size
+
+    def __repr__(self) -> str:
+        return f"FileAttachment({self.path!r})"
+
+    def changed(self) -> bool:
+        """the file changed since it was hashed"""
+        try:
+            return self._sha1 is None or self._signature() != self._stat
+        except OSError:
+            return True
+
+    def sha1(self, chunk_size: int = CHUNK_SIZE) -> str:
+        """the SHA-1 hexdigest of the file, hashed again only if it changed"""
+        signature = self._signature()
+        if self._sha1 is None or signature != self._stat:
+            # the signature is taken before hashing, a change while hashing is seen next time
+            self._stat = signature
+            self._sha1 = sha1_file(self.path, chunk_size)
+        return self._sha1
+
+    def open(self) -> typing.BinaryIO:
+        return open(self.path, "rb")
+
+    def read(self) -> bytes:
+        with self.open() as f:
+            return f.read()
+
+
+Attachment = bytes | FileAttachment
+"""an attachment held by a pass"""
+
+T = typing.TypeVar("T")
+
+_executor: concurrent.futures.ThreadPoolExecutor | None = None
+_executor_pid = 0
+_executor_lock = threading.Lock()
+
+
+def executor() -> concurrent.futures.ThreadPoolExecutor:
+    """the thread pool hashing attachments, created on first use and again in forked processes"""
+    global _executor, _executor_pid
+    with _executor_lock:
+        # the threads of a pool do not survive a fork
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = concurrent.futures.ThreadPoolExecutor(MAX_WORKERS, thread_name_prefix="hashing")
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _map(
+    function: typing.Callable[[typing.Any], T], items: list, sizes: list[int], threshold: int
+) -> list[T]:
+    if len(items) < 2 or sum(sizes) < threshold or MAX_WORKERS < 2:
+        return [function(item) for item in items]
+    return list(executor().map(function, items))
+
+
+def _size(source: AttachmentSource) -> int:
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return len(source)
+    try:
+        if isinstance(source, (str, os.PathLike)):
+            return os.path.getsize(source)
+        return os.fstat(source.fileno()).st_size - source.tell()
+    except (OSError, AttributeError, ValueError):
+        # e.g. BytesIO, its size is unknown without reading it
+        return PARALLEL_THRESHOLD
+
+
+def _hash(source: AttachmentSource, chunk_size: int, keep: bool) -> tuple[bytes | None, str]:
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source) if keep else None, hashlib.sha1(source).hexdigest()
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return _hash(f, chunk_size, keep)
+    if keep:
+        # read at once, joining chunks would need twice the size of the content
+        data = source.read()
+        return data, hashlib.sha1(data).hexdigest()
+    sha1 = hashlib.sha1()
+    while chunk := source.read(chunk_size):
+        sha1.update(chunk)
+    return None, sha1.hexdigest()
+
+
+def sha1_file(source: str | os.PathLike | typing.BinaryIO, chunk_size: int = CHUNK_SIZE) -> str:
+    """hashes a file in chunks of `chunk_size`, without reading it into memory"""
+    return _hash(source, chunk_size, keep=False)[1]
+
+
+def read_attachment(source: AttachmentSource) -> tuple[bytes, str]:
+    """
+    reads an attachment into memory and hashes it
+
+    :return: the content and its SHA-1 hexdigest
+    """
+    return _hash(source, CHUNK_SIZE, keep=True)
+
+
+def read_attachments(
+    sources: Mapping[str, AttachmentSource],
+    *,
+    threshold: int = PARALLEL_THRESHOLD,
+) -> dict[str, tuple[bytes, str]]:
+    """reads and hashes several attachments, in parallel if they have `threshold` bytes or more"""
+    names = list(sources)
+    items = [sources[name] for name in names]
+    results = _map(read_attachment, items, [_size(s) for s in items], threshold)
+    return dict(zip(names, results))
+
+
+def _sha1(data: Attachment) -> str:
+    if isinstance(data, FileAttachment):
+        return data.sha1()
+    return attachment_store.sha1(data)
+
+
+def hash_attachments(files: Mapping[str, Attachment], *, threshold: int = PARALLEL_THRESHOLD) -> dict[str, str]:
+    """
+    the SHA-1 hexdigests of the attachments of a pass.
+
+    digests known to the attachment store are taken from it, the other attachments are
+    hashed in parallel if they have `threshold` bytes or more, and registered in the store.
+    FileAttachments are hashed chunk by chunk, they are not held by the store.
+    """
+    digests = {}
+    pending = []
+    for name, data in files.items():
+        digest = None if isinstance(data, FileAttachment) else attachment_store.cached_sha1(data)
+        if digest is None:
+            pending.append(name)
+        else:
+            digests[name] = digest
+    if pending:
+        items = [files[name] for name in pending]
+        results = _map(_sha1, items, [len(data) for data in items], threshold)
+        digests.update(zip(pending, results))
+    # in the order of the attachments, like the manifest was written before
+    return {name: digests[name] for name in files}
@@ -0,0 +1,156 @@
+import bisect
+import contextlib
+import contextvars
+import threading
+import time
+import typing
+
+
+class StageEvent(typing.NamedTuple):
+    stage: str
+    duration: float
+    """seconds"""
+    bytes_in: int | None = None
+    bytes_out: int | None = None
+    attachments: int | None = None
+
+
+Collector = typing.Callable[[StageEvent], None]
+
+_collectors: contextvars.ContextVar[tuple[Collector, ...]] = contextvars.ContextVar(
+    "edutap_models_apple_collectors", default=()
+)
+
+
+@contextlib.contextmanager
+def collect(collector: Collector) -> typing.Iterator[Collector]:
+    """
+    registers a collector for the current context (thread or asyncio task) until the with block is left.
+    the collector is called with a StageEvent for every stage of building a pass finished meanwhile:
+
+    - create: Pass.create, bytes_out is the size of the archive
+    - serialize: serializing pass.json, bytes_out is its size
+    - manifest: Pass._createManifest, bytes_in is the size of the hashed files
+    - sign: Pass._createSignature and Pass._sign_manifest, bytes_in is the size of the manifest
+    - zip: Pass._createZip, bytes_in is the size of the entries, bytes_out of the archive
+    - create_pass_object: creating a pass object from a template
+    - rebuild: rebuild_pkpass, bytes_out is the size of the archive
+
+    without a registered collector measuring is a no-op.
+    """
+    token = _collectors.set(_collectors.get() + (collector,))
+    try:
+        yield collector
+    finally:
+        _collectors.reset(token)
+
+
+class _Measurement:
+    """measures a stage, the measured code sets bytes_in, bytes_out and attachments"""
+
+    __slots__ = ("stage", "collectors", "start", "bytes_in", "bytes_out", "attachments")
+
+    def __init__(self, stage: str, collectors: tuple[Collector, ...]):
+        self.stage = stage
+        self.collectors = collectors
+        self.bytes_in = self.bytes_out = self.attachments = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            return
+        event = StageEvent(
+            self.stage, time.perf_counter() - self.start, self.bytes_in, self.bytes_out, self.attachments
+        )
+        for collector in self.collectors:
+            collector(event)
+
+
+class _Disabled:
+    """stands in for _Measurement if no collector is registered"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_disabled = _Disabled()
+
+
+def stage(name: str) -> _Measurement | _Disabled:
+    """returns a context manager measuring the stage `name` for the collectors of the current context"""
+    collectors = _collectors.get()
+    if not collectors:
+        return _disabled
+    return _Measurement(name, collectors)
+
+
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+"""upper bounds of the duration histogram buckets in seconds"""
+
+
+class StageStats:
+    """aggregated events of one stage"""
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.histogram = [0] * (len(buckets) + 1)
+        """number of events per bucket, the last one counts the events above the largest bound"""
+        self.count = 0
+        self.duration = 0.0
+        self.max_duration = 0.0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.attachments = 0
+
+    def add(self, event: StageEvent):
+        self.count += 1
+        self.duration += event.duration
+        self.max_duration = max(self.max_duration, event.duration)
+        self.histogram[bisect.bisect_left(self.buckets, event.duration)] += 1
+        self.bytes_in += event.bytes_in or 0
+        self.bytes_out += event.bytes_out or 0
+        self.attachments += event.attachments or 0
+
+    @property
+    def mean_duration(self) -> float:
+        return self.duration / self.count if self.count else 0.0
+
+
+class StageStatistics:
+    """
+    built-in collector counting the events per stage with a histogram of their durations,
+    can be shared by several threads
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.stages: dict[str, StageStats] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event: StageEvent):
+        with self._lock:
+            stats = self.stages.get(event.stage)
+            if stats is None:
+                stats = self.stages[event.stage] = StageStats(self.buckets)
+            stats.add(event)
+
+    def __getitem__(self, stage: str) -> StageStats:
+        return self.stages[stage]
+
+    def __contains__(self, stage: str) -> bool:
+        return stage in self.stages
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
@@ -1,3 +1,5 @@
+import asyncio
+import concurrent.futures
 from enum import Enum
 import functools
 import hashlib
@@ -5,21 +7,213 @@ from io import BytesIO
 import io
 import json
 from numbers import Number
+import os
+import shutil
+import time
 import typing
-import uuid
 import zipfile
+import zlib
 
-from pydantic import BaseModel, ConfigDict, Field as PydanticField, computed_field, field_serializer, model_serializer, model_validator
-from pydantic.fields import FieldInfo
+from pydantic import AfterValidator, BaseModel, ConfigDict, Discriminator, Field as PydanticField, PrivateAttr, Tag, computed_field, field_serializer, model_serializer, model_validator
 
-from M2Crypto import SMIME, X509
-from M2Crypto.X509 import X509_Stack
-import shortuuid
+from edutap.models_apple.aio import run_blocking
+from edutap.models_apple.attachments import attachment_store
+from edutap.models_apple.compression import DEFAULT_COMPRESSION, CompressionPolicy
+from edutap.models_apple.hashing import CHUNK_SIZE, Attachment, AttachmentSource, FileAttachment, hash_attachments, read_attachment, read_attachments
+from edutap.models_apple.instrumentation import stage
+from edutap.models_apple.serials import default_allocator
+from edutap.models_apple.signing import PassSigner, SignerRegistry, resolve_signer
 
 class StrEnum(str, Enum):
     def __repr__(self) -> str:
         return str.__repr__(self.value)                  
 
+# change tracking: every pass counts the changes of its models and lists in its revision,
+# builds of a pass are reused only as long as its revision did not change.
+# the tracked models and containers of a pass know their parent, a change is propagated
+# up to the pass. the parents are linked when the pass is built: until then nothing
+# can be stale, and every later change adding a model or a list increments the revision,
+# so the pass is built and linked again before a change of the new part matters.
+# a model or list held by several parents (e.g. shared by copies of a pass) knows all of
+# them as a tuple, a change is propagated to every pass holding it.
+
+
+def _parent(node):
+    try:
+        return node._parent
+    except AttributeError:
+        # a model that was never linked
+        return None
+
+
+def _changed(node):
+    """increments the revision of the passes the changed model or container belongs to"""
+    while (parent := _parent(node)) is not None and parent is not _READ_ONLY:
+        if type(parent) is tuple:
+            # parents the node was removed from are dropped
+            parents = tuple(each for each in parent if _holds(each, node))
+            _set_parent(node, parents if len(parents) > 1 else parents[0] if parents else None)
+            for each in parents:
+                _changed(each)
+            return
+        node = parent
+    if isinstance(node, Pass):
+        node.__pydantic_private__["_revision"] += 1
+
+
+def _set_parent(node, parent):
+    if isinstance(node, BaseModel):
+        object.__setattr__(node, "_parent", parent)
+    else:
+        node._parent = parent
+
+
+def _holds(parent, node) -> bool:
+    if isinstance(parent, BaseModel):
+        values = parent.__dict__.values()
+    else:
+        values = parent.values() if isinstance(parent, dict) else parent
+    return any(value is node for value in values)
+
+
+def _add_parent(node, current, parent):
+    """the parents of a node linked to `parent`, besides the current ones still holding it"""
+    if current is None or current is parent:
+        return parent
+    parents = current if type(current) is tuple else (current,)
+    # parents the node was removed from are dropped
+    kept = tuple(each for each in parents if each is not parent and _holds(each, node))
+    return kept + (parent,) if kept else parent
+
+
+_READ_ONLY = object()
+"""parent of the models shared by several passes, see CompiledPassTemplate.create_pass_object"""
+
+
+_SCALARS = frozenset((str, int, float, bool, type(None), bytes))
+
+
+def _link(node, parent):
+    """sets the parent of a model or container and of everything below it"""
+    if isinstance(node, _TrackedModel):
+        current = _parent(node)
+        if current is _READ_ONLY:
+            return
+        _set_parent(node, _add_parent(node, current, parent))
+        values = node.__dict__.values()
+    elif isinstance(node, (_TrackedList, _TrackedDict)):
+        node._parent = _add_parent(node, node._parent, parent)
+        values = node.values() if isinstance(node, dict) else node
+    else:
+        return
+    for value in values:
+        if type(value) not in _SCALARS:
+            _link(value, node)
+
+
+def _share(node, unshared: dict[int, list]) -> bool:
+    """
+    marks the models below node that hold no lists or dicts as read-only, so several passes can share them.
+    node and the other models and containers below it are added to unshared: by id, the keys of
+    their members that are neither scalars nor read-only, see _copy_unshared
+
+    :return: node is a read-only model or a scalar
+    """
+    if isinstance(node, BaseModel):
+        items = node.__dict__.items()
+    elif isinstance(node, dict):
+        items = node.items()
+    elif isinstance(node, list):
+        items = enumerate(node)
+    else:
+        return True
+    keys = [key for key, value in items if not _share(value, unshared)]
+    if isinstance(node, _TrackedModel) and not keys:
+        object.__setattr__(node, "_parent", _READ_ONLY)
+        return True
+    unshared[id(node)] = keys
+    return False
+
+
+def _copy_unshared(node, unshared: dict[int, list], owned: set[int]):
+    """
+    copies node and the models and containers below it recorded by _share, the read-only ones are shared
+
+    :param owned: the ids of the copies are added to it
+    """
+    keys = unshared.get(id(node))
+    if keys is None:
+        return node
+    if isinstance(node, BaseModel):
+        copied = node.__copy__()
+        values = copied.__dict__
+    else:
+        copied = values = type(node)(node)
+    for key in keys:
+        values[key] = _copy_unshared(values[key], unshared, owned)
+    owned.add(id(copied))
+    return copied
+
+
+def _tracking(cls, names):
+    """wraps the mutating methods of a builtin container subclass so they count the change"""
+    for name in names:
+        method = getattr(cls.__base__, name)
+
+        def inner(self, *args, __method=method, **kwargs):
+            result = __method(self, *args, **kwargs)
+            _changed(self)
+            return result
+
+        functools.update_wrapper(inner, method)
+        setattr(cls, name, inner)
+    return cls
+
+
+class _TrackedList(list):
+    """list that counts its changes in the revision of its pass"""
+
+    _parent = None
+
+
+class _TrackedDict(dict):
+    """dict that counts its changes in the revision of its pass"""
+
+    _parent = None
+
+
+_tracking(_TrackedList, ("append", "extend", "insert", "remove", "pop", "clear", "sort", "reverse",
+                         "__setitem__", "__delitem__", "__iadd__", "__imul__"))
+_tracking(_TrackedDict, ("__setitem__", "__delitem__", "pop", "popitem", "clear", "update", "setdefault", "__ior__"))
+
+
+def _tracked(value):
+    if type(value) is list:
+        return _TrackedList(value)
+    if type(value) is dict:
+        return _TrackedDict(value)
+    return value
+
+
+class _TrackedModel(BaseModel):
+    """base class for models whose changes are counted in the revision of their pass"""
+
+    # a slot instead of a private attribute, so creating models does not get slower
+    __slots__ = ("_parent",)
+
+    def __setattr__(self, name, value):
+        if name.startswith("_"):
+            super().__setattr__(name, value)
+            return
+        if _parent(self) is _READ_ONLY:
+            raise TypeError(
+                f"this {type(self).__name__} is read-only, it is shared by the passes created from a template "
+                "with trusted=True. replace it with a new one or create the pass with trusted=False"
+            )
+        super().__setattr__(name, _tracked(value))
+        _changed(self)
+
+
 class Alignment(Enum):
     LEFT = "PKTextAlignmentLeft"
     CENTER = "PKTextAlignmentCenter"
@@ -62,7 +256,7 @@ class NumberStyle(Enum):
     SPELLOUT = "PKNumberStyleSpellOut"
 
 
-class Field(BaseModel):
+class Field(_TrackedModel):
 
 
     key: str  # Required. The key must be unique within the scope
@@ -99,7 +293,7 @@ class CurrencyField(Field):
     currencyCode: str = "USD"
 
 
-class Barcode(BaseModel):
+class Barcode(_TrackedModel):
     
     @field_serializer("format")
     def convert_enum(self, v):
@@ -113,7 +307,7 @@ class Barcode(BaseModel):
     altText: str = ""  # Optional. Text displayed near the barcode
 
 
-class Location(BaseModel):
+class Location(_TrackedModel):
     latitude: float = 0.0  # Required. Latitude, in degrees, of the location
     longitude: float = 0.0  # Required. Longitude, in degrees, of the location
     altitude: float = 0  # Optional. Altitude, in meters, of the location
@@ -121,34 +315,37 @@ class Location(BaseModel):
     relevantText: str = ""  # Optional. Text displayed on the lock screen when the pass is currently relevant
 
 
-class IBeacon(BaseModel):
+class IBeacon(_TrackedModel):
     proximityUUID: str  # Required. Unique identifier of a Bluetooth Low Energy location beacon
     major: int  # Required. Major identifier of a Bluetooth Low Energy location beacon
     minor: int  # Required. Minor identifier of a Bluetooth Low Energy location beacon
     relevantText: str = ""  # Optional. Text displayed on the lock screen when the pass is currently relevant
 
 
-class NFC(BaseModel):
+class NFC(_TrackedModel):
     message: str  # Required. Message to be displayed on the lock screen when the pass is currently relevant
     encryptionPublicKey: str  # Required. Public encryption key used by the Value Added Services protocol
     requiresAuthentication: bool = False  # Optional. Indicates that the pass is not valid unless it contains a valid signature 
 
 
-class PassInformation(BaseModel):
-    headerFields: typing.List[Field] = PydanticField(
-        default_factory=list
+FieldList = typing.Annotated[typing.List[Field], AfterValidator(_TrackedList)]
+
+
+class PassInformation(_TrackedModel):
+    headerFields: FieldList = PydanticField(
+        default_factory=_TrackedList
     )  # Optional. Additional fields to be displayed in the header of the pass
-    primaryFields: typing.List[Field] = PydanticField(
-        default_factory=list
+    primaryFields: FieldList = PydanticField(
+        default_factory=_TrackedList
     )  # Optional. Fields to be displayed prominently in the pass
-    secondaryFields: typing.List[Field] = PydanticField(
-        default_factory=list
+    secondaryFields: FieldList = PydanticField(
+        default_factory=_TrackedList
     )  # Optional. Fields to be displayed on the front of the pass
-    backFields: typing.List[Field] = PydanticField(
-        default_factory=list
+    backFields: FieldList = PydanticField(
+        default_factory=_TrackedList
     )  # Optional. Fields to be displayed on the back of the pass
-    auxiliaryFields: typing.List[Field] = PydanticField(
-        default_factory=list
+    auxiliaryFields: FieldList = PydanticField(
+        default_factory=_TrackedList
     )  # Optional. Additional fields to be displayed on the front of the pass
 
     def addHeaderField(self, key, value, label):
@@ -205,11 +402,58 @@ class StoreCard(PassInformation):
     pass
 
 
+_PASS_TYPE_TAG = "_passType"
+"""key added to the passinformation dict during validation, tells the discriminator its pass type"""
+
+
+def _pass_type_tag(value) -> str | None:
+    if isinstance(value, dict):
+        return value.get(_PASS_TYPE_TAG)
+    return getattr(value, "_jsonname", None)
+
+
+PassInformationVariant = typing.Annotated[
+    typing.Union[tuple(typing.Annotated[cls, Tag(name)] for name, cls in pass_model_registry.items())],
+    Discriminator(_pass_type_tag),
+]
+"""one of the @passmodel classes, selected by the pass type key it is stored under in pass.json"""
+
+
+def _pass_type_keys(keys, pass_type: str | None):
+    """the include or exclude argument of model_dump, with the key of the pass type selecting passInformation"""
+    if keys is None or pass_type is None or pass_type not in keys:
+        return keys
+    if isinstance(keys, dict):
+        return {**keys, "passInformation": keys[pass_type]}
+    return {*keys, "passInformation"}
+
+
+def _selected(name: str, include, exclude) -> bool:
+    """the key is serialized with the include and exclude arguments of model_dump"""
+    if include is not None and name not in include:
+        return False
+    if exclude is not None and name in exclude:
+        return not isinstance(exclude, dict) or exclude[name] is not True
+    return True
+
+
+class _Build(typing.NamedTuple):
+    """result of the serialization and hashing stage of a pass build"""
+
+    revision: int
+    files: tuple[tuple[str, Attachment], ...]
+    pass_json: bytes
+    manifest: str
+    reproducible: bool = False
+
+
+REPRODUCIBLE_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+"""date and time of all entries of reproducible builds, the earliest one a zip file can store"""
+
+
 def create_serial_number():
-    uid = uuid.uuid4()
-    res = shortuuid.encode(uid)
-    
-    return res
+    """returns a serial number from the default allocator, see serials.set_default_allocator"""
+    return default_allocator().allocate()
 
 class Pass(BaseModel):
     model_config = ConfigDict(use_enum_values=True)
@@ -289,13 +533,77 @@ class Pass(BaseModel):
                 res["barcodes"] = [barcode]
 
         return res
-    
-    
+
+    @model_validator(mode="before")
+    @classmethod
+    def resolve_pass_type(cls, data: typing.Any) -> typing.Any:
+        """
+        moves the pass information from the key of its pass type to passInformation,
+        so only the variant of the pass type is validated
+        """
+        if not isinstance(data, dict) or not any(name in data for name in pass_model_registry):
+            return data
+        found = [name for name in pass_model_registry if data.get(name) is not None]
+        if len(found) > 1:
+            raise ValueError(f"only one pass type can be set, got {', '.join(found)}")
+        res = {key: value for key, value in data.items() if key not in pass_model_registry}
+        if found:
+            name = found[0]
+            if res.get("passInformation") is not None:
+                raise ValueError(f"passInformation and {name} can not be set both")
+            value = data[name]
+            res["passInformation"] = {**value, _PASS_TYPE_TAG: name} if isinstance(value, dict) else value
+        return res
+
+    @model_serializer(mode="wrap")
+    def serialize_pass_type(self, handler, info):
+        """writes passInformation under the key of its pass type, like the registry entries were fields"""
+        data = handler(self)
+        if "passInformation" not in data:
+            return data
+        result = {}
+        pass_type = self.passType
+        for key, value in data.items():
+            if key != "passInformation":
+                result[key] = value
+                continue
+            for name in pass_model_registry:
+                if name == pass_type:
+                    result[name] = value
+                elif not info.exclude_none and _selected(name, info.include, info.exclude):
+                    result[name] = None
+        return result
+
+    def model_dump(self, *, include=None, exclude=None, **kwargs) -> dict[str, typing.Any]:
+        # the pass type keys select passInformation, like the registry entries were fields
+        pass_type = self.passType
+        return super().model_dump(
+            include=_pass_type_keys(include, pass_type), exclude=_pass_type_keys(exclude, pass_type), **kwargs
+        )
+
+    def model_dump_json(self, *, include=None, exclude=None, **kwargs) -> str:
+        pass_type = self.passType
+        return super().model_dump_json(
+            include=_pass_type_keys(include, pass_type), exclude=_pass_type_keys(exclude, pass_type), **kwargs
+        )
+
+    @classmethod
+    def __get_pydantic_json_schema__(cls, core_schema, handler):
+        """documents the pass type keys of pass.json instead of passInformation"""
+        json_schema = handler(core_schema)
+        properties = handler.resolve_ref_schema(json_schema)["properties"]
+        information = properties.pop("passInformation")
+        # the references to the variants, in the order of the registry
+        variants = information["anyOf"][0]["oneOf"]
+        for name, variant in zip(pass_model_registry, variants):
+            properties[name] = {"anyOf": [variant, {"type": "null"}], "default": None}
+        return json_schema
+
     @barcode.setter
     def barcode(self, value: Barcode | None):
         self.barcodes = [value] if value is not None else None
     
-    barcodes: list[Barcode] | None = None
+    barcodes: typing.Annotated[list[Barcode], AfterValidator(_TrackedList)] | None = None
     """Optional. Information specific to the pass’s barcode. The system uses the first valid"""
     suppressStripShine: bool = False
     """Optional. If true, the strip image is displayed."""
@@ -307,18 +615,18 @@ class Pass(BaseModel):
     """Optional. The authentication token to use with the web service."""
 
     # Relevance Keys
-    locations: list[Location] | None = None
+    locations: typing.Annotated[list[Location], AfterValidator(_TrackedList)] | None = None
     """Optional. Locations where the pass is relevant. For example, the location of your store."""
-    ibeacons: list[IBeacon] | None = None
+    ibeacons: typing.Annotated[list[IBeacon], AfterValidator(_TrackedList)] | None = None
     """Optional. IBeacons data"""
     relevantDate: DateField | str | None = None
     """Optional. Date and time when the pass becomes relevant."""
-    associatedStoreIdentifiers: list[str] | None = None
+    associatedStoreIdentifiers: typing.Annotated[list[str], AfterValidator(_TrackedList)] | None = None
     """Optional. Identifies which merchants’ locations accept the pass."""
 
     appLaunchURL: str | None = None
     """Optional. A URL to be passed to the associated app when launching it."""
-    userInfo: dict | None = None
+    userInfo: typing.Annotated[dict, AfterValidator(_TrackedDict)] | None = None
     """Optional. Custom information for the pass."""
     expirationDate: DateField | None = None  # TODO: check if this is correct
     """Optional. Date and time when the pass expires."""
@@ -327,7 +635,32 @@ class Pass(BaseModel):
     nfc: NFC | None = None
     """Optional. Information used for Value Added Service Protocol transactions."""
 
-    def all_attachments(self) -> tuple[str, bytes]:
+    passInformation: PassInformationVariant | None = None
+    """
+    the pass information of the pass type, stored in pass.json under the key of the
+    pass type (e.g. "storeCard"), which is also available as attribute
+    """
+
+    _build: _Build | None = PrivateAttr(default=None)
+    _revision: int = PrivateAttr(default=0)
+
+    def __setattr__(self, name, value):
+        if name.startswith("_"):
+            super().__setattr__(name, value)
+            return
+        if name not in ("files", "hashes"):
+            value = _tracked(value)
+        super().__setattr__(name, value)
+        # counted after the assignment, a build running meanwhile is not reused
+        self.__pydantic_private__["_revision"] += 1
+
+    def __copy__(self):
+        # the copy shares the models of this pass, their changes are counted for this pass only
+        copied = super().__copy__()
+        copied.__pydantic_private__["_build"] = None
+        return copied
+
+    def all_attachments(self) -> tuple[str, Attachment]:
         """
         generator functino to iterate over all attachments, returning name and data
         """
@@ -343,114 +676,460 @@ class Pass(BaseModel):
        return self.model_dump_json(exclude_none=True, indent=4)
     
     @property
-    def passInformation(self):
-        """Returns the pass information object by checkinf all passmodel entries using all()"""
-        return next(
-            filter(
-                lambda x: x is not None,
-                (map(lambda x: getattr(self, x), pass_model_registry)),
-            )
-        )
-        
-    @property
-    def passType(self):
-        return self.passInformation._jsonname
+    def passType(self) -> str | None:
+        """the key of the pass information in pass.json, e.g. storeCard"""
+        return _pass_type_tag(self.passInformation)
+
+    @classmethod
+    def _member_field(cls, member: str) -> str:
+        """returns the field holding the member of pass.json, used by PatchPlan.apply_to_model"""
+        if member in pass_model_registry:
+            return "passInformation"
+        return member
+
+    def addFile(self, name: str, fd: AttachmentSource):
+        """
+        Adds a file to the pass. The file is stored in the files dict and the hash is stored in the hashes dict.
+        Content is registered in the attachment store, passes with the same file share it.
 
-    def addFile(self, name: str, fd: typing.BinaryIO | bytes):
-        """Adds a file to the pass. The file is stored in the files dict and the hash is stored in the hashes dict"""
+        :param fd: the content, a file object or a path. a path is kept as FileAttachment,
+            the file is hashed and copied into the archive chunk by chunk when the pass is built
+        """
         if isinstance(fd, bytes):
-            self.files[name] = fd
+            self.files[name] = attachment_store.register(fd)
+        elif isinstance(fd, (str, os.PathLike)):
+            self.files[name] = FileAttachment(fd)
         else:
-            self.files[name] = fd.read()
+            self.files[name] = attachment_store.register(*read_attachment(fd))
 
-    def _createManifest(self):
+    def addFiles(self, files: typing.Mapping[str, AttachmentSource]):
+        """
+        Adds several files to the pass like addFile, large file objects are read and hashed in parallel
+        """
+        paths = {name: fd for name, fd in files.items() if isinstance(fd, (str, os.PathLike))}
+        read = read_attachments({name: fd for name, fd in files.items() if name not in paths})
+        for name in files:
+            if name in paths:
+                self.files[name] = FileAttachment(paths[name])
+            else:
+                self.files[name] = attachment_store.register(*read[name])
+
+    def mark_dirty(self):
+        """
+        discards the cached build of the pass.
+        changes through attributes, the field lists and addFile are detected automatically,
+        this is only needed after changing containers nested in userInfo in place
+        """
+        self._build = None
+
+    def _serialize(self, reproducible: bool = False) -> bytes:
+        """
+        serializes pass.json
+
+        :param reproducible: sort the keys, so the result does not depend on the order
+            the members of dicts (e.g. userInfo) were set
+        """
+        with stage("serialize") as measurement:
+            if reproducible:
+                pass_json = json.dumps(
+                    self.model_dump(mode="json", exclude_none=True), indent=4, sort_keys=True, ensure_ascii=False
+                ).encode("utf-8")
+            else:
+                pass_json = self.pass_json.encode("utf-8")
+            measurement.bytes_out = len(pass_json)
+        return pass_json
+
+    def _prepare(self, reproducible: bool = False) -> _Build:
+        """
+        serializes pass.json exactly once and creates the manifest from the same bytes.
+        the result is reused by further builds as long as neither the pass nor its files changed
+        """
+        files = tuple(self.files.items())
+        build = self._build
+        if (
+            build is not None
+            and build.revision == self._revision
+            and build.reproducible == reproducible
+            and len(build.files) == len(files)
+            and all(
+                name == old_name and data is old_data
+                for (name, data), (old_name, old_data) in zip(files, build.files)
+            )
+            and not any(isinstance(data, FileAttachment) and data.changed() for _, data in files)
+        ):
+            return build
+        revision = self._revision
+        for name, value in self.__dict__.items():
+            if name not in ("files", "hashes") and type(value) not in _SCALARS:
+                _link(value, self)
+        pass_json = self._serialize(reproducible)
+        manifest = self._createManifest(pass_json, reproducible)
+        self._build = _Build(revision, files, pass_json, manifest, reproducible)
+        return self._build
+
+    def _createManifest(self, pass_json: bytes | None = None, reproducible: bool = False) -> str:
         """
         Creates the hashes for all the files included in the pass file.
+
+        :param pass_json: serialized pass.json, the pass is serialized if not given
+        :param reproducible: sort the file names in the manifest
         """
-        pass_json = self.pass_json
-        self.hashes["pass.json"] = hashlib.sha1(pass_json.encode("utf-8")).hexdigest()
-        for filename, filedata in self.files.items():
-            self.hashes[filename] = hashlib.sha1(filedata).hexdigest()
-        return json.dumps(self.hashes)
+        if pass_json is None:
+            pass_json = self._serialize(reproducible)
+        with stage("manifest") as measurement:
+            self.hashes["pass.json"] = hashlib.sha1(pass_json).hexdigest()
+            self.hashes.update(hash_attachments(self.files))
+            manifest = json.dumps(self.hashes, sort_keys=reproducible)
+            measurement.bytes_in = len(pass_json) + sum(len(data) for data in self.files.values())
+            measurement.attachments = len(self.files)
+        return manifest
 
     def create(
         self,
-        certificate: str,
-        key: str,
-        wwdr_certificate: str,
-        password: str,
+        certificate: str | None = None,
+        key: str | None = None,
+        wwdr_certificate: str | None = None,
+        password: str | None = None,
         zip_file: typing.BinaryIO | None = None,
+        *,
+        signer: PassSigner | SignerRegistry | None = None,
+        compression: CompressionPolicy = DEFAULT_COMPRESSION,
+        reproducible: bool = False,
     ) -> io.BytesIO:
-        manifest = self._createManifest()
-        signature = self._createSignature(
-            manifest, certificate, key, wwdr_certificate, password
-        )
-        if not zip_file:
-            zip_file = BytesIO()
-        self._createZip(manifest, signature, zip_file=zip_file)
+        """
+        creates the .pkpass file
+
+        the pass is signed either with the given `signer` (a PassSigner or a
+        SignerRegistry holding a signer for this passTypeIdentifier/teamIdentifier)
+        or with the material loaded from `certificate`, `key` and `wwdr_certificate`.
+        `compression` decides per entry whether it is deflated or stored.
+
+        pass.json is serialized once, the same bytes are hashed into the manifest
+        and written to the archive. calling create again on an unchanged pass
+        reuses them.
+
+        :param reproducible: build the same bytes for the same pass, signing material
+            and compression, see fingerprint. the keys of pass.json and manifest.json are sorted,
+            the attachments are written in the order of their names and all entries get
+            REPRODUCIBLE_DATE_TIME. the signature has no signed attributes, so it does not
+            contain the signing time.
+        """
+        with stage("create") as measurement:
+            signer = resolve_signer(self, signer, certificate, key, wwdr_certificate, password)
+            build = self._prepare(reproducible)
+            signature = self._createSignature(build.manifest, signer=signer, signed_attributes=not reproducible)
+            if not zip_file:
+                zip_file = BytesIO()
+            self._createZip(
+                build.manifest,
+                signature,
+                zip_file=zip_file,
+                pass_json=build.pass_json,
+                compression=compression,
+                reproducible=reproducible,
+            )
+            measurement.bytes_out = _position(zip_file)
+            measurement.attachments = len(build.files)
         return zip_file
 
+    async def create_async(
+        self,
+        certificate: str | None = None,
+        key: str | None = None,
+        wwdr_certificate: str | None = None,
+        password: str | None = None,
+        *,
+        signer: PassSigner | SignerRegistry | None = None,
+        compression: CompressionPolicy = DEFAULT_COMPRESSION,
+        reproducible: bool = False,
+        executor: concurrent.futures.Executor | None = None,
+        limit: asyncio.Semaphore | None = None,
+    ) -> io.BytesIO:
+        """
+        creates the .pkpass file like create without blocking the event loop.
+
+        loading the signing material, serializing, signing and zipping run in `executor`
+        (the default executor of the running loop if None).
+        the pass must not be changed until the returned coroutine is done.
+
+        :param limit: semaphore limiting the number of passes created at the same time,
+            defaults to a limit of DEFAULT_CONCURRENCY per event loop, see edutap.models_apple.aio
+        """
+        return await run_blocking(
+            self.create,
+            certificate,
+            key,
+            wwdr_certificate,
+            password,
+            signer=signer,
+            compression=compression,
+            reproducible=reproducible,
+            executor=executor,
+            limit=limit,
+        )
+
+    def fingerprint(
+        self,
+        certificate: str | None = None,
+        key: str | None = None,
+        wwdr_certificate: str | None = None,
+        password: str | None = None,
+        *,
+        signer: PassSigner | SignerRegistry | None = None,
+        compression: CompressionPolicy = DEFAULT_COMPRESSION,
+    ) -> str:
+        """
+        fingerprint of the .pkpass file create(..., reproducible=True) builds, without building it.
+
+        it is computed from the manifest, the signing material and the compression policy,
+        e.g. as ETag answering conditional requests for a pass without signing and zipping it.
+        equal fingerprints mean equal archives as long as the same zlib version compresses them.
+        """
+        signer = resolve_signer(self, signer, certificate, key, wwdr_certificate, password)
+        build = self._prepare(reproducible=True)
+        sha256 = hashlib.sha256(build.manifest.encode("utf-8"))
+        sha256.update(signer.fingerprint.encode("ascii"))
+        sha256.update(json.dumps(compression.model_dump(), sort_keys=True).encode("utf-8"))
+        sha256.update(zlib.ZLIB_RUNTIME_VERSION.encode("ascii"))
+        return sha256.hexdigest()
+
     def create_pass_object(self, passtype: str):
         passcls = pass_model_registry[passtype]
         setattr(self, passtype, passcls())
 
-    def _get_smime(self, certificate, key, wwdr_certificate, password):
+    def _get_smime(self, certificate, key, wwdr_certificate, password, signer: PassSigner | None = None):
         """
+        only for signers using the m2crypto backend
+
         :return: M2Crypto.SMIME.SMIME
         """
-        # from M2Crypto.X509 import X509_Stack
-        def passwordCallback(*args, **kwds):
-            return bytes(password, encoding='ascii')
-
-        smime = SMIME.SMIME()
+        signer = resolve_signer(self, signer, certificate, key, wwdr_certificate, password)
+        return signer.smime()
 
-        wwdrcert = X509.load_cert(wwdr_certificate)
-        stack = X509_Stack()
-        stack.push(wwdrcert)
-        smime.set_x509_stack(stack)
-
-        smime.load_key(key, certfile=certificate, callback=passwordCallback)
-        return smime
-
-    def _sign_manifest(self, manifest, certificate, key, wwdr_certificate, password) -> SMIME.PKCS7:
+    def _sign_manifest(
+        self,
+        manifest,
+        certificate=None,
+        key=None,
+        wwdr_certificate=None,
+        password=None,
+        signer: PassSigner | None = None,
+        signed_attributes: bool = True,
+    ):
         """
+        only for signers using the m2crypto backend
+
         :return: M2Crypto.SMIME.PKCS7
         """
-        smime = self._get_smime(certificate, key, wwdr_certificate, password)
-        pkcs7 = smime.sign(
-            SMIME.BIO.MemoryBuffer(bytes(manifest, encoding='utf8')),
-            flags=SMIME.PKCS7_DETACHED | SMIME.PKCS7_BINARY
-        )
-        return pkcs7
-    
+        signer = resolve_signer(self, signer, certificate, key, wwdr_certificate, password)
+        with stage("sign") as measurement:
+            pk7 = signer.sign(manifest, signed_attributes=signed_attributes)
+            measurement.bytes_in = len(manifest)
+        return pk7
+
     def _createSignature(
-        self, manifest, certificate, key, wwdr_certificate, password
+        self,
+        manifest,
+        certificate=None,
+        key=None,
+        wwdr_certificate=None,
+        password=None,
+        signer: PassSigner | None = None,
+        signed_attributes: bool = True,
     ):
         """
-        Creates the signature for the pass file.
+        Creates the signature for the pass file, in DER format.
+        the signature cache of the signer is used, if it has one.
         """
-        pk7 = self._sign_manifest(manifest, certificate, key, wwdr_certificate, password)
-        der = SMIME.BIO.MemoryBuffer()
-        pk7.write_der(der)
-        return der.read()
+        signer = resolve_signer(self, signer, certificate, key, wwdr_certificate, password)
+        with stage("sign") as measurement:
+            der = signer.sign_der(manifest, signed_attributes=signed_attributes)
+            measurement.bytes_in = len(manifest)
+        return der
     
-    def _createZip(self, manifest, signature, zip_file=None):
-        pass_json = self.pass_json
-        zf = zipfile.ZipFile(zip_file or 'pass.pkpass', 'w')
-        zf.writestr('signature', signature)
-        zf.writestr('manifest.json', manifest)
-        zf.writestr('pass.json', pass_json)
-        for filename, filedata in self.files.items():
-            zf.writestr(filename, filedata)
-        zf.close()
+    def _zipEntries(
+        self, manifest, signature, pass_json: bytes, reproducible: bool = False
+    ) -> typing.Iterator[tuple[str, typing.Any]]:
+        """the entries of the .pkpass file in the order they are written"""
+        yield 'signature', signature
+        yield 'manifest.json', manifest
+        yield 'pass.json', pass_json
+        yield from sorted(self.files.items()) if reproducible else self.files.items()
+
+    def _createZip(
+        self,
+        manifest,
+        signature,
+        zip_file=None,
+        pass_json: bytes | None = None,
+        compression: CompressionPolicy = DEFAULT_COMPRESSION,
+        reproducible: bool = False,
+    ):
+        if pass_json is None:
+            pass_json = self._serialize(reproducible)
+        with stage("zip") as measurement:
+            zf = zipfile.ZipFile(zip_file or 'pass.pkpass', 'w')
+            for filename, filedata in self._zipEntries(manifest, signature, pass_json, reproducible):
+                _write_entry(
+                    zf,
+                    _reproducible_info(filename, compression) if reproducible else filename,
+                    filedata,
+                    compression.method(filename),
+                    compression.level,
+                )
+            zf.close()
+            measurement.bytes_in = sum(info.file_size for info in zf.infolist())
+            measurement.bytes_out = _position(zip_file)
+            measurement.attachments = len(self.files)
+
+    def stream(
+        self,
+        certificate: str | None = None,
+        key: str | None = None,
+        wwdr_certificate: str | None = None,
+        password: str | None = None,
+        *,
+        signer: PassSigner | SignerRegistry | None = None,
+        chunk_size: int = 64 * 1024,
+        compression: CompressionPolicy = DEFAULT_COMPRESSION,
+        reproducible: bool = False,
+    ) -> typing.Iterator[bytes]:
+        """
+        creates the .pkpass file and yields it in chunks, e.g. as body of a http response.
+
+        the archive is never held in memory as a whole, only the entry being written
+        (at most `chunk_size` bytes of it) is buffered before it is handed out.
+        the zip entries use data descriptors, so no seeking is needed.
+        signing material, compression and reproducible are given as for create.
+        the data descriptors make the streamed archive differ from the one of create,
+        a reproducible stream is the same for the same pass nevertheless.
+        """
+        signer = resolve_signer(self, signer, certificate, key, wwdr_certificate, password)
+        build = self._prepare(reproducible)
+        signature = self._createSignature(build.manifest, signer=signer, signed_attributes=not reproducible)
+
+        sink = _ChunkSink()
+        with zipfile.ZipFile(sink, 'w') as zf:
+            for filename, filedata in self._zipEntries(build.manifest, signature, build.pass_json, reproducible):
+                # zf.open takes method and level of new entries from the archive, or from the zip info
+                zf.compression = compression.method(filename)
+                zf.compresslevel = compression.level
+                target = _reproducible_info(filename, compression) if reproducible else filename
+                with zf.open(target, 'w', force_zip64=len(filedata) > zipfile.ZIP64_LIMIT) as entry:
+                    for chunk in _chunks(filedata, chunk_size):
+                        entry.write(chunk)
+                        yield from sink.drain()
+                yield from sink.drain()
+        yield from sink.drain()
+
+    def write_to(self, sink: typing.BinaryIO, *args, **kwargs):
+        """
+        writes the .pkpass file to a writable, possibly non-seekable sink
+        (e.g. a socket opened with makefile('wb') or a wsgi/asgi body writer) in chunks.
+        takes the same arguments as stream.
+        """
+        for chunk in self.stream(*args, **kwargs):
+            sink.write(chunk)
+
+
+def archive_fingerprint(archive: bytes | io.BytesIO) -> str:
+    """sha256 of a .pkpass file, e.g. one created with reproducible=True"""
+    data = archive.getbuffer() if isinstance(archive, io.BytesIO) else archive
+    return hashlib.sha256(data).hexdigest()
+
+
+def _reproducible_info(filename: str, compression: CompressionPolicy) -> zipfile.ZipInfo:
+    """zip info of an entry of a reproducible build, independent of the time and the platform"""
+    info = zipfile.ZipInfo(filename, date_time=REPRODUCIBLE_DATE_TIME)
+    info.create_system = 3
+    info.external_attr = 0o600 << 16
+    info.compress_type = compression.method(filename)
+    # the level is read from the zip info by ZipFile.open, writestr takes it as argument
+    info._compresslevel = compression.level
+    return info
+
+
+def _write_entry(zf: zipfile.ZipFile, target: str | zipfile.ZipInfo, data, compress_type: int, compresslevel: int | None):
+    """writes an entry of an archive, FileAttachments are copied chunk by chunk"""
+    if not isinstance(data, FileAttachment):
+        zf.writestr(target, data, compress_type=compress_type, compresslevel=compresslevel)
+        return
+    if isinstance(target, str):
+        # like writestr does for names
+        target = zipfile.ZipInfo(target, date_time=time.localtime(time.time())[:6])
+        target.external_attr = 0o600 << 16
+    target.compress_type = compress_type
+    target._compresslevel = compresslevel
+    with data.open() as source, zf.open(target, 'w', force_zip64=len(data) > zipfile.ZIP64_LIMIT) as entry:
+        shutil.copyfileobj(source, entry, CHUNK_SIZE)
+
+
+def _chunks(data: str | Attachment, chunk_size: int) -> typing.Iterator[bytes | memoryview]:
+    """the content of an entry in chunks of at most `chunk_size` bytes"""
+    if isinstance(data, FileAttachment):
+        with data.open() as source:
+            while chunk := source.read(chunk_size):
+                yield chunk
+        return
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    view = memoryview(data)
+    for offset in range(0, len(view), chunk_size):
+        yield view[offset:offset + chunk_size]
+
+
+def _position(file_) -> int | None:
+    """returns the position of a file-like object, None for paths and non-seekable files"""
+    try:
+        return file_.tell()
+    except (AttributeError, OSError):
+        return None
+
+
+class _ChunkSink:
+    """
+    non-seekable file-like target for zipfile, collects what is written
+    until it is drained
+    """
+
+    def __init__(self):
+        self.chunks: list[bytes] = []
+        self.position = 0
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self) -> list[bytes]:
+        chunks, self.chunks = self.chunks, []
+        return chunks
 
     
-# hack in an optional field for each passmodel(passtype) since these are not known at compile time
-# because for each pass type whe PassInformation is stored in a different field of which only one is used
-for jsonname, cls in pass_model_registry.items():
-    Pass.model_fields[jsonname] = FieldInfo(
-        annotation=cls, required=False, default=None, exclude_none=True
-    )
+def _pass_type_property(name: str) -> property:
+    """the pass information, if the pass is of the type `name`"""
+
+    def get(self: Pass) -> PassInformation | None:
+        return self.passInformation if self.passType == name else None
+
+    def set(self: Pass, value: PassInformation | dict | None):
+        if value is None:
+            if self.passType == name:
+                self.passInformation = None
+            return
+        if not isinstance(value, PassInformation):
+            value = pass_model_registry[name].model_validate(value)
+        self.passInformation = value
+
+    return property(get, set, doc=f"the pass information of a {name} pass, None for other pass types")
+
 
-# add mutually exclusive valdator so that only one variant can be defined
-Pass.model_rebuild(force=True)
+# each pass type is an attribute of the pass, as it is a key of pass.json
+for _name in pass_model_registry:
+    setattr(Pass, _name, _pass_type_property(_name))
@@ -0,0 +1,217 @@
+from collections.abc import Iterator, Mapping
+import errno
+import functools
+import io
+import json
+import mmap
+import os
+import struct
+import typing
+import zipfile
+
+from edutap.models_apple.models import Pass
+
+
+META_FILES = frozenset(("pass.json", "manifest.json", "manifest", "signature"))
+"""entries of a .pkpass file that are no attachments"""
+
+
+class _BufferReader(io.RawIOBase):
+    """
+    seekable read-only file over a buffer (bytes, bytearray, memoryview, mmap),
+    reading returns slices of the buffer without copying the rest of it
+    """
+
+    def __init__(self, buffer):
+        super().__init__()
+        self._view = memoryview(buffer).cast("B")
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        if offset < 0:
+            # like files, zipfile relies on OSError here
+            raise OSError(errno.EINVAL, f"negative seek position {offset}")
+        self._position = offset
+        return offset
+
+    def read(self, size: int = -1) -> bytes:
+        start = min(self._position, len(self._view))
+        end = len(self._view) if size is None or size < 0 else min(start + size, len(self._view))
+        self._position = end
+        return self._view[start:end].tobytes()
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+    def close(self):
+        self._view.release()
+        super().close()
+
+
+class Attachments(Mapping[str, bytes]):
+    """
+    the attachments of a PassFile by name, an entry is read and decompressed
+    every time it is accessed and not kept in memory
+    """
+
+    def __init__(self, zf: zipfile.ZipFile):
+        self._zf = zf
+        # a dict keeps the order of the archive and looks names up without scanning
+        self._names = dict.fromkeys(name for name in zf.namelist() if name not in META_FILES and not name.endswith("/"))
+
+    def __getitem__(self, name: str) -> bytes:
+        if name not in self._names:
+            raise KeyError(name)
+        return self._zf.read(name)
+
+    def __contains__(self, name) -> bool:
+        return name in self._names
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._names)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def open(self, name: str) -> typing.IO[bytes]:
+        """returns a file object decompressing the entry while it is read"""
+        if name not in self:
+            raise KeyError(name)
+        return self._zf.open(name)
+
+    def size(self, name: str) -> int:
+        """uncompressed size of an entry, without reading it"""
+        if name not in self:
+            raise KeyError(name)
+        return self._zf.getinfo(name).file_size
+
+
+class PassFile:
+    """
+    lazy reader of a .pkpass file.
+
+    opening only reads the directory of the archive, pass.json is parsed when
+    pass_object (or pass_dict) is accessed and attachments are decompressed when
+    they are accessed through `attachments`.
+
+    :param source: path of the file (it is memory-mapped), a bytes-like object or mmap
+        (read without copying) or a binary file object (left open by close)
+    """
+
+    def __init__(self, source: str | os.PathLike | bytes | bytearray | memoryview | mmap.mmap | typing.BinaryIO):
+        self._file = None
+        self._mmap = None
+        if isinstance(source, (str, os.PathLike)):
+            self._file = open(source, "rb")
+            try:
+                self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # empty files can not be mapped, zipfile reports them as bad zip files
+                self._mmap = None
+            fp = _BufferReader(self._mmap) if self._mmap is not None else self._file
+        elif isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+            fp = _BufferReader(source)
+        else:
+            fp = source
+        self._fp = fp
+        try:
+            self.zipfile = zipfile.ZipFile(fp)
+        except Exception:
+            self.close()
+            raise
+        self.attachments = Attachments(self.zipfile)
+
+    def __enter__(self) -> "PassFile":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        """closes the archive and the file or mapping opened for it"""
+        zf = getattr(self, "zipfile", None)
+        if zf is not None:
+            zf.close()
+        if isinstance(self._fp, _BufferReader):
+            self._fp.close()
+        if self._mmap is not None:
+            self._mmap.close()
+        if self._file is not None:
+            self._file.close()
+
+    @property
+    def names(self) -> list[str]:
+        """names of all entries"""
+        return self.zipfile.namelist()
+
+    def read(self, name: str) -> bytes:
+        """reads any entry of the archive"""
+        return self.zipfile.read(name)
+
+    def read_raw(self, name: str) -> tuple[zipfile.ZipInfo, bytes]:
+        """
+        returns the zip info and the compressed data of an entry as stored in the archive,
+        without decompressing it
+        """
+        info = self.zipfile.getinfo(name)
+        fp = self.zipfile.fp
+        fp.seek(info.header_offset)
+        header = fp.read(zipfile.sizeFileHeader)
+        if len(header) != zipfile.sizeFileHeader or header[:4] != zipfile.stringFileHeader:
+            raise zipfile.BadZipFile(f"bad local file header of {name!r}")
+        # the local header ends with the lengths of the file name and the extra field following it
+        name_length, extra_length = struct.unpack("<HH", header[26:30])
+        fp.seek(name_length + extra_length, io.SEEK_CUR)
+        data = fp.read(info.compress_size)
+        if len(data) != info.compress_size:
+            raise zipfile.BadZipFile(f"truncated data of {name!r}")
+        return info, data
+
+    @functools.cached_property
+    def pass_json(self) -> bytes:
+        """pass.json as stored in the archive"""
+        return self.zipfile.read("pass.json")
+
+    @functools.cached_property
+    def pass_dict(self) -> dict[str, typing.Any]:
+        """pass.json parsed, but not validated"""
+        return json.loads(self.pass_json)
+
+    @functools.cached_property
+    def pass_object(self) -> Pass:
+        """
+        pass.json validated into a Pass, without the attachments.
+        use to_pass for a pass including them
+        """
+        return Pass.model_validate_json(self.pass_json)
+
+    @functools.cached_property
+    def manifest(self) -> dict[str, str]:
+        """the sha1 hashes of manifest.json by file name"""
+        return json.loads(self.zipfile.read("manifest.json"))
+
+    @property
+    def signature(self) -> bytes:
+        return self.zipfile.read("signature")
+
+    def to_pass(self) -> Pass:
+        """returns a new Pass from pass.json with all attachments added"""
+        pass_object = Pass.model_validate_json(self.pass_json)
+        for name, data in self.attachments.items():
+            pass_object.addFile(name, data)
+        return pass_object
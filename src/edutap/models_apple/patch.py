@@ -0,0 +1,340 @@
+import copy
+from typing import Any, Iterable
+
+from jsonpatch import InvalidJsonPatch, JsonPatchConflict, JsonPatchTestFailed
+from jsonpointer import JsonPointer, JsonPointerException, escape
+from pydantic import BaseModel
+
+
+class UnsupportedModelPatch(Exception):
+    """
+    raised by PatchPlan.apply_to_model if an operation can not be applied to the model
+    directly, the caller has to patch and validate the json document instead
+    """
+
+
+class _Operation:
+    __slots__ = ("op", "path", "from_", "value")
+
+    def __init__(self, op: str, path: tuple[str, ...], from_: tuple[str, ...] | None, value: Any):
+        self.op = op
+        self.path = path
+        self.from_ = from_
+        self.value = value
+
+
+_operations_with_value = ("add", "replace", "test")
+_operations_with_from = ("move", "copy")
+
+
+def _parse_pointer(pointer: str) -> tuple[str, ...]:
+    return tuple(JsonPointer(pointer).parts)
+
+
+def _index(container: list, token: str, allow_end: bool = False) -> int:
+    """converts a token to a list index, see RFC 6901"""
+    if token == "-":
+        if allow_end:
+            return len(container)
+        raise JsonPointerException(f"invalid array index '{token}'")
+    if not token.isdigit() or (token != "0" and token.startswith("0")):
+        raise JsonPointerException(f"'{token}' is not a valid sequence index")
+    return int(token)
+
+
+def _child(container: Any, token: str) -> Any:
+    if isinstance(container, dict):
+        try:
+            return container[token]
+        except KeyError:
+            raise JsonPointerException(f"member '{token}' not found in {container}") from None
+    if isinstance(container, list):
+        index = _index(container, token)
+        if index >= len(container):
+            raise JsonPointerException(f"index '{token}' is out of bounds")
+        return container[index]
+    raise JsonPointerException(
+        f"Document '{type(container)}' does not support indexing, must be mapping/sequence"
+    )
+
+
+def _model_field(cls: type[BaseModel], token: str) -> str:
+    """
+    returns the field of the model class holding the member `token` of its json document.
+    models storing a member under another name implement the class method _member_field (e.g. Pass)
+    and expose the member as an attribute, which is None if the model does not hold it
+    """
+    member_field = getattr(cls, "_member_field", None)
+    field = token if member_field is None else member_field(token)
+    if field not in cls.model_fields:
+        raise UnsupportedModelPatch(f"{cls.__name__} has no field {token!r}")
+    return field
+
+
+class PatchPlan:
+    """
+    compiled form of a json patch following [RFC 6902](https://datatracker.ietf.org/doc/html/rfc6902)
+
+    the paths of the operations are parsed once when the plan is created,
+    the plan can be applied to many documents with different values.
+
+    applying a plan does not copy the whole document like jsonpatch does, only the
+    containers along the modified paths are copied, all other containers are shared
+    between the given and the patched document. the patched document must therefore
+    be treated as read-only, as must the given one.
+
+    errors are reported with the exceptions of jsonpatch and jsonpointer.
+    """
+
+    def __init__(self, operations: Iterable[dict[str, Any]]):
+        self.operations: list[_Operation] = []
+        for operation in operations:
+            try:
+                op = operation["op"]
+                path = operation["path"]
+            except KeyError as e:
+                raise InvalidJsonPatch(f"Operation does not contain '{e.args[0]}' member") from None
+            if op not in _operations_with_value + _operations_with_from + ("remove",):
+                raise InvalidJsonPatch(f"Unknown operation {op!r}")
+            from_ = None
+            if op in _operations_with_from:
+                if "from" not in operation:
+                    raise InvalidJsonPatch("The operation does not contain a 'from' member")
+                from_ = _parse_pointer(operation["from"])
+            if op in _operations_with_value and "value" not in operation:
+                raise InvalidJsonPatch("The operation does not contain a 'value' member")
+            path = _parse_pointer(path)
+            if op in ("replace", "remove", "test") and path[-1:] == ("-",):
+                raise InvalidJsonPatch(f"'path' with '-' can't be applied to '{op}' operation")
+            self.operations.append(_Operation(op, path, from_, operation.get("value")))
+        # fields by model class and member, resolved on the first apply_to_model
+        self._fields: dict[tuple[type, str], str] = {}
+
+    @staticmethod
+    def key(operations: Iterable[dict[str, Any]]) -> tuple:
+        """
+        returns a hashable key describing the structure of a patch (operations and paths, without values),
+        patches with the same key can be applied with the same plan
+        """
+        return tuple((o.get("op"), o.get("path"), o.get("from")) for o in operations)
+
+    @staticmethod
+    def values(operations: Iterable[dict[str, Any]]) -> list[Any]:
+        """returns the values of a patch in the order expected by apply"""
+        return [o.get("value") for o in operations]
+
+    @classmethod
+    def prefixed(cls, operations: Iterable[dict[str, Any]], prefix: str) -> list[dict[str, Any]]:
+        """returns the operations with their paths moved below the member `prefix` of the document"""
+        prefix = "/" + escape(prefix)
+        result = []
+        for operation in operations:
+            operation = dict(operation)
+            operation["path"] = prefix + operation["path"]
+            if "from" in operation:
+                operation["from"] = prefix + operation["from"]
+            result.append(operation)
+        return result
+
+    def apply(self, doc: Any, values: list[Any] | None = None) -> Any:
+        """
+        applies the plan to a document and returns the patched document
+
+        :param values: values for the operations in the order of the operations,
+            the values the plan was created with are used if not given
+        """
+        owned: set[int] = set()
+        for index, operation in enumerate(self.operations):
+            value = operation.value if values is None else values[index]
+            doc = getattr(self, "_" + operation.op)(doc, operation, value, owned)
+        return doc
+
+    def apply_to_model(self, model: BaseModel, values: list[Any] | None = None, owned: set[int] | None = None) -> BaseModel:
+        """
+        applies the plan to a validated pydantic model instead of its json document
+        and returns the patched model.
+
+        only the values touched by the plan are validated, against the model field they are
+        assigned to (using pydantic's validate_assignment). the models and containers along the
+        modified paths are copied, all other nested models are shared with the given model,
+        the same read-only rules as for apply hold.
+
+        supports add, replace and remove operations below model fields. raises
+        UnsupportedModelPatch for everything else (e.g. removing a model field, move, copy, test).
+
+        :param owned: ids of models and containers that were copied by the caller and may be changed
+        """
+        owned = set() if owned is None else owned
+        for index, operation in enumerate(self.operations):
+            value = operation.value if values is None else values[index]
+            model = self._patch_model(model, operation, value, owned)
+        return model
+
+    def _patch_model(self, root: BaseModel, operation: _Operation, value: Any, owned: set[int]) -> BaseModel:
+        path = operation.path
+        if operation.op not in ("add", "replace", "remove") or not path:
+            raise UnsupportedModelPatch(f"{operation.op} {path} can not be applied to a model")
+
+        # nodes[i] holds the member path[i]
+        nodes = [root]
+        for token in path[:-1]:
+            node = nodes[-1]
+            if isinstance(node, BaseModel):
+                nodes.append(node.__dict__[self._model_field(node, token)])
+            else:
+                nodes.append(_child(node, token))
+
+        # the deepest model on the path validates the new value of its field
+        depth = max(i for i, node in enumerate(nodes) if isinstance(node, BaseModel))
+        model = nodes[depth]
+        field = self._model_field(model, path[depth])
+        if depth == len(path) - 1:
+            if operation.op == "remove":
+                raise UnsupportedModelPatch(f"can not remove the field {field!r}")
+            if field != path[depth]:
+                raise UnsupportedModelPatch(f"can not replace {path[depth]!r} stored in the field {field!r}")
+            field_value = value
+        else:
+            suboperation = _Operation(operation.op, path[depth + 1:], None, None)
+            field_value = getattr(self, "_" + operation.op)(model.__dict__[field], suboperation, value, owned)
+
+        child = self._own_model(model, owned)
+        type(child).__pydantic_validator__.validate_assignment(child, field, field_value)
+
+        # copy the nodes above the validated model and link the copies
+        for node, token in zip(reversed(nodes[:depth]), reversed(path[:depth])):
+            if isinstance(node, BaseModel):
+                node = self._own_model(node, owned)
+                node.__dict__[self._model_field(node, token)] = child
+            else:
+                node = self._own(node, owned)
+                node[int(token) if isinstance(node, list) else token] = child
+            child = node
+        return child
+
+    # helpers
+
+    def _model_field(self, model: BaseModel, token: str) -> str:
+        """the field of the model holding the member `token`, see _model_field"""
+        try:
+            field = self._fields[type(model), token]
+        except KeyError:
+            field = self._fields[type(model), token] = _model_field(type(model), token)
+        if field != token and getattr(model, token, None) is None:
+            # e.g. the pass information of another pass type
+            raise UnsupportedModelPatch(f"{type(model).__name__} has no member {token!r}")
+        return field
+
+    @staticmethod
+    def _own_model(model: BaseModel, owned: set[int]) -> BaseModel:
+        """returns a copy of the model that may be changed by this apply"""
+        if id(model) in owned:
+            return model
+        model = model.model_copy()
+        owned.add(id(model))
+        return model
+
+    @staticmethod
+    def _own(container: Any, owned: set[int]) -> Any:
+        """returns a copy of the container that may be changed by this apply"""
+        if id(container) in owned:
+            return container
+        if isinstance(container, (dict, list)):
+            container = type(container)(container)
+        else:
+            return container
+        owned.add(id(container))
+        return container
+
+    def _parent(self, doc: Any, path: tuple[str, ...], owned: set[int]) -> tuple[Any, Any]:
+        """
+        copies the containers along the path and returns the (copied) document
+        and the (copied) container holding the last member of the path
+        """
+        doc = self._own(doc, owned)
+        container = doc
+        for token in path[:-1]:
+            child = self._own(_child(container, token), owned)
+            if isinstance(container, list):
+                container[int(token)] = child
+            else:
+                container[token] = child
+            container = child
+        if not isinstance(container, (dict, list)):
+            raise JsonPointerException(
+                f"Document '{type(container)}' does not support indexing, must be mapping/sequence"
+            )
+        return doc, container
+
+    @staticmethod
+    def _get(doc: Any, path: tuple[str, ...]) -> Any:
+        for token in path:
+            doc = _child(doc, token)
+        return doc
+
+    # operations
+
+    def _add(self, doc, operation, value, owned):
+        if not operation.path:
+            return value
+        doc, parent = self._parent(doc, operation.path, owned)
+        token = operation.path[-1]
+        if isinstance(parent, dict):
+            parent[token] = value
+        else:
+            index = _index(parent, token, allow_end=True)
+            if index > len(parent):
+                raise JsonPatchConflict("can't insert outside of list")
+            parent.insert(index, value)
+        return doc
+
+    def _remove(self, doc, operation, value, owned):
+        if not operation.path:
+            raise JsonPatchConflict("can't remove the whole document")
+        doc, parent = self._parent(doc, operation.path, owned)
+        token = operation.path[-1]
+        if isinstance(parent, dict):
+            if token not in parent:
+                raise JsonPatchConflict(f"can't remove a non-existent object '{token}'")
+            del parent[token]
+        else:
+            index = _index(parent, token)
+            if index >= len(parent):
+                raise JsonPatchConflict("can't remove a non-existent object")
+            del parent[index]
+        return doc
+
+    def _replace(self, doc, operation, value, owned):
+        if not operation.path:
+            return value
+        doc, parent = self._parent(doc, operation.path, owned)
+        token = operation.path[-1]
+        if isinstance(parent, dict):
+            if token not in parent:
+                raise JsonPatchConflict(f"can't replace a non-existent object '{token}'")
+            parent[token] = value
+        else:
+            index = _index(parent, token)
+            if index >= len(parent):
+                raise JsonPatchConflict("can't replace outside of list")
+            parent[index] = value
+        return doc
+
+    def _move(self, doc, operation, value, owned):
+        if operation.path[: len(operation.from_)] == operation.from_ and operation.path != operation.from_:
+            raise JsonPatchConflict("Cannot move values into their own children")
+        moved = self._get(doc, operation.from_)
+        doc = self._remove(doc, _Operation("remove", operation.from_, None, None), None, owned)
+        return self._add(doc, _Operation("add", operation.path, None, None), moved, owned)
+
+    def _copy(self, doc, operation, value, owned):
+        copied = copy.deepcopy(self._get(doc, operation.from_))
+        return self._add(doc, _Operation("add", operation.path, None, None), copied, owned)
+
+    def _test(self, doc, operation, value, owned):
+        actual = self._get(doc, operation.path)
+        if actual != value:
+            raise JsonPatchTestFailed(
+                f"{actual} ({type(actual)}) is not equal to tested value {value} ({type(value)})"
+            )
+        return doc
@@ -0,0 +1,273 @@
+import asyncio
+import itertools
+import os
+import random
+import ssl
+import time
+import typing
+
+from M2Crypto import X509, m2
+
+from edutap.models_apple.signing import PassSigner
+
+
+PathLike = str | os.PathLike
+
+PRODUCTION = "https://api.push.apple.com"
+"""APNs server for wallet passes, they are always pushed through production"""
+DEVELOPMENT = "https://api.sandbox.push.apple.com"
+
+INVALID_TOKEN_REASONS = frozenset(("BadDeviceToken", "Unregistered", "DeviceTokenNotForTopic"))
+"""reasons of rejected pushes whose token should not be used again"""
+
+RETRY_STATUSES = frozenset((429, 500, 503))
+"""statuses of pushes that are sent again after a backoff"""
+
+
+def _httpx():
+    try:
+        import httpx
+        import h2  # noqa: F401
+    except ImportError as e:
+        raise ImportError("sending push notifications needs httpx[http2], install edutap.models_apple[push]") from e
+    return httpx
+
+
+class PushResult(typing.NamedTuple):
+    """outcome of pushing to one device"""
+
+    token: str
+    status: int | None
+    """http status of the last attempt, None if no response was received"""
+    reason: str = ""
+    """reason given by APNs for a rejected push, or the error of the connection"""
+    attempts: int = 1
+    apns_id: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status == 200
+
+    @property
+    def invalid_token(self) -> bool:
+        """the device is not registered (anymore), the token should be removed"""
+        return self.status == 410 or self.reason in INVALID_TOKEN_REASONS
+
+
+class PushReport:
+    """counts the results of sending many pushes"""
+
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.invalid_tokens: list[str] = []
+        """tokens rejected as invalid or unregistered"""
+        self.failures: list[PushResult] = []
+        """results of the other rejected pushes"""
+        self.started = time.perf_counter()
+        self.finished: float | None = None
+
+    def add(self, result: PushResult):
+        self.retries += result.attempts - 1
+        if result.ok:
+            self.sent += 1
+            return
+        self.failed += 1
+        if result.invalid_token:
+            self.invalid_tokens.append(result.token)
+        else:
+            self.failures.append(result)
+
+    @property
+    def elapsed(self) -> float:
+        """seconds since sending started, until it finished"""
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def pushes_per_second(self) -> float:
+        return (self.sent + self.failed) / self.elapsed if self.elapsed else 0.0
+
+
+class PushSender:
+    """
+    sends the update notifications of wallet passes to APNs.
+
+    pushes are sent over `connections` persistent HTTP/2 connections, each one carrying
+    up to `streams` concurrent requests. the connections are opened on the first push
+    and kept open until the sender is closed, APNs expects them to be reused.
+    rejected pushes with a status in RETRY_STATUSES and failed connections are retried
+    `retries` times with an exponential backoff.
+
+    the client certificate is the one the passes are signed with.
+    needs httpx[http2], which is imported when the sender is created.
+
+    :param signer: the signer of the passes, its certificate, key and password are used
+    :param certificate: path to the certificate, if no signer is given
+    :param key: path to the key, if no signer is given
+    :param password: password of the key, if no signer is given
+    :param topic: the pass type identifier of the passes, read from the certificate by default
+    :param url: the APNs server
+    :param ca_file: certificates the server is verified with, the default trust store if None
+    :param backoff: seconds to wait before the first retry, doubled for every further one
+    """
+
+    def __init__(
+        self,
+        signer: PassSigner | None = None,
+        *,
+        certificate: PathLike | None = None,
+        key: PathLike | None = None,
+        password: str = "",
+        topic: str | None = None,
+        url: str = PRODUCTION,
+        ca_file: PathLike | None = None,
+        connections: int = 1,
+        streams: int = 500,
+        retries: int = 3,
+        backoff: float = 0.5,
+        timeout: float = 30.0,
+    ):
+        self._httpx = _httpx()
+        if signer is not None:
+            certificate, key, password = signer.certificate, signer.key, signer.password
+        if certificate is None or key is None:
+            raise ValueError("a signer or a certificate and a key are required")
+        self.certificate = certificate
+        self.key = key
+        self.password = password
+        self.topic = topic or _pass_type_identifier(certificate)
+        self.url = url.rstrip("/")
+        self.ca_file = ca_file
+        self.connections = connections
+        self.streams = streams
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._clients: list | None = None
+
+    def _ssl_context(self) -> ssl.SSLContext:
+        context = ssl.create_default_context(cafile=str(self.ca_file) if self.ca_file else None)
+        context.load_cert_chain(str(self.certificate), str(self.key), self.password or None)
+        return context
+
+    def _open(self):
+        httpx = self._httpx
+        context = self._ssl_context()
+        # one client per connection, the requests of a client are multiplexed over its connection
+        self._clients = [
+            httpx.AsyncClient(
+                http2=True,
+                verify=context,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=1, max_keepalive_connections=1),
+            )
+            for _ in range(self.connections)
+        ]
+        self._semaphores = [asyncio.Semaphore(self.streams) for _ in self._clients]
+        self._next = itertools.cycle(range(self.connections))
+
+    async def aclose(self):
+        """closes the connections"""
+        clients, self._clients = self._clients, None
+        for client in clients or ():
+            await client.aclose()
+
+    async def __aenter__(self) -> "PushSender":
+        if self._clients is None:
+            self._open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    async def send(self, token: str) -> PushResult:
+        """
+        notifies the device with the push token that its passes changed.
+        the device asks the web service of the passes for the changes.
+        """
+        if self._clients is None:
+            self._open()
+        httpx = self._httpx
+        headers = {"apns-topic": self.topic}
+        status, reason, apns_id = None, "", None
+        for attempt in range(1, self.retries + 2):
+            index = next(self._next)
+            async with self._semaphores[index]:
+                try:
+                    response = await self._clients[index].post(
+                        f"{self.url}/3/device/{token}", content=b"{}", headers=headers
+                    )
+                except httpx.TransportError as e:
+                    status, reason, apns_id = None, f"{type(e).__name__}: {e}", None
+                else:
+                    status, apns_id = response.status_code, response.headers.get("apns-id")
+                    reason = "" if status == 200 else _reason(response)
+                    if status not in RETRY_STATUSES:
+                        return PushResult(token, status, reason, attempt, apns_id)
+            if attempt <= self.retries:
+                # exponential backoff with jitter, so retried pushes do not arrive all at once
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.0))
+        return PushResult(token, status, reason, self.retries + 1, apns_id)
+
+    async def send_many(
+        self,
+        tokens: typing.Iterable[str],
+        *,
+        window: int | None = None,
+        report: PushReport | None = None,
+    ) -> PushReport:
+        """
+        notifies many devices concurrently.
+
+        tokens is consumed lazily, at most `window` pushes are pending at any time,
+        by default enough to fill all streams of all connections twice.
+
+        :return: the report of the pushes, with the invalid tokens
+        """
+        if self._clients is None:
+            self._open()
+        report = report if report is not None else PushReport()
+        window = window or 2 * self.connections * self.streams
+        tokens = iter(tokens)
+        pending = set()
+        try:
+            while True:
+                for token in itertools.islice(tokens, window - len(pending)):
+                    pending.add(asyncio.ensure_future(self.send(token)))
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    report.add(task.result())
+        finally:
+            for task in pending:
+                task.cancel()
+            report.finished = time.perf_counter()
+        return report
+
+    def send_all(self, tokens: typing.Iterable[str], **kwargs) -> PushReport:
+        """notifies many devices from synchronous code, takes the arguments of send_many"""
+
+        async def send_all():
+            async with self:
+                return await self.send_many(tokens, **kwargs)
+
+        return asyncio.run(send_all())
+
+
+def _reason(response) -> str:
+    try:
+        return response.json().get("reason", "")
+    except ValueError:
+        return response.text
+
+
+def _pass_type_identifier(certificate: PathLike) -> str:
+    """the pass type identifier is the user id in the subject of a pass certificate"""
+    # the subject belongs to the certificate, which must be referenced while it is used
+    x509 = X509.load_cert(str(certificate))
+    entries = x509.get_subject().get_entries_by_nid(m2.obj_txt2nid("UID"))
+    if not entries:
+        raise ValueError(f"{certificate} has no pass type identifier, pass the topic")
+    return entries[0].get_data().as_text()
@@ -0,0 +1,140 @@
+import copy
+import hashlib
+import io
+import json
+import os
+import sys
+import typing
+import zipfile
+
+from edutap.models_apple.compression import DEFAULT_COMPRESSION, CompressionPolicy
+from edutap.models_apple.hashing import Attachment, hash_attachments
+from edutap.models_apple.instrumentation import stage
+from edutap.models_apple.models import Pass, _position, _write_entry
+from edutap.models_apple.passfile import META_FILES, PassFile
+from edutap.models_apple.signing import PassSigner, SignerRegistry, resolve_signer
+
+
+def rebuild_pkpass(
+    pass_object: Pass,
+    previous: PassFile | bytes | str | os.PathLike,
+    certificate: str | None = None,
+    key: str | None = None,
+    wwdr_certificate: str | None = None,
+    password: str | None = None,
+    zip_file: typing.BinaryIO | None = None,
+    *,
+    signer: PassSigner | SignerRegistry | None = None,
+    compression: CompressionPolicy = DEFAULT_COMPRESSION,
+) -> io.BytesIO:
+    """
+    creates the .pkpass file of a changed pass from the .pkpass file built before.
+
+    the attachments are taken from the previous file: if the pass has no files, all attachments
+    of the previous file are kept, otherwise the files of the pass are compared with the
+    manifest of the previous file. unchanged attachments are copied as stored (compressed)
+    without being read, hashed or compressed again, changed and new ones are written.
+    only pass.json is serialized and hashed again, the manifest is updated and signed.
+
+    :param previous: the previous .pkpass file, as PassFile, content or path.
+        it is expected to be valid, its manifest is not checked
+    the other arguments are those of Pass.create
+    """
+    if isinstance(previous, PassFile):
+        return _rebuild(
+            pass_object, previous, certificate, key, wwdr_certificate, password, zip_file, signer, compression
+        )
+    with PassFile(previous) as reader:
+        return _rebuild(
+            pass_object, reader, certificate, key, wwdr_certificate, password, zip_file, signer, compression
+        )
+
+
+def _rebuild(
+    pass_object: Pass,
+    previous: PassFile,
+    certificate,
+    key,
+    wwdr_certificate,
+    password,
+    zip_file,
+    signer,
+    compression: CompressionPolicy,
+) -> io.BytesIO:
+    with stage("rebuild") as measurement:
+        signer = resolve_signer(pass_object, signer, certificate, key, wwdr_certificate, password)
+        old_manifest = previous.manifest
+        pass_json = pass_object._serialize()
+        hashes = {"pass.json": hashlib.sha1(pass_json).hexdigest()}
+
+        # (name, None) is copied from the previous file, (name, data) is written
+        attachments: list[tuple[str, Attachment | None]] = []
+        if pass_object.files:
+            digests = hash_attachments(pass_object.files)
+            for name, data in pass_object.files.items():
+                digest = digests[name]
+                hashes[name] = digest
+                unchanged = old_manifest.get(name) == digest and name in previous.attachments
+                attachments.append((name, None if unchanged else data))
+        else:
+            for name in previous.attachments:
+                hashes[name] = old_manifest[name]
+                attachments.append((name, None))
+
+        manifest = json.dumps(hashes)
+        signature = pass_object._createSignature(manifest, signer=signer)
+
+        if not zip_file:
+            zip_file = io.BytesIO()
+        with zipfile.ZipFile(zip_file, "w") as zf:
+            for name, data in (("signature", signature), ("manifest.json", manifest), ("pass.json", pass_json)):
+                zf.writestr(name, data, compress_type=compression.method(name), compresslevel=compression.level)
+            for name, data in attachments:
+                if data is None:
+                    _copy_entry(zf, previous, name)
+                else:
+                    _write_entry(zf, name, data, compression.method(name), compression.level)
+        measurement.attachments = len(attachments)
+        measurement.bytes_out = _position(zip_file)
+    return zip_file
+
+
+# copying the compressed data of an entry as it is relies on internals of zipfile.ZipFile
+# opened for writing, unchanged up to python 3.13: fp (the archive file), filelist and
+# NameToInfo (the entries written to the central directory on close), start_dir (the
+# offset of the central directory), _writing (an entry is being written with open)
+# and ZipInfo.FileHeader() (the local file header of an entry).
+_RAW_COPY = sys.version_info < (3, 14) and hasattr(zipfile.ZipInfo, "FileHeader")
+
+
+def _can_copy_raw(zf: zipfile.ZipFile) -> bool:
+    return (
+        _RAW_COPY
+        and all(hasattr(zf, name) for name in ("fp", "filelist", "NameToInfo", "start_dir"))
+        and not getattr(zf, "_writing", False)
+    )
+
+
+def _copy_entry(zf: zipfile.ZipFile, previous: PassFile, name: str):
+    """
+    appends an attachment of the previous file to an archive opened for writing.
+    the compressed data is copied as it is where the internals of zipfile allow it,
+    otherwise the attachment is decompressed and compressed again with the same method
+    """
+    if name in META_FILES:
+        raise ValueError(f"{name} can not be copied")
+    if not _can_copy_raw(zf):
+        info = previous.zipfile.getinfo(name)
+        zf.writestr(copy.copy(info), previous.attachments[name], compress_type=info.compress_type)
+        return
+    info, data = previous.read_raw(name)
+    info = copy.copy(info)
+    # sizes and crc are known, they go into the local header instead of a data descriptor
+    info.flag_bits &= ~0x08
+    info.header_offset = zf.fp.tell()
+    zf.fp.write(info.FileHeader())
+    zf.fp.write(data)
+    zf.filelist.append(info)
+    zf.NameToInfo[info.filename] = info
+    # the next entry and the central directory are written behind the copied data
+    zf.start_dir = zf.fp.tell()
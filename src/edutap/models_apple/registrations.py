@@ -0,0 +1,305 @@
+import bisect
+import sqlite3
+import threading
+import typing
+
+
+class Registration(typing.NamedTuple):
+    """a device registered for the updates of a pass, see Pass.webServiceURL"""
+
+    device_library_identifier: str
+    pass_type_identifier: str
+    serial_number: str
+    push_token: str
+
+
+class RegistrationStore(typing.Protocol):
+    """
+    device registrations of the web service protocol of wallet passes, see
+    https://developer.apple.com/documentation/walletpasses/adding_a_web_service_to_update_passes
+
+    every pass has an update tag, increased by `touch` when the pass changes. tags are
+    taken from one counter per store, a pass touched later has a higher tag than all passes
+    touched before. passes never touched have tag 0.
+    """
+
+    def register(self, registration: Registration) -> bool:
+        """
+        registers a device for a pass or updates the push token of the registration
+
+        :return: True if the registration is new
+        """
+
+    def register_many(self, registrations: typing.Iterable[Registration]) -> None:
+        """registers many devices at once"""
+
+    def unregister(self, device_library_identifier: str, pass_type_identifier: str, serial_number: str) -> bool:
+        """
+        removes a registration
+
+        :return: True if the registration existed
+        """
+
+    def touch(self, pass_type_identifier: str, serial_number: str) -> int:
+        """marks a pass as updated and returns its new tag"""
+
+    def tag(self, pass_type_identifier: str, serial_number: str) -> int:
+        """the update tag of a pass"""
+
+    def updated_since(
+        self, device_library_identifier: str, pass_type_identifier: str, tag: int | None = None
+    ) -> tuple[list[str], int]:
+        """
+        the serial numbers of the passes of a device updated after `tag`, all its passes if None
+
+        :return: the serial numbers and the highest tag of them, `tag` (or 0) if there are none
+        """
+
+    def registrations(self, pass_type_identifier: str, serial_number: str) -> list[Registration]:
+        """the registrations of a pass"""
+
+    def push_tokens(self, pass_type_identifier: str, serial_number: str) -> list[str]:
+        """the push tokens of the devices registered for a pass"""
+
+    def __len__(self) -> int:
+        """number of registrations"""
+
+
+class InMemoryRegistrationStore:
+    """
+    RegistrationStore in dicts, for tests and single processes.
+
+    the passes of a device are kept sorted by their tag, the passes updated since a tag
+    are found by bisection. touching a pass moves it to the end of the lists of the
+    devices registered for it.
+    """
+
+    def __init__(self):
+        # (device, pass type) -> {serial number: registration}
+        self._by_device: dict[tuple[str, str], dict[str, Registration]] = {}
+        # (device, pass type) -> [(tag, serial number)] sorted
+        self._device_tags: dict[tuple[str, str], list[tuple[int, str]]] = {}
+        # (pass type, serial number) -> {device: registration}
+        self._by_pass: dict[tuple[str, str], dict[str, Registration]] = {}
+        self._tags: dict[tuple[str, str], int] = {}
+        self._last_tag = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def _register(self, registration: Registration) -> bool:
+        device = registration.device_library_identifier, registration.pass_type_identifier
+        pass_ = registration.pass_type_identifier, registration.serial_number
+        passes = self._by_device.setdefault(device, {})
+        new = registration.serial_number not in passes
+        passes[registration.serial_number] = registration
+        self._by_pass.setdefault(pass_, {})[registration.device_library_identifier] = registration
+        if new:
+            self._count += 1
+            bisect.insort(self._device_tags.setdefault(device, []), (self._tags.get(pass_, 0), registration.serial_number))
+        return new
+
+    def register(self, registration: Registration) -> bool:
+        with self._lock:
+            return self._register(registration)
+
+    def register_many(self, registrations: typing.Iterable[Registration]):
+        with self._lock:
+            for registration in registrations:
+                self._register(registration)
+
+    def unregister(self, device_library_identifier: str, pass_type_identifier: str, serial_number: str) -> bool:
+        device = device_library_identifier, pass_type_identifier
+        pass_ = pass_type_identifier, serial_number
+        with self._lock:
+            passes = self._by_device.get(device, {})
+            if passes.pop(serial_number, None) is None:
+                return False
+            if not passes:
+                del self._by_device[device]
+            tags = self._device_tags[device]
+            del tags[bisect.bisect_left(tags, (self._tags.get(pass_, 0), serial_number))]
+            if not tags:
+                del self._device_tags[device]
+            devices = self._by_pass[pass_]
+            del devices[device_library_identifier]
+            if not devices:
+                del self._by_pass[pass_]
+            self._count -= 1
+            return True
+
+    def touch(self, pass_type_identifier: str, serial_number: str) -> int:
+        pass_ = pass_type_identifier, serial_number
+        with self._lock:
+            old = self._tags.get(pass_, 0)
+            self._last_tag += 1
+            self._tags[pass_] = self._last_tag
+            for device in self._by_pass.get(pass_, {}):
+                tags = self._device_tags[device, pass_type_identifier]
+                del tags[bisect.bisect_left(tags, (old, serial_number))]
+                # the new tag is the highest one
+                tags.append((self._last_tag, serial_number))
+            return self._last_tag
+
+    def tag(self, pass_type_identifier: str, serial_number: str) -> int:
+        return self._tags.get((pass_type_identifier, serial_number), 0)
+
+    def updated_since(
+        self, device_library_identifier: str, pass_type_identifier: str, tag: int | None = None
+    ) -> tuple[list[str], int]:
+        with self._lock:
+            tags = self._device_tags.get((device_library_identifier, pass_type_identifier), [])
+            start = 0 if tag is None else bisect.bisect_right(tags, tag, key=lambda entry: entry[0])
+            updated = tags[start:]
+        if not updated:
+            return [], tag or 0
+        return [serial_number for _, serial_number in updated], updated[-1][0]
+
+    def registrations(self, pass_type_identifier: str, serial_number: str) -> list[Registration]:
+        with self._lock:
+            return list(self._by_pass.get((pass_type_identifier, serial_number), {}).values())
+
+    def push_tokens(self, pass_type_identifier: str, serial_number: str) -> list[str]:
+        return list(dict.fromkeys(r.push_token for r in self.registrations(pass_type_identifier, serial_number)))
+
+    def __len__(self) -> int:
+        return self._count
+
+
+class SQLiteRegistrationStore:
+    """
+    RegistrationStore in a SQLite database, shared by the processes using the same file.
+
+    the tag of a pass is copied into its registrations, so the passes of a device updated
+    since a tag are a range of the index on (device, pass type, tag).
+    touching a pass updates its registrations through the index on (pass type, serial number).
+
+    :param path: path of the database file, ":memory:" for a private in-memory database
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            # readers do not block the writer, a commit does not wait for the disk
+            self._connection.execute("PRAGMA journal_mode = WAL")
+            self._connection.execute("PRAGMA synchronous = NORMAL")
+            self._connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS registrations (
+                    device_library_identifier TEXT NOT NULL,
+                    pass_type_identifier TEXT NOT NULL,
+                    serial_number TEXT NOT NULL,
+                    push_token TEXT NOT NULL,
+                    tag INTEGER NOT NULL,
+                    PRIMARY KEY (device_library_identifier, pass_type_identifier, serial_number)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS registrations_device_tag
+                    ON registrations (device_library_identifier, pass_type_identifier, tag);
+                CREATE INDEX IF NOT EXISTS registrations_pass
+                    ON registrations (pass_type_identifier, serial_number);
+                CREATE TABLE IF NOT EXISTS pass_tags (
+                    pass_type_identifier TEXT NOT NULL,
+                    serial_number TEXT NOT NULL,
+                    tag INTEGER NOT NULL,
+                    PRIMARY KEY (pass_type_identifier, serial_number)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS pass_tags_tag ON pass_tags (tag);
+                """
+            )
+
+    def _transaction(self, function, *args):
+        # BEGIN IMMEDIATE takes the write lock at once, so tags are counted by one writer at a time
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                result = function(self._connection, *args)
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+            return result
+
+    _REGISTER = """
+        INSERT INTO registrations VALUES (?, ?, ?, ?, coalesce(
+            (SELECT tag FROM pass_tags WHERE pass_type_identifier = ?2 AND serial_number = ?3), 0))
+        ON CONFLICT DO UPDATE SET push_token = excluded.push_token
+    """
+
+    def register(self, registration: Registration) -> bool:
+        def register(connection):
+            exists = connection.execute(
+                "SELECT 1 FROM registrations WHERE device_library_identifier = ? AND pass_type_identifier = ? AND serial_number = ?",
+                registration[:3],
+            ).fetchone()
+            connection.execute(self._REGISTER, registration)
+            return exists is None
+
+        return self._transaction(register)
+
+    def register_many(self, registrations: typing.Iterable[Registration]):
+        self._transaction(lambda connection: connection.executemany(self._REGISTER, registrations))
+
+    def unregister(self, device_library_identifier: str, pass_type_identifier: str, serial_number: str) -> bool:
+        with self._lock:
+            cursor = self._connection.execute(
+                "DELETE FROM registrations WHERE device_library_identifier = ? AND pass_type_identifier = ? AND serial_number = ?",
+                (device_library_identifier, pass_type_identifier, serial_number),
+            )
+        return cursor.rowcount > 0
+
+    def touch(self, pass_type_identifier: str, serial_number: str) -> int:
+        def touch(connection):
+            # the highest tag is the last entry of the index on tag
+            tag = connection.execute("SELECT coalesce(max(tag), 0) + 1 FROM pass_tags").fetchone()[0]
+            connection.execute(
+                "INSERT INTO pass_tags VALUES (?, ?, ?) ON CONFLICT DO UPDATE SET tag = excluded.tag",
+                (pass_type_identifier, serial_number, tag),
+            )
+            connection.execute(
+                "UPDATE registrations SET tag = ? WHERE pass_type_identifier = ? AND serial_number = ?",
+                (tag, pass_type_identifier, serial_number),
+            )
+            return tag
+
+        return self._transaction(touch)
+
+    def tag(self, pass_type_identifier: str, serial_number: str) -> int:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT tag FROM pass_tags WHERE pass_type_identifier = ? AND serial_number = ?",
+                (pass_type_identifier, serial_number),
+            ).fetchone()
+        return row[0] if row else 0
+
+    def updated_since(
+        self, device_library_identifier: str, pass_type_identifier: str, tag: int | None = None
+    ) -> tuple[list[str], int]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT serial_number, tag FROM registrations"
+                " WHERE device_library_identifier = ? AND pass_type_identifier = ? AND tag > ? ORDER BY tag",
+                (device_library_identifier, pass_type_identifier, -1 if tag is None else tag),
+            ).fetchall()
+        if not rows:
+            return [], tag or 0
+        return [serial_number for serial_number, _ in rows], rows[-1][1]
+
+    def registrations(self, pass_type_identifier: str, serial_number: str) -> list[Registration]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT device_library_identifier, pass_type_identifier, serial_number, push_token FROM registrations"
+                " WHERE pass_type_identifier = ? AND serial_number = ?",
+                (pass_type_identifier, serial_number),
+            ).fetchall()
+        return [Registration(*row) for row in rows]
+
+    def push_tokens(self, pass_type_identifier: str, serial_number: str) -> list[str]:
+        return list(dict.fromkeys(r.push_token for r in self.registrations(pass_type_identifier, serial_number)))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT count(*) FROM registrations").fetchone()[0]
+
+    def close(self):
+        self._connection.close()
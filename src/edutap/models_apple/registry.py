@@ -0,0 +1,401 @@
+import bisect
+from collections import OrderedDict
+from datetime import datetime, timezone
+import json
+import sqlite3
+import threading
+import typing
+import uuid
+
+from edutap.models_apple.models import Pass
+from edutap.models_apple.template import CompiledPassTemplate, PassTemplate, PassTemplateBase
+
+
+def _aware(timestamp: datetime) -> datetime:
+    """rejects naive timestamps, they can not be ordered with the aware timestamps of the templates"""
+    if timestamp.tzinfo is None or timestamp.utcoffset() is None:
+        raise ValueError(f"timestamp {timestamp} has no time zone, e.g. use datetime.now(timezone.utc)")
+    return timestamp
+
+
+class TemplateStore(typing.Protocol):
+    """
+    backing store of a TemplateRegistry, holds all versions of the templates.
+
+    templates are stored historically: every update is a new template with a new id,
+    the same template_identifier and a later timestamp.
+    (template_identifier, timestamp) is unique. timestamps have a time zone, lookups
+    with naive timestamps raise ValueError.
+    the backoffice_identifier of a template_identifier may change between versions,
+    it refers to the latest version having it.
+    """
+
+    def add(self, template: PassTemplateBase) -> None:
+        """stores a new version, raises ValueError if (template_identifier, timestamp) exists"""
+
+    def get(self, id: uuid.UUID) -> PassTemplateBase | None:
+        """the version with the id"""
+
+    def latest(self, template_identifier: str) -> PassTemplateBase | None:
+        """the version with the latest timestamp"""
+
+    def version(self, template_identifier: str, timestamp: datetime) -> PassTemplateBase | None:
+        """the version with exactly this timestamp"""
+
+    def as_of(self, template_identifier: str, timestamp: datetime) -> PassTemplateBase | None:
+        """the version in effect at `timestamp`, the latest one not newer than it"""
+
+    def by_backoffice_identifier(self, backoffice_identifier: str) -> PassTemplateBase | None:
+        """the latest version with the backoffice identifier"""
+
+    def versions(self, template_identifier: str) -> list[PassTemplateBase]:
+        """all versions, oldest first"""
+
+
+class InMemoryTemplateStore:
+    """
+    TemplateStore keeping the templates in dicts, for tests and single processes.
+    the versions of a template are kept sorted by timestamp, the latest one is the last.
+    """
+
+    def __init__(self):
+        self._by_id: dict[uuid.UUID, PassTemplateBase] = {}
+        self._versions: dict[str, list[PassTemplateBase]] = {}
+        self._timestamps: dict[str, list[datetime]] = {}
+        self._by_version: dict[tuple[str, datetime], PassTemplateBase] = {}
+        self._by_backoffice_identifier: dict[str, PassTemplateBase] = {}
+        self._lock = threading.Lock()
+
+    def add(self, template: PassTemplateBase):
+        key = (template.template_identifier, _aware(template.timestamp))
+        with self._lock:
+            if key in self._by_version:
+                raise ValueError(f"template {key[0]!r} has a version of {key[1]} already")
+            if template.id in self._by_id:
+                raise ValueError(f"template {template.id} exists already")
+            timestamps = self._timestamps.setdefault(template.template_identifier, [])
+            position = bisect.bisect(timestamps, template.timestamp)
+            timestamps.insert(position, template.timestamp)
+            self._versions.setdefault(template.template_identifier, []).insert(position, template)
+            self._by_id[template.id] = template
+            self._by_version[key] = template
+            current = self._by_backoffice_identifier.get(template.backoffice_identifier)
+            if current is None or current.timestamp <= template.timestamp:
+                self._by_backoffice_identifier[template.backoffice_identifier] = template
+
+    def get(self, id: uuid.UUID) -> PassTemplateBase | None:
+        return self._by_id.get(id)
+
+    def latest(self, template_identifier: str) -> PassTemplateBase | None:
+        versions = self._versions.get(template_identifier)
+        return versions[-1] if versions else None
+
+    def version(self, template_identifier: str, timestamp: datetime) -> PassTemplateBase | None:
+        return self._by_version.get((template_identifier, _aware(timestamp)))
+
+    def as_of(self, template_identifier: str, timestamp: datetime) -> PassTemplateBase | None:
+        with self._lock:
+            timestamps = self._timestamps.get(template_identifier, [])
+            position = bisect.bisect(timestamps, _aware(timestamp))
+            return self._versions[template_identifier][position - 1] if position else None
+
+    def by_backoffice_identifier(self, backoffice_identifier: str) -> PassTemplateBase | None:
+        return self._by_backoffice_identifier.get(backoffice_identifier)
+
+    def versions(self, template_identifier: str) -> list[PassTemplateBase]:
+        with self._lock:
+            return list(self._versions.get(template_identifier, ()))
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+
+class SQLiteTemplateStore:
+    """
+    TemplateStore in a SQLite database, shared by the processes using the same file.
+    the templates are stored as json, the identifiers and the timestamp in indexed columns.
+
+    :param path: path of the database file, ":memory:" for a private in-memory database
+    :param template_class: the class the templates are loaded as
+    """
+
+    def __init__(self, path: str = ":memory:", template_class: type[PassTemplateBase] = PassTemplate):
+        self.path = path
+        self.template_class = template_class
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS templates (
+                    id TEXT PRIMARY KEY,
+                    template_identifier TEXT NOT NULL,
+                    backoffice_identifier TEXT NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    UNIQUE (template_identifier, timestamp)
+                );
+                CREATE INDEX IF NOT EXISTS templates_backoffice_identifier
+                    ON templates (backoffice_identifier, timestamp);
+                """
+            )
+
+    @staticmethod
+    def _timestamp(timestamp: datetime) -> str:
+        # fixed width and in UTC, so the text sorts like the timestamps
+        return _aware(timestamp).astimezone(timezone.utc).isoformat(timespec="microseconds")
+
+    def _one(self, query: str, *parameters) -> PassTemplateBase | None:
+        with self._lock:
+            row = self._connection.execute(query, parameters).fetchone()
+        return self.template_class.model_validate_json(row[0]) if row else None
+
+    def add(self, template: PassTemplateBase):
+        try:
+            with self._lock, self._connection:
+                self._connection.execute(
+                    "INSERT INTO templates VALUES (?, ?, ?, ?, ?)",
+                    (
+                        str(template.id),
+                        template.template_identifier,
+                        template.backoffice_identifier,
+                        self._timestamp(template.timestamp),
+                        template.model_dump_json(),
+                    ),
+                )
+        except sqlite3.IntegrityError as e:
+            raise ValueError(
+                f"template {template.template_identifier!r} version {template.timestamp} ({template.id}) exists already"
+            ) from e
+
+    def get(self, id: uuid.UUID) -> PassTemplateBase | None:
+        return self._one("SELECT data FROM templates WHERE id = ?", str(id))
+
+    def latest(self, template_identifier: str) -> PassTemplateBase | None:
+        return self._one(
+            "SELECT data FROM templates WHERE template_identifier = ? ORDER BY timestamp DESC LIMIT 1",
+            template_identifier,
+        )
+
+    def version(self, template_identifier: str, timestamp: datetime) -> PassTemplateBase | None:
+        return self._one(
+            "SELECT data FROM templates WHERE template_identifier = ? AND timestamp = ?",
+            template_identifier,
+            self._timestamp(timestamp),
+        )
+
+    def as_of(self, template_identifier: str, timestamp: datetime) -> PassTemplateBase | None:
+        return self._one(
+            "SELECT data FROM templates WHERE template_identifier = ? AND timestamp <= ? ORDER BY timestamp DESC LIMIT 1",
+            template_identifier,
+            self._timestamp(timestamp),
+        )
+
+    def by_backoffice_identifier(self, backoffice_identifier: str) -> PassTemplateBase | None:
+        return self._one(
+            "SELECT data FROM templates WHERE backoffice_identifier = ? ORDER BY timestamp DESC LIMIT 1",
+            backoffice_identifier,
+        )
+
+    def versions(self, template_identifier: str) -> list[PassTemplateBase]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT data FROM templates WHERE template_identifier = ? ORDER BY timestamp", (template_identifier,)
+            ).fetchall()
+        return [self.template_class.model_validate_json(data) for data, in rows]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT count(*) FROM templates").fetchone()[0]
+
+    def close(self):
+        self._connection.close()
+
+
+class TemplateRegistry:
+    """
+    looks up the versions of pass templates and keeps them compiled for creating passes.
+
+    the latest version of each template_identifier is kept in a dict, so looking it up
+    does not query the store. the ids of the versions looked up by backoffice_identifier
+    or by (template_identifier, timestamp) are kept as well. compiled templates are kept
+    in a least recently used cache of at most `max_bytes` (the size of the attachments and
+    pass.json of the templates), so a template is loaded, validated and compiled once while
+    it is in use, and `compiled` does not query the store for a version it knows the id of.
+
+    versions added to the store by other processes are seen after `invalidate`.
+
+    :param store: the backing store, an InMemoryTemplateStore by default
+    :param max_bytes: maximum size of the compiled templates kept
+    """
+
+    def __init__(self, store: TemplateStore | None = None, *, max_bytes: int = 64 * 1024 * 1024):
+        self.store = store if store is not None else InMemoryTemplateStore()
+        self.max_bytes = max_bytes
+        self.size = 0
+        """size of the compiled templates currently kept"""
+        self.hits = 0
+        self.misses = 0
+        self._latest: dict[str, PassTemplateBase] = {}
+        # ("backoffice_identifier", backoffice_identifier) or ("version", template_identifier, timestamp) -> id
+        self._ids: dict[tuple, uuid.UUID] = {}
+        # template id -> (compiled template, size)
+        self._compiled: OrderedDict[uuid.UUID, tuple[CompiledPassTemplate, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, template: PassTemplateBase):
+        """stores a new version of a template"""
+        self.store.add(template)
+        with self._lock:
+            latest = self._latest.get(template.template_identifier)
+            if latest is not None and latest.timestamp < template.timestamp:
+                self._latest[template.template_identifier] = template
+            # the backoffice identifier may refer to the new version now
+            self._ids.pop(("backoffice_identifier", template.backoffice_identifier), None)
+
+    def invalidate(self, template_identifier: str | None = None):
+        """
+        forgets the latest version of a template (of all templates if None) and the versions
+        found by backoffice identifier, they are looked up again
+        """
+        with self._lock:
+            if template_identifier is None:
+                self._latest.clear()
+            else:
+                self._latest.pop(template_identifier, None)
+            for key in [key for key in self._ids if key[0] == "backoffice_identifier"]:
+                del self._ids[key]
+
+    def latest(self, template_identifier: str) -> PassTemplateBase:
+        """the latest version of a template, raises KeyError if there is none"""
+        template = self._latest.get(template_identifier)
+        if template is None:
+            template = self.store.latest(template_identifier)
+            if template is None:
+                raise KeyError(template_identifier)
+            with self._lock:
+                template = self._latest.setdefault(template_identifier, template)
+        return template
+
+    def get(
+        self,
+        template_identifier: str | None = None,
+        *,
+        backoffice_identifier: str | None = None,
+        timestamp: datetime | None = None,
+        id: uuid.UUID | None = None,
+    ) -> PassTemplateBase:
+        """
+        looks up a version of a template by one of
+        - id
+        - template_identifier: the latest version
+        - template_identifier and timestamp: the version with exactly this timestamp
+        - backoffice_identifier: the latest version having it
+
+        raises KeyError if there is no such version
+        """
+        return self._get(self._key(template_identifier, backoffice_identifier, timestamp, id))
+
+    @staticmethod
+    def _key(
+        template_identifier: str | None,
+        backoffice_identifier: str | None,
+        timestamp: datetime | None,
+        id: uuid.UUID | None,
+    ) -> tuple:
+        if id is not None:
+            return ("id", id)
+        if backoffice_identifier is not None:
+            return ("backoffice_identifier", backoffice_identifier)
+        if template_identifier is None:
+            raise TypeError("template_identifier, backoffice_identifier or id is required")
+        if timestamp is not None:
+            return ("version", template_identifier, _aware(timestamp))
+        return ("latest", template_identifier)
+
+    def _id(self, key: tuple) -> uuid.UUID | None:
+        """the id of the version looked up by the key, if it is known without querying the store"""
+        if key[0] == "id":
+            return key[1]
+        if key[0] == "latest":
+            template = self._latest.get(key[1])
+            return None if template is None else template.id
+        return self._ids.get(key)
+
+    def _get(self, key: tuple) -> PassTemplateBase:
+        kind = key[0]
+        if kind == "latest":
+            return self.latest(key[1])
+        template_id = self._id(key)
+        if template_id is not None:
+            template = self.store.get(template_id)
+        elif kind == "backoffice_identifier":
+            template = self.store.by_backoffice_identifier(key[1])
+        else:
+            template = self.store.version(key[1], key[2])
+        if template is None:
+            raise KeyError(key[1] if len(key) == 2 else key[1:])
+        if kind != "id":
+            with self._lock:
+                self._ids[key] = template.id
+        return template
+
+    def compiled(
+        self,
+        template_identifier: str | None = None,
+        *,
+        backoffice_identifier: str | None = None,
+        timestamp: datetime | None = None,
+        id: uuid.UUID | None = None,
+    ) -> CompiledPassTemplate:
+        """the compiled form of the version looked up like with get"""
+        key = self._key(template_identifier, backoffice_identifier, timestamp, id)
+        # the store is queried only for versions whose id is not known or which are not compiled
+        template = None
+        template_id = self._id(key)
+        if template_id is None:
+            template = self._get(key)
+            template_id = template.id
+        with self._lock:
+            entry = self._compiled.get(template_id)
+            if entry is not None:
+                self.hits += 1
+                self._compiled.move_to_end(template_id)
+                return entry[0]
+            self.misses += 1
+        if template is None:
+            template = self._get(key)
+
+        # compiled outside of the lock, other templates may be looked up meanwhile
+        compiled = CompiledPassTemplate(template)
+        size = _size(compiled)
+        if size > self.max_bytes:
+            return compiled
+        with self._lock:
+            entry = self._compiled.setdefault(template.id, (compiled, size))
+            if entry[0] is compiled:
+                self.size += size
+                while self.size > self.max_bytes:
+                    _, (_, evicted) = self._compiled.popitem(last=False)
+                    self.size -= evicted
+        return entry[0]
+
+    def create_pass_object(self, template_identifier: str, **kwargs) -> Pass:
+        """creates a pass from the latest version of a template, see CompiledPassTemplate.create_pass_object"""
+        return self.compiled(template_identifier).create_pass_object(**kwargs)
+
+    def versions(self, template_identifier: str) -> list[PassTemplateBase]:
+        """all versions of a template, oldest first"""
+        return self.store.versions(template_identifier)
+
+    def __contains__(self, template_identifier: str) -> bool:
+        try:
+            self.latest(template_identifier)
+        except KeyError:
+            return False
+        return True
+
+
+def _size(compiled: CompiledPassTemplate) -> int:
+    """approximate memory used by a compiled template"""
+    return sum(len(data) for data in compiled.attachments.values()) + len(json.dumps(compiled.pass_json, default=str))
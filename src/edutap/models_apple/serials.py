@@ -0,0 +1,206 @@
+import abc
+import os
+import threading
+import time
+import typing
+
+import shortuuid
+
+
+ALPHABET = shortuuid.get_alphabet()
+"""alphabet of the generated serial numbers, sorted, so sorting serials sorts their numbers"""
+
+LENGTH = 22
+"""length of random and time ordered serial numbers, a 128 bit number in ALPHABET"""
+
+
+class SerialIndex(typing.Protocol):
+    """serial numbers known to be in use, e.g. a set"""
+
+    def __contains__(self, serial: object) -> bool: ...
+
+    def add(self, serial: str) -> None: ...
+
+
+class SerialCollision(Exception):
+    """no unused serial number was found in `max_attempts` attempts"""
+
+
+_PAIRS = [first + second for first in ALPHABET for second in ALPHABET]
+"""two digits at once, half the divisions of encoding digit by digit"""
+
+
+def _encode(number: int) -> str:
+    """encodes a 128 bit number like shortuuid, most significant digit first, padded to LENGTH"""
+    digits = []
+    for _ in range(LENGTH // 2):
+        number, pair = divmod(number, len(_PAIRS))
+        digits.append(_PAIRS[pair])
+    return "".join(reversed(digits))
+
+
+class SerialAllocator(abc.ABC):
+    """
+    hands out serial numbers from a pool generated in bulk.
+
+    the pool is refilled with `pool_size` serials at once when it is empty, a subclass
+    implements the strategy in `_generate`. allocating is thread safe.
+
+    :param pool_size: number of serial numbers generated at once
+    :param index: serial numbers in use. if given, allocated serials found in it are
+        skipped and the allocated ones are added to it
+    :param max_attempts: number of colliding serials skipped before SerialCollision is raised
+    """
+
+    def __init__(self, *, pool_size: int = 1024, index: SerialIndex | None = None, max_attempts: int = 16):
+        self.pool_size = pool_size
+        self.index = index
+        self.max_attempts = max_attempts
+        self.collisions = 0
+        """number of serials skipped because they were found in the index"""
+        self._pool: list[str] = []
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    @abc.abstractmethod
+    def _generate(self, count: int) -> list[str]:
+        """returns `count` new serial numbers"""
+
+    def _take(self) -> str:
+        if self._pid != os.getpid():
+            # a forked process must not hand out the serials of its parent's pool
+            self._pool = []
+            self._pid = os.getpid()
+        # the pool is used from its end, _generate returns the serials in their order
+        if not self._pool:
+            self._pool = self._generate(self.pool_size)
+            self._pool.reverse()
+        return self._pool.pop()
+
+    def _next(self) -> str:
+        serial = self._take()
+        if self.index is None:
+            return serial
+        for _ in range(self.max_attempts):
+            if serial not in self.index:
+                self.index.add(serial)
+                return serial
+            self.collisions += 1
+            serial = self._take()
+        raise SerialCollision(f"no unused serial number in {self.max_attempts} attempts")
+
+    def allocate(self) -> str:
+        """returns a new serial number"""
+        with self._lock:
+            return self._next()
+
+    def allocate_many(self, count: int) -> list[str]:
+        """returns `count` new serial numbers"""
+        with self._lock:
+            if self.index is None and self._pid == os.getpid() and count > len(self._pool):
+                # one call to _generate for all serials missing in the pool, at least a pool full
+                self._pool[:0] = reversed(self._generate(max(count - len(self._pool), self.pool_size)))
+            return [self._next() for _ in range(count)]
+
+    def __iter__(self) -> typing.Iterator[str]:
+        """endless iterator of new serial numbers"""
+        while True:
+            yield self.allocate()
+
+
+class RandomSerials(SerialAllocator):
+    """
+    random serial numbers, the random (version 4) uuids of create_serial_number
+    encoded like shortuuid.encode. the random bytes for the pool are read at once.
+    """
+
+    def _generate(self, count: int) -> list[str]:
+        data = os.urandom(16 * count)
+        serials = []
+        for offset in range(0, len(data), 16):
+            number = int.from_bytes(data[offset : offset + 16], "big")
+            # version 4 and the RFC 4122 variant, like uuid.uuid4
+            number = (number & ~(0xF000 << 64) | 0x4000 << 64) & ~(0xC000 << 48) | 0x8000 << 48
+            serials.append(_encode(number))
+        return serials
+
+
+class TimeOrderedSerials(SerialAllocator):
+    """
+    serial numbers sorting in the order they were generated, version 7 uuids
+    (milliseconds since the epoch followed by random bits) encoded like shortuuid.encode.
+
+    serials generated in the same millisecond are numbered in the 12 bits following the
+    timestamp, so the serials of one allocator sort strictly in the order they are handed out.
+    the timestamp is the time the pool was generated, not the time a serial was allocated.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._last = 0
+        """timestamp and counter of the last serial, the 60 most significant bits"""
+
+    def _generate(self, count: int) -> list[str]:
+        data = os.urandom(8 * count)
+        now = time.time_ns() // 1_000_000 << 12
+        serials = []
+        for offset in range(0, len(data), 8):
+            self._last = max(now, self._last + 1)
+            timestamp, counter = divmod(self._last, 1 << 12)
+            random = int.from_bytes(data[offset : offset + 8], "big") & ~(0xC000 << 48) | 0x8000 << 48
+            serials.append(_encode(timestamp << 80 | 0x7000 << 64 | counter << 64 | random))
+        return serials
+
+
+class SequentialSerials(SerialAllocator):
+    """
+    sequential serial numbers, `prefix` followed by the number padded with zeros to `width` digits.
+
+    numbers are reserved in blocks of `pool_size`. `reserve(count)` returns the first
+    number of a block of `count` numbers no other allocator hands out, e.g. taken from a
+    database sequence, so several processes can allocate without overlapping.
+    without `reserve` the numbers are counted from `start` in this allocator.
+    """
+
+    def __init__(
+        self,
+        reserve: typing.Callable[[int], int] | None = None,
+        *,
+        start: int = 1,
+        prefix: str = "",
+        width: int = 10,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.prefix = prefix
+        self.width = width
+        self._next_number = start
+        self.reserve = reserve or self._reserve
+
+    def _reserve(self, count: int) -> int:
+        first = self._next_number
+        self._next_number += count
+        return first
+
+    def _generate(self, count: int) -> list[str]:
+        first = self.reserve(count)
+        return [f"{self.prefix}{number:0{self.width}d}" for number in range(first, first + count)]
+
+
+_default_allocator: SerialAllocator = RandomSerials()
+
+
+def default_allocator() -> SerialAllocator:
+    """the allocator of the serial numbers of new passes"""
+    return _default_allocator
+
+
+def set_default_allocator(allocator: SerialAllocator) -> SerialAllocator:
+    """
+    sets the allocator used for the serial numbers of new passes
+
+    :return: the allocator used before
+    """
+    global _default_allocator
+    previous, _default_allocator = _default_allocator, allocator
+    return previous
@@ -0,0 +1,180 @@
+import abc
+from collections import OrderedDict
+import hashlib
+import os
+from pathlib import Path
+import tempfile
+import threading
+import time
+
+
+class SignatureCache(abc.ABC):
+    """
+    signatures of manifests by (signer identity, sha256 of the manifest), see PassSigner.
+
+    a signature is kept until it expires, a signer stores it with the time its
+    certificate expires. `hits` and `misses` count the lookups.
+    subclasses store the entries in `_get`, `_set` and `_delete`.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # a cache sent to another process starts with its own counters and lock
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(identity: str, manifest: bytes, signed_attributes: bool = True) -> str:
+        """
+        :param identity: identifies the signing material, e.g. PassSigner.fingerprint
+        """
+        key = f"{identity}-{hashlib.sha256(manifest).hexdigest()}"
+        return key if signed_attributes else f"{key}-noattr"
+
+    def get(self, key: str) -> bytes | None:
+        """returns the signature stored under the key, None if there is none or it expired"""
+        entry = self._get(key)
+        if entry is not None and entry[1] <= time.time():
+            self._delete(key)
+            entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return entry[0]
+
+    def set(self, key: str, signature: bytes, expires: float):
+        """stores a signature until `expires` (seconds since the epoch)"""
+        if expires > time.time():
+            self._set(key, signature, expires)
+
+    @abc.abstractmethod
+    def _get(self, key: str) -> tuple[bytes, float] | None:
+        """returns the signature stored under the key and the time it expires, None if there is none"""
+
+    @abc.abstractmethod
+    def _set(self, key: str, signature: bytes, expires: float):
+        """stores the signature under the key"""
+
+    @abc.abstractmethod
+    def _delete(self, key: str):
+        """removes the signature stored under the key, if there is one"""
+
+
+class MemorySignatureCache(SignatureCache):
+    """
+    keeps at most `maxsize` signatures in memory, the least recently used ones are evicted first.
+    the entries are not sent along when the cache is pickled to another process
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        super().__init__()
+        self.maxsize = maxsize
+        self._entries: OrderedDict[str, tuple[bytes, float]] = OrderedDict()
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state["_entries"] = OrderedDict()
+        return state
+
+    def _get(self, key: str) -> tuple[bytes, float] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _set(self, key: str, signature: bytes, expires: float):
+        with self._lock:
+            self._entries[key] = (signature, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DiskSignatureCache(SignatureCache):
+    """
+    keeps the signatures as files in a directory, shared by the processes using it.
+
+    a signature is stored in a file named by its key, the modification time of the
+    file is the time the signature expires. files are replaced atomically, a reader
+    never sees a partly written signature. expired files are removed when they are
+    looked up or by `purge`.
+    """
+
+    suffix = ".der"
+
+    def __init__(self, directory: str | os.PathLike):
+        super().__init__()
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}{self.suffix}"
+
+    def _get(self, key: str) -> tuple[bytes, float] | None:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                return f.read(), os.fstat(f.fileno()).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def _set(self, key: str, signature: bytes, expires: float):
+        fd, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(signature)
+            os.utime(temporary, (expires, expires))
+            os.replace(temporary, self._path(key))
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def _delete(self, key: str):
+        try:
+            self._path(key).unlink()
+        except FileNotFoundError:
+            pass
+
+    def purge(self) -> int:
+        """removes the expired signatures, returns their number"""
+        now = time.time()
+        removed = 0
+        for path in self.directory.glob(f"*{self.suffix}"):
+            try:
+                if path.stat().st_mtime <= now:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def clear(self):
+        for path in self.directory.glob(f"*{self.suffix}"):
+            path.unlink(missing_ok=True)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.directory.glob(f"*{self.suffix}"))
@@ -0,0 +1,288 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+import hashlib
+import os
+import threading
+import time
+
+from edutap.models_apple.signature_cache import SignatureCache
+from edutap.models_apple.signing_backends import SigningBackend, SigningKey, get_backend
+
+
+PathLike = str | os.PathLike
+
+
+class PassSigner:
+    """
+    holds the parsed signing material for one pass type in memory.
+
+    the certificate, the private key and the wwdr certificate are read and parsed
+    once when the signer is created. sign_der checks the files for changes at most
+    every `check_interval` seconds and reloads them when they changed, see refresh.
+    a signer may be shared between threads, the loaded material is immutable and
+    a reload swaps it atomically.
+
+    :param certificate: path to the certificate file
+    :param key: path to the key file
+    :param wwdr_certificate: path to the wwdr_certificate file
+    :param password: password of the private key
+    :param expiry_margin: the signer is considered stale this long before the certificate expires
+    :param check_interval: minimum number of seconds between two checks of the files on disk
+    :param cache: signatures made before are taken from it, see sign_der.
+        they expire `expiry_margin` before the certificate does. the fingerprint of the
+        signing material is part of their key, reloaded material does not reuse them
+    :param backend: the library signing the manifests, a name in signing_backends.BACKENDS
+        ("m2crypto" or "cryptography") or a SigningBackend
+    """
+
+    def __init__(
+        self,
+        certificate: PathLike,
+        key: PathLike,
+        wwdr_certificate: PathLike,
+        password: str = "",
+        *,
+        expiry_margin: timedelta = timedelta(days=1),
+        check_interval: float = 5.0,
+        cache: SignatureCache | None = None,
+        backend: str | SigningBackend = "m2crypto",
+    ):
+        self.certificate = certificate
+        self.key = key
+        self.wwdr_certificate = wwdr_certificate
+        self.password = password or ""
+        self.expiry_margin = expiry_margin
+        self.check_interval = check_interval
+        self.cache = cache
+        self.backend = get_backend(backend)
+        self._lock = threading.Lock()
+        self._last_check = 0.0
+        self._load()
+
+    def __getstate__(self):
+        # the parsed material can not be pickled, it is loaded again after unpickling
+        state = self.__dict__.copy()
+        del state["_lock"]
+        del state["_material"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._load()
+
+    def _mtimes(self) -> tuple[int, ...]:
+        return tuple(
+            os.stat(path).st_mtime_ns
+            for path in (self.certificate, self.key, self.wwdr_certificate)
+        )
+
+    def _load(self):
+        mtimes = self._mtimes()
+        key = self.backend.load(self.certificate, self.key, self.wwdr_certificate, self.password)
+        fingerprint = hashlib.sha256(key.certificate_der + key.wwdr_certificate_der).hexdigest()
+        # a single assignment, so concurrent signers always see a consistent set
+        self._material = (key, mtimes, fingerprint)
+        self._last_check = time.monotonic()
+
+    def reload(self):
+        """reload the signing material from disk"""
+        with self._lock:
+            self._load()
+
+    @property
+    def not_after(self) -> datetime:
+        """expiration date of the signing certificate"""
+        return self._material[0].not_after
+
+    def is_stale(self) -> bool:
+        """
+        returns True if one of the files changed on disk since it was loaded
+        or if the certificate is about to expire
+        """
+        if self.not_after - self.expiry_margin <= datetime.now(timezone.utc):
+            return True
+        return self._files_changed()
+
+    def _files_changed(self) -> bool:
+        try:
+            return self._mtimes() != self._material[1]
+        except OSError:
+            # the files are being replaced, keep the material we have
+            return False
+
+    def refresh(self):
+        """
+        reload the signing material if its files changed on disk, checks at most every `check_interval` seconds.
+        a certificate about to expire is not reloaded while its files are unchanged, it would be the same one
+        """
+        if time.monotonic() - self._last_check < self.check_interval:
+            return
+        with self._lock:
+            if time.monotonic() - self._last_check < self.check_interval:
+                return
+            self._last_check = time.monotonic()
+            if self._files_changed():
+                self._load()
+
+    @property
+    def signing_key(self) -> SigningKey:
+        """the material loaded by the backend"""
+        return self._material[0]
+
+    def _m2crypto_key(self):
+        key = self._material[0]
+        if not hasattr(key, "sign_pkcs7"):
+            raise TypeError(f"M2Crypto objects need the m2crypto backend, the signer uses {self.backend.name!r}")
+        return key
+
+    def smime(self):
+        """
+        only for the m2crypto backend
+
+        :return: M2Crypto.SMIME.SMIME set up with the loaded material
+        """
+        return self._m2crypto_key().smime()
+
+    def sign(self, manifest: str | bytes, *, signed_attributes: bool = True):
+        """
+        only for the m2crypto backend, sign_der works with all backends
+
+        :param signed_attributes: include the signing time and the other signed attributes.
+            without them the signature only depends on the manifest and the signing material
+        :return: M2Crypto.SMIME.PKCS7 detached signature of the manifest
+        """
+        if isinstance(manifest, str):
+            manifest = bytes(manifest, encoding="utf8")
+        return self._m2crypto_key().sign_pkcs7(manifest, signed_attributes)
+
+    def sign_der(self, manifest: str | bytes, *, signed_attributes: bool = True) -> bytes:
+        """
+        signatures are looked up in the cache of the signer first,
+        by the fingerprint of the signer and the sha256 of the manifest.
+        changed signing material is reloaded first, see refresh
+
+        :return: detached signature of the manifest in DER format
+        """
+        self.refresh()
+        if self.cache is None:
+            return self._sign_der(manifest, signed_attributes)
+        if isinstance(manifest, str):
+            manifest = bytes(manifest, encoding="utf8")
+        key = self.cache.key(self.fingerprint, manifest, signed_attributes)
+        der = self.cache.get(key)
+        if der is None:
+            der = self._sign_der(manifest, signed_attributes)
+            self.cache.set(key, der, (self.not_after - self.expiry_margin).timestamp())
+        return der
+
+    def _sign_der(self, manifest: str | bytes, signed_attributes: bool) -> bytes:
+        if isinstance(manifest, str):
+            manifest = bytes(manifest, encoding="utf8")
+        return self._material[0].sign(manifest, signed_attributes)
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        sha256 of the certificate and the wwdr certificate,
+        changes when the signer is loaded with other signing material
+        """
+        return self._material[2]
+
+
+class SignerRegistry:
+    """
+    holds the signers for several pass types in one process.
+
+    signers are registered with their file locations under
+    (passTypeIdentifier, teamIdentifier) and loaded on first use.
+    at most `maxsize` signers are kept in memory, the least recently used
+    one is evicted and loaded again when it is needed the next time.
+    signers whose files changed on disk are reloaded transparently, see PassSigner.refresh.
+    """
+
+    def __init__(self, maxsize: int = 16, **signer_options):
+        self.maxsize = maxsize
+        self.signer_options = signer_options
+        self._configs: dict[tuple[str, str], tuple] = {}
+        self._signers: OrderedDict[tuple[str, str], PassSigner] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(
+        self,
+        pass_type_identifier: str,
+        team_identifier: str,
+        certificate: PathLike,
+        key: PathLike,
+        wwdr_certificate: PathLike,
+        password: str = "",
+    ):
+        """register the signing material for a pass type, it is loaded lazily"""
+        ident = (pass_type_identifier, team_identifier)
+        with self._lock:
+            self._configs[ident] = (certificate, key, wwdr_certificate, password)
+            self._signers.pop(ident, None)
+
+    def get(self, pass_type_identifier: str, team_identifier: str) -> PassSigner:
+        """return the signer for a pass type, loading it if necessary"""
+        ident = (pass_type_identifier, team_identifier)
+        with self._lock:
+            signer = self._signers.get(ident)
+            if signer is not None:
+                self._signers.move_to_end(ident)
+            else:
+                try:
+                    config = self._configs[ident]
+                except KeyError:
+                    raise KeyError(
+                        f"no signer registered for passTypeIdentifier={pass_type_identifier!r}, "
+                        f"teamIdentifier={team_identifier!r}"
+                    ) from None
+                signer = PassSigner(*config, **self.signer_options)
+                self._signers[ident] = signer
+                while len(self._signers) > self.maxsize:
+                    self._signers.popitem(last=False)
+        signer.refresh()
+        return signer
+
+    def __getstate__(self):
+        # loaded signers are not pickled, they are loaded again on demand
+        return {"maxsize": self.maxsize, "signer_options": self.signer_options, "_configs": self._configs}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._signers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def for_pass(self, pass_) -> PassSigner:
+        """return the signer matching passTypeIdentifier and teamIdentifier of a pass"""
+        return self.get(pass_.passTypeIdentifier, pass_.teamIdentifier)
+
+    def __contains__(self, ident: tuple[str, str]) -> bool:
+        return ident in self._configs
+
+    def __len__(self) -> int:
+        return len(self._configs)
+
+
+def resolve_signer(
+    pass_,
+    signer: PassSigner | SignerRegistry | None,
+    certificate: PathLike | None = None,
+    key: PathLike | None = None,
+    wwdr_certificate: PathLike | None = None,
+    password: str | None = None,
+) -> PassSigner:
+    """
+    returns the signer to use for a pass, either the given signer, the signer
+    looked up in the given registry, or a signer loaded from the given files
+    """
+    if isinstance(signer, SignerRegistry):
+        return signer.for_pass(pass_)
+    if signer is not None:
+        return signer
+    if certificate is None or key is None or wwdr_certificate is None:
+        raise ValueError(
+            "either a signer or certificate, key and wwdr_certificate must be given"
+        )
+    return PassSigner(certificate, key, wwdr_certificate, password or "")
@@ -0,0 +1,164 @@
+"""
+crypto libraries signing the manifests of passes, see PassSigner.
+
+a backend loads the signing material of a signer into a SigningKey, which makes
+detached PKCS#7 signatures in DER format. the libraries are imported when a
+backend loads its first key, only the ones in use need to be installed.
+"""
+from datetime import datetime
+import os
+import typing
+
+
+PathLike = str | os.PathLike
+
+
+class SigningKey(typing.Protocol):
+    """the parsed certificate, private key and wwdr certificate of a signer"""
+
+    certificate_der: bytes
+    wwdr_certificate_der: bytes
+    not_after: datetime
+    """expiration date of the certificate, timezone aware"""
+
+    def sign(self, manifest: bytes, signed_attributes: bool = True) -> bytes:
+        """
+        :param signed_attributes: include the signing time and the other signed attributes
+        :return: detached signature of the manifest in DER format, including the wwdr certificate
+        """
+
+
+class SigningBackend(typing.Protocol):
+    name: str
+
+    def load(self, certificate: PathLike, key: PathLike, wwdr_certificate: PathLike, password: str) -> SigningKey:
+        """reads and parses the signing material, the certificates are PEM files"""
+
+
+class M2CryptoKey:
+    def __init__(self, x509, pkey, stack):
+        self.x509 = x509
+        self.pkey = pkey
+        self.stack = stack
+        self.certificate_der = x509.as_der()
+        self.wwdr_certificate_der = stack[0].as_der()
+        self.not_after = x509.get_not_after().get_datetime()
+
+    def smime(self):
+        """
+        :return: M2Crypto.SMIME.SMIME set up with the key
+        """
+        from M2Crypto import SMIME
+
+        smime = SMIME.SMIME()
+        smime.set_x509_stack(self.stack)
+        smime.pkey = self.pkey
+        smime.x509 = self.x509
+        return smime
+
+    def sign_pkcs7(self, manifest: bytes, signed_attributes: bool = True):
+        """
+        :return: M2Crypto.SMIME.PKCS7 detached signature of the manifest
+        """
+        from M2Crypto import SMIME
+
+        flags = SMIME.PKCS7_DETACHED | SMIME.PKCS7_BINARY
+        if not signed_attributes:
+            flags |= SMIME.PKCS7_NOATTR
+        return self.smime().sign(SMIME.BIO.MemoryBuffer(manifest), flags=flags)
+
+    def sign(self, manifest: bytes, signed_attributes: bool = True) -> bytes:
+        from M2Crypto import SMIME
+
+        der = SMIME.BIO.MemoryBuffer()
+        self.sign_pkcs7(manifest, signed_attributes).write_der(der)
+        return der.read()
+
+
+class M2CryptoBackend:
+    """signs with M2Crypto (OpenSSL), the default"""
+
+    name = "m2crypto"
+
+    def load(self, certificate: PathLike, key: PathLike, wwdr_certificate: PathLike, password: str) -> M2CryptoKey:
+        from M2Crypto import EVP, X509
+        from M2Crypto.X509 import X509_Stack
+
+        pkey = EVP.load_key(str(key), lambda *args: bytes(password, encoding="ascii"))
+        x509 = X509.load_cert(str(certificate))
+        stack = X509_Stack()
+        stack.push(X509.load_cert(str(wwdr_certificate)))
+        return M2CryptoKey(x509, pkey, stack)
+
+
+class CryptographyKey:
+    def __init__(self, certificate, key, wwdr_certificate):
+        from cryptography.hazmat.primitives.serialization import Encoding
+
+        self.certificate = certificate
+        self.key = key
+        self.wwdr_certificate = wwdr_certificate
+        self.certificate_der = certificate.public_bytes(Encoding.DER)
+        self.wwdr_certificate_der = wwdr_certificate.public_bytes(Encoding.DER)
+        self.not_after = certificate.not_valid_after_utc
+
+    def sign(self, manifest: bytes, signed_attributes: bool = True) -> bytes:
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.serialization import Encoding, pkcs7
+
+        options = [pkcs7.PKCS7Options.DetachedSignature, pkcs7.PKCS7Options.Binary]
+        if not signed_attributes:
+            options.append(pkcs7.PKCS7Options.NoAttributes)
+        builder = (
+            pkcs7.PKCS7SignatureBuilder()
+            .set_data(manifest)
+            .add_signer(self.certificate, self.key, hashes.SHA256())
+            .add_certificate(self.wwdr_certificate)
+        )
+        return builder.sign(Encoding.DER, options)
+
+
+class CryptographyBackend:
+    """signs with the PKCS#7 builder of the cryptography package, install edutap.models_apple[cryptography]"""
+
+    name = "cryptography"
+
+    def load(
+        self, certificate: PathLike, key: PathLike, wwdr_certificate: PathLike, password: str
+    ) -> CryptographyKey:
+        try:
+            from cryptography import x509
+            from cryptography.hazmat.primitives import serialization
+        except ImportError as e:
+            raise ImportError(
+                "the cryptography signing backend needs cryptography, install edutap.models_apple[cryptography]"
+            ) from e
+
+        with open(key, "rb") as f:
+            data = f.read()
+        try:
+            pkey = serialization.load_pem_private_key(data, bytes(password, encoding="ascii") or None)
+        except TypeError:
+            # a password was given for an unencrypted key, M2Crypto ignores it as well
+            pkey = serialization.load_pem_private_key(data, None)
+        with open(certificate, "rb") as f:
+            cert = x509.load_pem_x509_certificate(f.read())
+        with open(wwdr_certificate, "rb") as f:
+            wwdr = x509.load_pem_x509_certificate(f.read())
+        return CryptographyKey(cert, pkey, wwdr)
+
+
+BACKENDS: dict[str, type[SigningBackend]] = {
+    M2CryptoBackend.name: M2CryptoBackend,
+    CryptographyBackend.name: CryptographyBackend,
+}
+
+
+def get_backend(backend: str | SigningBackend) -> SigningBackend:
+    """the backend registered in BACKENDS under a name, backend instances are returned as they are"""
+    if not isinstance(backend, str):
+        return backend
+    try:
+        return BACKENDS[backend]()
+    except KeyError:
+        raise ValueError(f"unknown signing backend {backend!r}, one of {sorted(BACKENDS)}") from None
@@ -1,15 +1,43 @@
+import asyncio
 import base64
-from datetime import datetime
+from collections import OrderedDict
+import concurrent.futures
+import copy
+from datetime import datetime, timezone
+import functools
 import io
-from typing import Any
+import itertools
+import os
+import threading
+import types
+from typing import Any, Iterable, Iterator
 import uuid
-import zipfile
 from pydantic import BaseModel, Field
 import pydantic
 import jsonpatch
 
 
-from edutap.models_apple.models import Pass
+from edutap.models_apple.aio import run_blocking
+from edutap.models_apple.attachments import attachment_store
+from edutap.models_apple.instrumentation import stage
+from edutap.models_apple.models import Pass, _copy_unshared, _share, create_serial_number, pass_model_registry
+from edutap.models_apple.passfile import PassFile
+from edutap.models_apple.patch import PatchPlan, UnsupportedModelPatch
+from edutap.models_apple.signing import PassSigner, SignerRegistry
+
+
+class PassCreationError(Exception):
+    """
+    raised or reported when a pass of a batch could not be created
+
+    :param index: position of the failed patch set in the batch
+    :param serial_number: serial number of the failed pass
+    """
+
+    def __init__(self, message: str, index: int, serial_number: str | None):
+        super().__init__(message)
+        self.index = index
+        self.serial_number = serial_number
 
 
 class PassTemplateBase(BaseModel):
@@ -22,6 +50,7 @@ class PassTemplateBase(BaseModel):
 
     PassTemplates are stored historically, that means, every update is a creation of a new record
         template_id stays the same, id is a new uuid, (template_id, timestamp) are unique
+        registry.TemplateRegistry looks up the versions and keeps them compiled
 
     storage should be adaptable, concrete storage in a relational database is defined in the edutap.passdata_apple service
     """
@@ -35,7 +64,7 @@ class PassTemplateBase(BaseModel):
     description: str = ""
     creator: str = ""
     email: str = ""
-    timestamp: datetime = Field(default_factory=datetime.now)
+    timestamp: pydantic.AwareDatetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     pass_type: str = ""  # references Apple Pass Type Identifier as defined in models.@passmodel registry
 
     def create_pass_object(
@@ -60,42 +89,31 @@ class PassTemplateBase(BaseModel):
         
         TODO: convenience params for passtype and teamidentifier
         """
-        
-        if serial_number is not None:
-            pass_patches = pass_patches + [
-                {"path": "/serialNumber", "op": "replace", "value": serial_number}
-                ]
-
-        if passtype_identifier is not None:
-            pass_patches = pass_patches + [
-                {"path": "/passTypeIdentifier", "op": "replace", "value": passtype_identifier}
-                ]
-            
-        if team_identifier is not None:
-            pass_patches = pass_patches + [
-                {"path": "/teamIdentifier", "op": "replace", "value": team_identifier}
-                ]
-            
-        pass_patches = jsonpatch.JsonPatch(pass_patches)
-        passinfo_patches = jsonpatch.JsonPatch(passinfo_patches)
-
-        pass_json = pass_patches.apply(self.pass_json)
-        passinfo_json = passinfo_patches.apply(pass_json[self.pass_type])
-
-        pass_json[self.pass_type] = passinfo_json
-        pass_object = Pass.model_validate(pass_json)
-        for name, data in self.all_attachments():
-            pass_object.addFile(name, data)
-
+        with stage("create_pass_object") as measurement:
+            pass_object = _create_pass_object(
+                self.pass_json,
+                self.pass_type,
+                self.all_attachments(),
+                serial_number=serial_number,
+                passtype_identifier=passtype_identifier,
+                team_identifier=team_identifier,
+                pass_patches=pass_patches,
+                passinfo_patches=passinfo_patches,
+            )
+            measurement.attachments = len(pass_object.files)
         return pass_object
 
     def create_pkpass(
         self,
-        pass_patches: list[dict[str, Any]],
-        passinfo_patches: list[dict[str, Any]],
-        certificate: str,
-        key: str,
-        wwdr_certificate: str,
+        pass_patches: list[dict[str, Any]] = [],
+        passinfo_patches: list[dict[str, Any]] = [],
+        certificate: str | None = None,
+        key: str | None = None,
+        wwdr_certificate: str | None = None,
+        password: str | None = None,
+        *,
+        signer: PassSigner | SignerRegistry | None = None,
+        **kwargs,
     ) -> io.BytesIO:
         """
         create a pkpass from this template
@@ -104,39 +122,163 @@ class PassTemplateBase(BaseModel):
         :param certificate: path to the certificate file
         :param key: path to the key file
         :param wwdr_certificate: path to the wwdr_certificate file
+        :param password: password of the key file
+        :param signer: PassSigner or SignerRegistry to use instead of certificate, key, wwdr_certificate and password
+        :param kwargs: further keyword arguments passed to create_pass_object (serial_number, ...)
 
         uses create_pass_object to create a pass object and then creates a pkpass from it
         using the certificates and keys defined in the edutap.passdata_apple service for signing the pass
         """
         
-        pass_object = self.create_pass_object(pass_patches, passinfo_patches)
-        pkpass = pass_object.create(certificate, key, wwdr_certificate)
+        pass_object = self.create_pass_object(
+            pass_patches=pass_patches, passinfo_patches=passinfo_patches, **kwargs
+        )
+        pkpass = pass_object.create(certificate, key, wwdr_certificate, password, signer=signer)
         return pkpass
 
-    def import_passfile(self, passfile: bytes | io.IOBase):
+    async def create_pkpass_async(
+        self,
+        pass_patches: list[dict[str, Any]] = [],
+        passinfo_patches: list[dict[str, Any]] = [],
+        certificate: str | None = None,
+        key: str | None = None,
+        wwdr_certificate: str | None = None,
+        password: str | None = None,
+        *,
+        signer: PassSigner | SignerRegistry | None = None,
+        executor: concurrent.futures.Executor | None = None,
+        limit: asyncio.Semaphore | None = None,
+        **kwargs,
+    ) -> io.BytesIO:
+        """
+        create a pkpass from this template like create_pkpass without blocking the event loop,
+        patching, signing and zipping run in `executor` (the default executor of the running loop if None)
+
+        :param limit: semaphore limiting the number of passes created at the same time,
+            see Pass.create_async
+        """
+        return await run_blocking(
+            self.create_pkpass,
+            pass_patches,
+            passinfo_patches,
+            certificate,
+            key,
+            wwdr_certificate,
+            password,
+            signer=signer,
+            executor=executor,
+            limit=limit,
+            **kwargs,
+        )
+
+    def create_pkpasses(
+        self,
+        patch_sets: Iterable[dict[str, Any]],
+        *,
+        signer: PassSigner | SignerRegistry,
+        workers: int | None = None,
+        window: int | None = None,
+        mp_context=None,
+    ) -> Iterator[tuple[str, bytes | PassCreationError]]:
+        """
+        create many pkpasses from this template in parallel using a process pool
+
+        :param patch_sets: iterable of dicts with keyword arguments for create_pass_object,
+            e.g. {"serial_number": ..., "pass_patches": [...], "passinfo_patches": [...]}
+        :param signer: PassSigner or SignerRegistry used for signing the passes
+        :param workers: number of worker processes, defaults to the number of cpus
+        :param window: maximum number of passes in flight, defaults to 4 * workers
+        :param mp_context: multiprocessing context for the process pool
+
+        the template and the signer are sent to each worker once and not per pass.
+        patch_sets is consumed lazily, at most `window` passes are pending at any time,
+        so the memory used does not depend on the size of the batch.
+
+        yields (serial_number, data) tuples in the order the passes are finished.
+        data is the content of the pkpass, or a PassCreationError if the pass could not
+        be created. a failing pass does not abort the batch.
+        patch sets without a serial number get a generated one.
+        """
+        workers = workers or os.cpu_count() or 1
+        window = window or 4 * workers
+        patch_sets = enumerate(patch_sets)
+        pending = {}
+
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=mp_context,
+            initializer=_init_batch_worker,
+            initargs=(self, signer),
+        ) as executor:
+            while True:
+                for index, patch_set in itertools.islice(patch_sets, window - len(pending)):
+                    patch_set = dict(patch_set)
+                    if patch_set.get("serial_number") is None:
+                        patch_set["serial_number"] = create_serial_number()
+                    future = executor.submit(_create_pkpass_in_worker, patch_set)
+                    pending[future] = (index, patch_set["serial_number"])
+                if not pending:
+                    break
+
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    index, serial_number = pending.pop(future)
+                    error = future.exception()
+                    if error is None:
+                        yield future.result()
+                    else:
+                        failure = PassCreationError(
+                            f"pass #{index} ({serial_number}) could not be created: {error!r}",
+                            index,
+                            serial_number,
+                        )
+                        failure.__cause__ = error
+                        yield serial_number, failure
+
+    def compile(self) -> "CompiledPassTemplate":
+        """
+        returns the compiled form of this template for creating many passes.
+
+        compiled templates are cached per (template_identifier, id). templates are
+        stored historically, a changed template gets a new id, so a template must
+        not be changed in place after it was compiled.
+        """
+        key = (self.template_identifier, self.id)
+        with _compiled_templates_lock:
+            compiled = _compiled_templates.get(key)
+            if compiled is not None:
+                _compiled_templates.move_to_end(key)
+                return compiled
+
+        compiled = CompiledPassTemplate(self)
+        with _compiled_templates_lock:
+            compiled = _compiled_templates.setdefault(key, compiled)
+            while len(_compiled_templates) > COMPILED_TEMPLATES_CACHE_SIZE:
+                _compiled_templates.popitem(last=False)
+        return compiled
+
+    def import_passfile(self, passfile: "bytes | io.IOBase | str | os.PathLike | PassFile"):
         """
         import a passfile into the template
         fetches pass.json and validates/parses it,
         gets all attachments and stores them in the template
         ignores all other files(manifest, signature, etc.)
 
-        :param passfile: passfile as bytes or file-like object
+        :param passfile: passfile as bytes, file-like object, path or an opened PassFile
         """
-        ignorefiles = ["manifest.json", "signature", "manifest", "pass.json"]
-        if isinstance(passfile, bytes):
-            passfile = io.BytesIO(passfile)
-
-        zf = zipfile.ZipFile(passfile)
+        if isinstance(passfile, PassFile):
+            self._import_passfile(passfile)
+        else:
+            with PassFile(passfile) as reader:
+                self._import_passfile(reader)
 
-        for filename in zf.namelist():
-            if filename in ignorefiles:
-                continue
-            with zf.open(filename) as f:
-                self.attachments[filename] = base64.b64encode(f.read()).decode("utf-8")
+    def _import_passfile(self, reader: PassFile):
+        for filename, data in reader.attachments.items():
+            self.attachments[filename] = base64.b64encode(data).decode("utf-8")
 
-        passjson = zf.read("pass.json")
-
-        passobject = Pass.model_validate_json(passjson)
+        passobject = reader.pass_object
         self.pass_type = passobject.passType
 
         self.pass_json = passobject.model_dump(exclude_none=True)
@@ -146,7 +288,10 @@ class PassTemplateBase(BaseModel):
 
     @classmethod
     def from_passfile(
-        cls, passfile: bytes | io.IOBase, template_identifier: str, backoffice_identifier: str
+        cls,
+        passfile: "bytes | io.IOBase | str | os.PathLike | PassFile",
+        template_identifier: str,
+        backoffice_identifier: str,
     ):
         """
         constructor method to create a template from a passfile.
@@ -173,10 +318,11 @@ class PassTemplateBase(BaseModel):
     def all_attachments(self) -> tuple[str, bytes]:
         """
         generator functino to iterate over all attachments, returning name and data
+        the data is registered in the attachment store, so it is hashed once for all passes
         """
 
         for filename, b64str in self.attachments.items():
-            data = base64.b64decode(b64str)
+            data = attachment_store.register(base64.b64decode(b64str))
             yield filename, data
             
 
@@ -189,3 +335,279 @@ class PassTemplate(PassTemplateBase):
     attachments: dict[str, str] = Field(
         default_factory=dict
     )  # TODO: define attachment structure model for sqlalchemy
+
+
+class CompiledPassTemplate:
+    """
+    read-only form of a pass template prepared for creating many passes,
+    created by PassTemplateBase.compile
+
+    the attachments are decoded once and kept as immutable bytes shared by all passes
+    created from the template, the passinformation class is resolved once.
+    """
+
+    max_patch_plans = 256
+    """maximum number of compiled patch plans kept per template"""
+
+    def __init__(self, template: PassTemplateBase):
+        self.id = template.id
+        self.template_identifier = template.template_identifier
+        self.pass_type = template.pass_type
+        self.passinfo_class = pass_model_registry[template.pass_type]
+        self.pass_json = copy.deepcopy(template.pass_json)
+        self.attachments = types.MappingProxyType(
+            {
+                filename: attachment_store.register(base64.b64decode(b64str))
+                for filename, b64str in template.attachments.items()
+            }
+        )
+        self._plans: dict[tuple, PatchPlan] = {}
+
+    @property
+    def attachment_filenames(self):
+        """return a list of all attachment filenames"""
+        return self.attachments.keys()
+
+    def get_attachment(self, filename: str) -> bytes:
+        """return an attachment by filename"""
+        return self.attachments[filename]
+
+    def all_attachments(self) -> Iterator[tuple[str, bytes]]:
+        """
+        generator function to iterate over all attachments, returning name and data
+        """
+        return iter(self.attachments.items())
+
+    def create_pass_object(
+        self,
+        *,
+        serial_number: str | None = None,
+        passtype_identifier: str | None = None,
+        team_identifier: str | None = None,
+        pass_patches: list[dict[str, Any]] = [],
+        passinfo_patches: list[dict[str, Any]] = [],
+        trusted: bool = False,
+    ) -> Pass:
+        """
+        create a pass from this template, see PassTemplateBase.create_pass_object
+
+        the patches are applied with a PatchPlan compiled once per combination of
+        operations and paths, only the values differ from pass to pass.
+
+        :param trusted: the template was validated when it was compiled, so only the
+            values set by the patches are validated, against the fields they are assigned to.
+            the pass is assembled from the already validated models of the template: its lists,
+            dicts and the models holding them are copied for every pass, the models without
+            lists or dicts (e.g. the fields) are shared between all passes created in trusted mode
+            and are read-only, assigning to them raises a TypeError (replacing them is fine).
+            patches that can not be applied this way (move, copy, test, removing a field)
+            fall back to validating the whole pass.
+        """
+        with stage("create_pass_object") as measurement:
+            pass_object = self._instantiate(
+                pass_patches, passinfo_patches, serial_number, passtype_identifier, team_identifier, trusted
+            )
+            measurement.attachments = len(pass_object.files)
+        return pass_object
+
+    def _instantiate(
+        self,
+        pass_patches: list[dict[str, Any]],
+        passinfo_patches: list[dict[str, Any]],
+        serial_number: str | None,
+        passtype_identifier: str | None,
+        team_identifier: str | None,
+        trusted: bool,
+    ) -> Pass:
+        patches = self._patches(
+            pass_patches, passinfo_patches, serial_number, passtype_identifier, team_identifier
+        )
+        plan = self.patch_plan(patches)
+        values = PatchPlan.values(patches)
+        if trusted:
+            try:
+                pass_object = self._create_trusted(plan, values)
+            except UnsupportedModelPatch:
+                pass
+            else:
+                for name, data in self.all_attachments():
+                    pass_object.addFile(name, data)
+                return pass_object
+
+        pass_json = plan.apply(self.pass_json, values)
+        return _pass_from_json(pass_json, self.all_attachments())
+
+    @functools.cached_property
+    def prototype(self) -> Pass:
+        """the pass_json of the template validated once, the base of passes created in trusted mode"""
+        # every pass gets its own serial number, none is allocated for the prototype
+        prototype = Pass.model_validate({"serialNumber": "", **self.pass_json})
+        # the models and containers copied for every pass
+        self._unshared: dict[int, list] = {}
+        _share(prototype, self._unshared)
+        return prototype
+
+    def _create_trusted(self, plan: PatchPlan, values: list[Any]) -> Pass:
+        owned: set[int] = set()
+        root = _copy_unshared(self.prototype, self._unshared, owned)
+        pass_object = plan.apply_to_model(root, values, owned=owned)
+        if not any(operation.path[:1] == ("serialNumber",) for operation in plan.operations):
+            # the prototype has no serial number, every pass gets its own
+            pass_object.__dict__["serialNumber"] = create_serial_number()
+        return pass_object
+
+    def _patches(
+        self,
+        pass_patches: list[dict[str, Any]],
+        passinfo_patches: list[dict[str, Any]],
+        serial_number: str | None = None,
+        passtype_identifier: str | None = None,
+        team_identifier: str | None = None,
+    ) -> list[dict[str, Any]]:
+        """
+        returns the patches for pass_json and passinformation combined into one patch on pass_json
+        """
+        pass_patches = _standard_patches(pass_patches, serial_number, passtype_identifier, team_identifier)
+        return pass_patches + PatchPlan.prefixed(passinfo_patches, self.pass_type)
+
+    def patch_plan(self, patches: list[dict[str, Any]]) -> PatchPlan:
+        """
+        returns the compiled plan for a patch on pass_json.
+        a new plan is validated by applying it to the template, so an invalid
+        path is reported before the plan is used.
+        """
+        key = PatchPlan.key(patches)
+        plan = self._plans.get(key)
+        if plan is None:
+            plan = PatchPlan(patches)
+            plan.apply(self.pass_json)
+            if len(self._plans) >= self.max_patch_plans:
+                self._plans.clear()
+            self._plans[key] = plan
+        return plan
+
+    def validate_patches(
+        self,
+        *,
+        pass_patches: list[dict[str, Any]] = [],
+        passinfo_patches: list[dict[str, Any]] = [],
+    ):
+        """
+        compiles and validates patches against the template up front,
+        raises the jsonpatch or jsonpointer exception of the first invalid operation
+        """
+        self.patch_plan(self._patches(pass_patches, passinfo_patches))
+
+    def create_pkpass(
+        self,
+        pass_patches: list[dict[str, Any]] = [],
+        passinfo_patches: list[dict[str, Any]] = [],
+        *,
+        signer: PassSigner | SignerRegistry,
+        **kwargs,
+    ) -> io.BytesIO:
+        """
+        create a pkpass from this template, see PassTemplateBase.create_pkpass
+        """
+        pass_object = self.create_pass_object(
+            pass_patches=pass_patches, passinfo_patches=passinfo_patches, **kwargs
+        )
+        return pass_object.create(signer=signer)
+
+    async def create_pkpass_async(
+        self,
+        pass_patches: list[dict[str, Any]] = [],
+        passinfo_patches: list[dict[str, Any]] = [],
+        *,
+        signer: PassSigner | SignerRegistry,
+        executor: concurrent.futures.Executor | None = None,
+        limit: asyncio.Semaphore | None = None,
+        **kwargs,
+    ) -> io.BytesIO:
+        """
+        create a pkpass from this template without blocking the event loop,
+        see PassTemplateBase.create_pkpass_async
+        """
+        return await run_blocking(
+            self.create_pkpass, pass_patches, passinfo_patches, signer=signer, executor=executor, limit=limit, **kwargs
+        )
+
+
+COMPILED_TEMPLATES_CACHE_SIZE = 128
+"""number of compiled templates kept by PassTemplateBase.compile"""
+
+_compiled_templates: OrderedDict[tuple[str, uuid.UUID], CompiledPassTemplate] = OrderedDict()
+_compiled_templates_lock = threading.Lock()
+
+
+def _standard_patches(
+    pass_patches: list[dict[str, Any]],
+    serial_number: str | None,
+    passtype_identifier: str | None,
+    team_identifier: str | None,
+) -> list[dict[str, Any]]:
+    """appends the patches for the convenience parameters of create_pass_object"""
+    if serial_number is not None:
+        # the template has no serial number, "add" replaces it if the template has one
+        pass_patches = pass_patches + [
+            {"path": "/serialNumber", "op": "add", "value": serial_number}
+            ]
+
+    if passtype_identifier is not None:
+        pass_patches = pass_patches + [
+            {"path": "/passTypeIdentifier", "op": "replace", "value": passtype_identifier}
+            ]
+        
+    if team_identifier is not None:
+        pass_patches = pass_patches + [
+            {"path": "/teamIdentifier", "op": "replace", "value": team_identifier}
+            ]
+    return pass_patches
+
+
+def _pass_from_json(pass_json: dict[str, Any], attachments: Iterable[tuple[str, bytes]]) -> Pass:
+    pass_object = Pass.model_validate(pass_json)
+    for name, data in attachments:
+        pass_object.addFile(name, data)
+
+    return pass_object
+
+
+def _create_pass_object(
+    pass_json: dict[str, Any],
+    pass_type: str,
+    attachments: Iterable[tuple[str, bytes]],
+    *,
+    serial_number: str | None,
+    passtype_identifier: str | None,
+    team_identifier: str | None,
+    pass_patches: list[dict[str, Any]],
+    passinfo_patches: list[dict[str, Any]],
+) -> Pass:
+    """patches the pass_json of a template and creates the pass object from it"""
+    pass_patches = _standard_patches(pass_patches, serial_number, passtype_identifier, team_identifier)
+        
+    pass_patches = jsonpatch.JsonPatch(pass_patches)
+    passinfo_patches = jsonpatch.JsonPatch(passinfo_patches)
+
+    pass_json = pass_patches.apply(pass_json)
+    passinfo_json = passinfo_patches.apply(pass_json[pass_type])
+
+    pass_json[pass_type] = passinfo_json
+    return _pass_from_json(pass_json, attachments)
+
+
+_batch_worker_state: dict[str, Any] = {}
+
+
+def _init_batch_worker(template: PassTemplateBase, signer: PassSigner | SignerRegistry):
+    """initializer of the create_pkpasses worker processes, keeps template and signer for all passes"""
+    _batch_worker_state["template"] = template.compile()
+    _batch_worker_state["signer"] = signer
+
+
+def _create_pkpass_in_worker(patch_set: dict[str, Any]) -> tuple[str, bytes]:
+    template = _batch_worker_state["template"]
+    pass_object = template.create_pass_object(**patch_set)
+    pkpass = pass_object.create(signer=_batch_worker_state["signer"])
+    return pass_object.serialNumber, pkpass.getvalue()
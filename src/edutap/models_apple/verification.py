@@ -0,0 +1,268 @@
+import concurrent.futures
+import hashlib
+import itertools
+import json
+import os
+from pathlib import Path
+import time
+import typing
+
+from M2Crypto import BIO, SMIME, X509, m2
+
+from edutap.models_apple.passfile import PassFile
+
+
+PathLike = str | os.PathLike
+Source = PathLike | bytes
+
+UNSIGNED_FILES = frozenset(("manifest.json", "signature"))
+"""entries of a .pkpass file that are not listed in the manifest"""
+
+CHUNK_SIZE = 64 * 1024
+
+
+class VerificationResult(typing.NamedTuple):
+    """outcome of verifying one .pkpass file"""
+
+    source: str
+    """path of the file, or #index for data given as bytes"""
+    size: int
+    """size of the archive in bytes"""
+    manifest_valid: bool = False
+    """all entries are listed in the manifest with a matching sha1 and no listed entry is missing"""
+    signature_valid: bool = False
+    """the signature was made for the manifest by the certificate it contains"""
+    chain_valid: bool = False
+    """the certificate of the signature is issued by the trusted wwdr certificate"""
+    mismatched: tuple[str, ...] = ()
+    """entries whose sha1 differs from the manifest"""
+    missing: tuple[str, ...] = ()
+    """entries listed in the manifest but not in the archive"""
+    extra: tuple[str, ...] = ()
+    """entries in the archive but not in the manifest"""
+    errors: tuple[str, ...] = ()
+
+    @property
+    def valid(self) -> bool:
+        return self.manifest_valid and self.signature_valid and self.chain_valid
+
+
+class VerificationStats:
+    """counts the results of a bulk verification"""
+
+    def __init__(self):
+        self.files = 0
+        self.valid = 0
+        self.invalid = 0
+        self.bytes = 0
+        self.started = time.perf_counter()
+        self.finished: float | None = None
+
+    def add(self, result: VerificationResult):
+        self.files += 1
+        self.bytes += result.size
+        if result.valid:
+            self.valid += 1
+        else:
+            self.invalid += 1
+
+    @property
+    def elapsed(self) -> float:
+        """seconds since the verification started, until it finished"""
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def files_per_second(self) -> float:
+        return self.files / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes / self.elapsed if self.elapsed else 0.0
+
+
+class PassVerifier:
+    """
+    checks .pkpass files: the sha1 hashes of the manifest against the entries of the archive
+    and the detached signature against the manifest and the wwdr certificate.
+
+    the trust store is loaded once when the verifier is created and shared by all
+    verifications, a verifier may be used by several threads.
+
+    :param wwdr_certificate: path to the wwdr certificate (pem) the pass certificates must be issued by.
+        the wwdr certificate is trusted as it is, the apple root ca issuing it is not needed.
+        a root certificate may be given instead, the signatures contain the wwdr certificate
+    """
+
+    def __init__(self, wwdr_certificate: PathLike):
+        self.wwdr_certificate = wwdr_certificate
+        self._load()
+
+    def __getstate__(self):
+        # the trust store can not be pickled, it is loaded again after unpickling
+        state = self.__dict__.copy()
+        del state["_store"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._load()
+
+    def _load(self):
+        store = X509.X509_Store()
+        if not store.load_info(str(self.wwdr_certificate)):
+            raise ValueError(f"could not load the wwdr certificate {self.wwdr_certificate}")
+        # the wwdr certificate is an intermediate issued by the apple root ca,
+        # chains ending at a certificate of the store are accepted without going up to a root
+        store.set_flags(m2.X509_V_FLAG_PARTIAL_CHAIN)
+        self._store = store
+
+    def verify(self, source: Source, name: str | None = None) -> VerificationResult:
+        """
+        verifies one .pkpass file
+
+        :param source: path or content of the file
+        :param name: name of the file in the result, defaults to the path
+        """
+        if name is None:
+            name = "<bytes>" if isinstance(source, (bytes, bytearray)) else str(source)
+        size = 0
+        try:
+            size = len(source) if isinstance(source, (bytes, bytearray)) else os.path.getsize(source)
+            with PassFile(source) as passfile:
+                return self._verify(passfile, name, size)
+        except Exception as e:
+            # unreadable archives are reported like invalid ones, a bulk verification goes on
+            return VerificationResult(name, size, errors=(f"{type(e).__name__}: {e}",))
+
+    def _verify(self, passfile: PassFile, name: str, size: int) -> VerificationResult:
+        errors = []
+        manifest_data = passfile.read("manifest.json")
+        manifest = json.loads(manifest_data)
+        if not isinstance(manifest, dict):
+            raise ValueError("manifest.json is no object")
+
+        entries = [n for n in passfile.names if n not in UNSIGNED_FILES and not n.endswith("/")]
+        mismatched = []
+        for entry in entries:
+            if entry in manifest and _sha1(passfile, entry) != manifest[entry]:
+                mismatched.append(entry)
+        missing = sorted(set(manifest) - set(entries))
+        extra = sorted(set(entries) - set(manifest))
+
+        signature_valid = chain_valid = False
+        if "signature" not in passfile.names:
+            errors.append("signature: missing")
+        else:
+            signature = passfile.read("signature")
+            try:
+                self._verify_signature(signature, manifest_data, chain=True)
+                signature_valid = chain_valid = True
+            except SMIME.PKCS7_Error as e:
+                errors.append(f"chain: {e}")
+                try:
+                    self._verify_signature(signature, manifest_data, chain=False)
+                    signature_valid = True
+                except SMIME.PKCS7_Error as e:
+                    errors.append(f"signature: {e}")
+
+        return VerificationResult(
+            name,
+            size,
+            manifest_valid=not (mismatched or missing or extra),
+            signature_valid=signature_valid,
+            chain_valid=chain_valid,
+            mismatched=tuple(mismatched),
+            missing=tuple(missing),
+            extra=tuple(extra),
+            errors=tuple(errors),
+        )
+
+    def _verify_signature(self, signature: bytes, manifest: bytes, chain: bool):
+        """raises SMIME.PKCS7_Error if the signature is invalid"""
+        smime = SMIME.SMIME()
+        smime.set_x509_store(self._store)
+        # the certificates are taken from the signature
+        smime.set_x509_stack(X509.X509_Stack())
+        p7 = SMIME.load_pkcs7_bio_der(BIO.MemoryBuffer(signature))
+        flags = SMIME.PKCS7_DETACHED | SMIME.PKCS7_BINARY
+        if not chain:
+            flags |= SMIME.PKCS7_NOVERIFY
+        smime.verify(p7, BIO.MemoryBuffer(manifest), flags=flags)
+
+    def verify_many(
+        self,
+        sources: typing.Iterable[Source],
+        *,
+        workers: int | None = None,
+        window: int | None = None,
+        processes: bool = False,
+        mp_context=None,
+        stats: VerificationStats | None = None,
+    ) -> typing.Iterator[VerificationResult]:
+        """
+        verifies many .pkpass files in parallel and yields the results in the order they are finished.
+
+        data given as bytes is named #index in the results.
+        sources is consumed lazily, at most `window` files are pending at any time.
+
+        :param workers: number of threads or processes, defaults to the number of cpus
+        :param window: maximum number of files in flight, defaults to 4 * workers
+        :param processes: verify in a process pool instead of threads, the verifier
+            is sent to each worker once and loads the trust store there
+        :param mp_context: multiprocessing context for the process pool
+        :param stats: counts the results and measures the throughput
+        """
+        workers = workers or os.cpu_count() or 1
+        window = window or 4 * workers
+        sources = enumerate(sources)
+        pending = set()
+        if processes:
+            executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers, mp_context=mp_context, initializer=_init_worker, initargs=(self,)
+            )
+            verify = _verify_in_worker
+        else:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+            verify = self.verify
+        try:
+            while True:
+                for index, source in itertools.islice(sources, window - len(pending)):
+                    name = f"#{index}" if isinstance(source, (bytes, bytearray)) else str(source)
+                    pending.add(executor.submit(verify, source, name))
+                if not pending:
+                    break
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    if stats is not None:
+                        stats.add(result)
+                    yield result
+        finally:
+            executor.shutdown(cancel_futures=True)
+            if stats is not None:
+                stats.finished = time.perf_counter()
+
+    def verify_directory(self, directory: PathLike, pattern: str = "**/*.pkpass", **kwargs) -> typing.Iterator[VerificationResult]:
+        """verifies all files in `directory` matching `pattern`, takes the arguments of verify_many"""
+        return self.verify_many(sorted(Path(directory).glob(pattern)), **kwargs)
+
+
+_worker_verifier: PassVerifier | None = None
+
+
+def _init_worker(verifier: PassVerifier):
+    global _worker_verifier
+    _worker_verifier = verifier
+
+
+def _verify_in_worker(source: Source, name: str) -> VerificationResult:
+    return _worker_verifier.verify(source, name)
+
+
+def _sha1(passfile: PassFile, name: str) -> str:
+    """hashes an entry while it is decompressed, without reading it into memory"""
+    sha1 = hashlib.sha1()
+    with passfile.zipfile.open(name) as entry:
+        while chunk := entry.read(CHUNK_SIZE):
+            sha1.update(chunk)
+    return sha1.hexdigest()
@@ -0,0 +1,133 @@
+"""
+a local stand-in for APNs: HTTP/2 over TLS, requiring a client certificate.
+
+the response depends on the push token:
+- bad...: 400 BadDeviceToken
+- gone...: 410 Unregistered
+- busy...: 429 TooManyRequests for the first attempt, then 200
+- down...: 503 ServiceUnavailable
+- everything else: 200
+"""
+
+import asyncio
+from collections import Counter
+import json
+import ssl
+import threading
+import uuid
+
+import h2.config
+import h2.connection
+import h2.events
+import h2.settings
+
+
+class StandInAPNs:
+    """
+    runs the server in a thread with its own event loop, use as context manager
+
+    :param certificate: server certificate and key
+    :param client_ca: the client certificates must be issued by it
+    :param delay: seconds before a response is sent, so concurrent requests overlap
+    """
+
+    def __init__(self, certificate, key, client_ca, delay: float = 0.005):
+        self.context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH, cafile=str(client_ca))
+        self.context.verify_mode = ssl.CERT_REQUIRED
+        self.context.load_cert_chain(str(certificate), str(key))
+        self.context.set_alpn_protocols(["h2"])
+        self.delay = delay
+        self.connections = 0
+        self.requests: list[tuple[str, dict[str, str]]] = []
+        """(path, headers) of the received requests"""
+        self.attempts: Counter[str] = Counter()
+        self.max_concurrent = 0
+        """maximum number of requests pending at once on one connection"""
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+
+    def __enter__(self) -> "StandInAPNs":
+        self._thread.start()
+        self._server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self._handle, "127.0.0.1", 0, ssl=self.context), self._loop
+        ).result()
+        return self
+
+    def __exit__(self, *exc):
+        async def stop():
+            self._server.close()
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    @property
+    def url(self) -> str:
+        port = self._server.sockets[0].getsockname()[1]
+        return f"https://localhost:{port}"
+
+    def response(self, token: str) -> tuple[int, str]:
+        self.attempts[token] += 1
+        if token.startswith("bad"):
+            return 400, "BadDeviceToken"
+        if token.startswith("gone"):
+            return 410, "Unregistered"
+        if token.startswith("busy") and self.attempts[token] == 1:
+            return 429, "TooManyRequests"
+        if token.startswith("down"):
+            return 503, "ServiceUnavailable"
+        return 200, ""
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        connection = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False))
+        connection.local_settings = h2.settings.Settings(
+            client=False, initial_values={h2.settings.SettingCodes.MAX_CONCURRENT_STREAMS: 1000}
+        )
+        connection.initiate_connection()
+        writer.write(connection.data_to_send())
+        headers: dict[int, dict[str, str]] = {}
+        pending = set()
+
+        async def respond(stream_id: int):
+            await asyncio.sleep(self.delay)
+            request = headers.pop(stream_id)
+            path = request[":path"]
+            self.requests.append((path, request))
+            status, reason = self.response(path.rsplit("/", 1)[-1])
+            body = json.dumps({"reason": reason}).encode() if reason else b""
+            connection.send_headers(
+                stream_id,
+                [(":status", str(status)), ("apns-id", str(uuid.uuid4())), ("content-length", str(len(body)))],
+                end_stream=not body,
+            )
+            if body:
+                connection.send_data(stream_id, body, end_stream=True)
+            writer.write(connection.data_to_send())
+
+        try:
+            while data := await reader.read(65536):
+                for event in connection.receive_data(data):
+                    if isinstance(event, h2.events.RequestReceived):
+                        headers[event.stream_id] = {
+                            (k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+                            for k, v in event.headers
+                        }
+                    elif isinstance(event, h2.events.DataReceived):
+                        connection.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                    elif isinstance(event, h2.events.StreamEnded):
+                        task = asyncio.ensure_future(respond(event.stream_id))
+                        pending.add(task)
+                        task.add_done_callback(pending.discard)
+                        self.max_concurrent = max(self.max_concurrent, len(pending))
+                    elif isinstance(event, h2.events.ConnectionTerminated):
+                        return
+                writer.write(connection.data_to_send())
+                await writer.drain()
+        except (ConnectionError, ssl.SSLError):
+            pass
+        finally:
+            for task in pending:
+                task.cancel()
+            writer.close()
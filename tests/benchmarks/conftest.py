@@ -0,0 +1,114 @@
+import functools
+import hashlib
+import json
+from pathlib import Path
+import timeit
+import warnings
+import zlib
+
+import pytest
+
+from edutap.models_apple.signing import PassSigner
+
+
+baselines_file = Path(__file__).parent / "baselines.json"
+
+_results: list[tuple[str, float, str]] = []
+
+
+CALIBRATION = "calibration"
+"""key of the calibration workload in baselines.json"""
+
+_CALIBRATION_DATA = {"fields": [{"key": f"field{i}", "label": f"label {i}", "value": i * 1.5} for i in range(200)]}
+
+
+class BenchmarkRegression(UserWarning):
+    """a benchmark is slower than its baseline, scaled to this machine, times the tolerance"""
+
+
+def _best(function, repeat: int = 5) -> float:
+    """the best time of one call in seconds"""
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def _calibration_workload():
+    # serializing, hashing and compressing, like building a pass
+    data = json.dumps(_CALIBRATION_DATA).encode("utf-8")
+    hashlib.sha1(data).hexdigest()
+    zlib.compress(data, 6)
+
+
+@functools.cache
+def calibration() -> float:
+    """the time of the calibration workload on this machine, measured once per run"""
+    return _best(_calibration_workload, repeat=7)
+
+
+class Bench:
+    """
+    times a function and records the result for the summary.
+
+    the baselines were recorded on another machine, they are scaled by the time of the
+    calibration workload here relative to its time there (baselines["calibration"]).
+    """
+
+    def __init__(self, baselines: dict[str, float] | None = None, tolerance: float = 2.0, strict: bool = False):
+        self.baselines = baselines or {}
+        self.tolerance = tolerance
+        self.strict = strict
+        reference = self.baselines.get(CALIBRATION)
+        self.scale = calibration() / reference if reference else 1.0
+
+    def __call__(self, name: str, function, repeat: int = 5, info: str = "") -> float:
+        """
+        warns, or fails if strict, if the function got slower than `tolerance` times its scaled baseline
+
+        :param info: extra text shown next to the timing, e.g. a size
+        :return: the best time of one call in seconds
+        """
+        best = _best(function, repeat)
+        _results.append((name, best, info))
+        baseline = self.baselines.get(name)
+        if baseline is not None and best > baseline * self.scale * self.tolerance:
+            message = (
+                f"{name} took {best * 1e6:.1f} µs, baseline is {baseline * self.scale * 1e6:.1f} µs on this machine "
+                f"({baseline * 1e6:.1f} µs recorded, scaled by {self.scale:.2f}, tolerance {self.tolerance}x)"
+            )
+            if self.strict:
+                pytest.fail(message)
+            warnings.warn(BenchmarkRegression(message), stacklevel=2)
+        return best
+
+
+@pytest.fixture
+def bench(request):
+    config = request.config
+    if config.getoption("--benchmark-save") or not baselines_file.exists():
+        return Bench()
+    return Bench(
+        json.loads(baselines_file.read_text()),
+        config.getoption("--benchmark-tolerance"),
+        config.getoption("--benchmark-strict"),
+    )
+
+
+@pytest.fixture(scope="session")
+def signer(certificate_chain) -> PassSigner:
+    return PassSigner(*certificate_chain)
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    if not _results:
+        return
+    terminalreporter.section("benchmarks")
+    width = max(len(name) for name, _, _ in _results)
+    for name, seconds, info in _results:
+        terminalreporter.write_line(f"{name:<{width}}  {seconds * 1e6:12.1f} µs  {1 / seconds:12.0f} /s  {info}".rstrip())
+    if config.getoption("--benchmark-save"):
+        baselines = json.loads(baselines_file.read_text()) if baselines_file.exists() else {}
+        baselines.update({name: seconds for name, seconds, _ in _results})
+        baselines[CALIBRATION] = calibration()
+        baselines_file.write_text(json.dumps(baselines, indent=4, sort_keys=True) + "\n")
+        terminalreporter.write_line(f"baselines written to {baselines_file}")
@@ -0,0 +1,71 @@
+import tracemalloc
+
+import pytest
+
+from common import passes
+from edutap.models_apple.batch import PassBatch
+from edutap.models_apple.template import PassTemplate
+
+
+pytestmark = pytest.mark.benchmark
+
+count = 10_000
+
+columns = {
+    "serialNumber": "/serialNumber",
+    "message": "/barcodes/0/message",
+    "balance": "/storeCard/primaryFields/0/value",
+    "voided": "/voided",
+}
+
+
+@pytest.fixture(scope="module")
+def template():
+    with open(passes / "StoreCard.pkpass", "rb") as f:
+        return PassTemplate.from_passfile(f, template_identifier="bench", backoffice_identifier="bench").compile()
+
+
+def rows():
+    return ({"serialNumber": f"S{i:08}", "message": f"M{i:08}", "balance": float(i)} for i in range(count))
+
+
+def allocated(function) -> int:
+    tracemalloc.start()
+    try:
+        result = function()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return size
+
+
+def test_batch_memory(bench, template):
+    def batch():
+        batch = PassBatch(template, columns, trusted=True)
+        batch.extend(rows())
+        return batch
+
+    def pass_objects():
+        return [
+            template.create_pass_object(
+                serial_number=row["serialNumber"],
+                pass_patches=[
+                    {"op": "replace", "path": columns["message"], "value": row["message"]},
+                    {"op": "replace", "path": columns["balance"], "value": row["balance"]},
+                ],
+                trusted=True,
+            )
+            for row in rows()
+        ]
+
+    batch_size = allocated(batch) / count
+    passes_size = allocated(pass_objects) / count
+    filled = batch()
+    bench("batch materialize one pass", lambda: filled[count // 2], info=f"{batch_size:.0f} bytes/pass in the batch")
+    bench(
+        "batch masked update",
+        lambda: filled.set("voided", True, where=filled.where("balance", lambda b: b > count / 2)),
+        info=f"{passes_size:.0f} bytes/pass as Pass objects",
+    )
+    assert batch_size * 10 < passes_size
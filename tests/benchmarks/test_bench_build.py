@@ -0,0 +1,117 @@
+"""
+timings of the stages of building a .pkpass file, for passes of different sizes
+
+run with `pytest --benchmark tests/benchmarks`, add `--benchmark-save` to store the
+results as baselines, later runs fail if a stage got slower than its baseline
+"""
+import io
+import random
+
+import pytest
+
+from common import resources
+from edutap.models_apple.models import Barcode, Field, Pass, StoreCard
+from edutap.models_apple.template import PassTemplate
+
+
+pytestmark = pytest.mark.benchmark
+
+
+def create_pass(fields: int, attachments: int, languages: int) -> Pass:
+    card = StoreCard()
+    card.addPrimaryField("name", "Jähn Doe", "Name")
+    for i in range(fields):
+        if i < 2:
+            card.addSecondaryField(f"secondary{i}", f"value {i}", f"label {i}")
+        card.addBackField(f"back{i}", f"back value {i} " * 5, f"back label {i}")
+    passfile = Pass(
+        storeCard=card,
+        organizationName="Org Name",
+        passTypeIdentifier="pass.benchmark",
+        teamIdentifier="TEAMID",
+        description="A Sample Pass",
+        barcodes=[Barcode(message="test barcode", altText="alternate text")],
+    )
+    images = [open(resources / name, "rb").read() for name in ("white_square.png", "edutap.png", "eaie-hero.jpg")]
+    rng = random.Random(attachments)
+    for i in range(attachments):
+        if i < len(images):
+            passfile.addFile(("icon.png", "logo.png", "strip.jpg")[i], images[i])
+        else:
+            # incompressible stand-ins for further images
+            passfile.addFile(f"image{i}.png", rng.randbytes(20_000))
+    for i in range(languages):
+        passfile.addFile(f"l{i}.lproj/pass.strings", b'"label" = "translated label";\n' * 50)
+    return passfile
+
+
+sizes = {
+    "small": dict(fields=1, attachments=1, languages=0),
+    "typical": dict(fields=10, attachments=3, languages=2),
+    "large": dict(fields=200, attachments=40, languages=20),
+}
+
+
+@pytest.fixture(scope="module", params=list(sizes))
+def build(request, signer):
+    """a pass of the given size with the outputs of all stages"""
+    passfile = create_pass(**sizes[request.param])
+    pass_json = passfile._serialize()
+    manifest = passfile._createManifest(pass_json)
+    signature = passfile._createSignature(manifest, signer=signer)
+    pkpass = passfile.create(signer=signer).getvalue()
+    return request.param, passfile, pass_json, manifest, signature, pkpass
+
+
+def test_construction(bench, build):
+    size, passfile, *_ = build
+    data = passfile.pass_dict
+    bench(f"build {size} Pass construction", lambda: Pass.model_validate(data))
+
+
+def test_pass_json(bench, build):
+    size, passfile, *_ = build
+    bench(f"build {size} pass_json", lambda: passfile.pass_json)
+
+
+def test_create_manifest(bench, build):
+    size, passfile, pass_json, *_ = build
+    bench(f"build {size} _createManifest", lambda: passfile._createManifest(pass_json))
+
+
+def test_create_signature(bench, build, signer):
+    size, passfile, _, manifest, *_ = build
+    bench(f"build {size} _createSignature", lambda: passfile._createSignature(manifest, signer=signer))
+
+
+def test_create_zip(bench, build):
+    size, passfile, pass_json, manifest, signature, pkpass = build
+    bench(
+        f"build {size} _createZip",
+        lambda: passfile._createZip(manifest, signature, zip_file=io.BytesIO(), pass_json=pass_json),
+        info=f"{len(pkpass)} bytes",
+    )
+
+
+def test_create(bench, build, signer):
+    size, passfile, *_ = build
+
+    def create():
+        passfile.mark_dirty()
+        return passfile.create(signer=signer)
+
+    bench(f"build {size} create", create)
+
+
+def test_create_pass_object(bench, build):
+    size, *_, pkpass = build
+    template = PassTemplate.from_passfile(pkpass, template_identifier="bench", backoffice_identifier="bench")
+    bench(f"build {size} create_pass_object", lambda: template.create_pass_object(serial_number="1234"))
+
+
+def test_from_passfile(bench, build):
+    size, *_, pkpass = build
+    bench(
+        f"build {size} from_passfile",
+        lambda: PassTemplate.from_passfile(pkpass, template_identifier="bench", backoffice_identifier="bench"),
+    )
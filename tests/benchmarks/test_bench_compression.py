@@ -0,0 +1,48 @@
+import io
+import zipfile
+
+import pytest
+
+from common import create_shell_pass, resources
+from edutap.models_apple.compression import DEFAULT_COMPRESSION, NO_COMPRESSION, CompressionPolicy
+from edutap.models_apple.models import Field
+
+
+pytestmark = pytest.mark.benchmark
+
+
+@pytest.fixture(scope="module")
+def passfile():
+    passfile = create_shell_pass()
+    for i in range(30):
+        passfile.passInformation.backFields.append(Field(key=f"back{i}", label=f"label {i}", value=f"value {i} " * 10))
+    for name in ("icon.png", "icon@2x.png", "logo.png"):
+        passfile.addFile(name, open(resources / "edutap.png", "rb"))
+    passfile.addFile("strip.jpg", open(resources / "eaie-hero.jpg", "rb"))
+    for language in ("de", "en", "fr"):
+        passfile.addFile(f"{language}.lproj/pass.strings", b'"label" = "translated label";\n' * 100)
+    return passfile
+
+
+@pytest.mark.parametrize(
+    "name, policy",
+    [
+        ("stored", NO_COMPRESSION),
+        ("default", DEFAULT_COMPRESSION),
+        ("default level 1", CompressionPolicy(level=1)),
+        ("default level 9", CompressionPolicy(level=9)),
+        ("deflate all", CompressionPolicy(default_method=zipfile.ZIP_DEFLATED, methods={})),
+    ],
+)
+def test_zip_compression(bench, passfile, name, policy):
+    """archive size vs. time to write the zip, signing is left out as it does not depend on the policy"""
+    manifest = passfile._createManifest()
+    signature = b"\0" * 3000
+
+    def build():
+        zip_file = io.BytesIO()
+        passfile._createZip(manifest, signature, zip_file=zip_file, compression=policy)
+        return zip_file
+
+    size = len(build().getvalue())
+    bench(f"zip {name}", build, info=f"{size} bytes")
@@ -0,0 +1,35 @@
+"""
+hashing the attachments of a pass for the manifest, sequentially and on the thread pool
+"""
+import hashlib
+import os
+
+import pytest
+
+from edutap.models_apple.attachments import attachment_store
+from edutap.models_apple.hashing import hash_attachments, sha1_file
+
+
+pytestmark = pytest.mark.benchmark
+
+
+@pytest.fixture
+def no_store(monkeypatch):
+    """the attachments are hashed every time instead of being taken from the store"""
+    monkeypatch.setattr(attachment_store, "cached_sha1", lambda data: None)
+    monkeypatch.setattr(attachment_store, "sha1", lambda data: hashlib.sha1(data).hexdigest())
+
+
+@pytest.mark.parametrize("size", [16 * 1024, 2 * 1024 * 1024])
+def test_hash_attachments(bench, no_store, size):
+    # e.g. strip and background images at @1x, @2x and @3x
+    files = {f"image{i}.png": os.urandom(size) for i in range(6)}
+    info = f"6 x {size // 1024} KiB"
+    bench(f"hash attachments {size // 1024} KiB sequential", lambda: hash_attachments(files, threshold=2**62), info=info)
+    bench(f"hash attachments {size // 1024} KiB", lambda: hash_attachments(files), info=info)
+
+
+def test_sha1_file(bench, tmp_path):
+    path = tmp_path / "background@3x.png"
+    path.write_bytes(os.urandom(8 * 1024 * 1024))
+    bench("sha1_file 8 MiB", lambda: sha1_file(path), info="8 MiB")
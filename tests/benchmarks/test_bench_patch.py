@@ -0,0 +1,64 @@
+import jsonpatch
+import pytest
+
+from common import passes
+from edutap.models_apple.patch import PatchPlan
+from edutap.models_apple.template import PassTemplate
+
+
+pytestmark = pytest.mark.benchmark
+
+
+@pytest.fixture(scope="module")
+def template():
+    with open(passes / "StoreCard.pkpass", "rb") as f:
+        template = PassTemplate.from_passfile(f, template_identifier="bench", backoffice_identifier="bench")
+    # a typical pass carries a number of back fields
+    for i in range(30):
+        template.pass_json["storeCard"]["backFields"].append({"key": f"back{i}", "label": "label", "value": "text " * 20})
+    return template
+
+
+patches = [
+    {"path": "/serialNumber", "op": "add", "value": "1234"},
+    {"path": "/barcodes/0/message", "op": "replace", "value": "new barcode message"},
+    {"path": "/storeCard/primaryFields/0/value", "op": "replace", "value": "Jane Doe"},
+]
+
+
+def test_patch_apply(template, bench):
+    expected = jsonpatch.apply_patch(template.pass_json, patches)
+    plan = PatchPlan(patches)
+    assert plan.apply(template.pass_json) == expected
+
+    values = PatchPlan.values(patches)
+    jsonpatch_time = bench("patch: jsonpatch.apply_patch", lambda: jsonpatch.JsonPatch(patches).apply(template.pass_json))
+    plan_time = bench("patch: PatchPlan.apply", lambda: plan.apply(template.pass_json, values))
+    assert plan_time < jsonpatch_time
+
+
+def test_create_pass_object(template, bench):
+    compiled = template.compile()
+    kwargs = dict(
+        serial_number="1234",
+        pass_patches=[{"path": "/barcodes/0/message", "op": "replace", "value": "new barcode message"}],
+        passinfo_patches=[{"path": "/primaryFields/0/value", "op": "replace", "value": "Jane Doe"}],
+    )
+    assert compiled.create_pass_object(**kwargs).pass_json == template.create_pass_object(**kwargs).pass_json
+
+    bench("create_pass_object: PassTemplate (jsonpatch)", lambda: template.create_pass_object(**kwargs))
+    bench("create_pass_object: CompiledPassTemplate (PatchPlan)", lambda: compiled.create_pass_object(**kwargs))
+
+
+def test_create_pass_object_trusted(template, bench):
+    compiled = template.compile()
+    kwargs = dict(
+        serial_number="1234",
+        pass_patches=[{"path": "/barcodes/0/message", "op": "replace", "value": "new barcode message"}],
+        passinfo_patches=[{"path": "/primaryFields/0/value", "op": "replace", "value": "Jane Doe"}],
+    )
+    assert compiled.create_pass_object(trusted=True, **kwargs).pass_json == compiled.create_pass_object(**kwargs).pass_json
+
+    validated = bench("create_pass_object: 30 back fields, validated", lambda: compiled.create_pass_object(**kwargs))
+    trusted = bench("create_pass_object: 30 back fields, trusted", lambda: compiled.create_pass_object(trusted=True, **kwargs))
+    assert trusted < validated
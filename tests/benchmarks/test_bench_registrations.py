@@ -0,0 +1,66 @@
+import time
+
+import pytest
+
+from edutap.models_apple.registrations import InMemoryRegistrationStore, Registration, SQLiteRegistrationStore
+
+
+pytestmark = pytest.mark.benchmark
+
+PASS_TYPE = "pass.org.edutap.bench"
+devices = 250_000
+passes_per_device = 4
+"""a million registrations"""
+
+
+def registrations():
+    for device in range(devices):
+        for index in range(passes_per_device):
+            yield Registration(f"device{device:06}", PASS_TYPE, f"S{device:06}-{index}", f"token{device:06}")
+
+
+def fill(store):
+    started = time.perf_counter()
+    store.register_many(registrations())
+    # every 10th pass was updated since the devices registered
+    for device in range(0, devices, 10):
+        store.touch(PASS_TYPE, f"S{device:06}-{device % passes_per_device}")
+    return time.perf_counter() - started
+
+
+@pytest.fixture(scope="module", params=["memory", "sqlite"])
+def store(request, tmp_path_factory):
+    if request.param == "memory":
+        store = InMemoryRegistrationStore()
+    else:
+        store = SQLiteRegistrationStore(str(tmp_path_factory.mktemp("registrations") / "registrations.sqlite"))
+    seconds = fill(store)
+    assert len(store) == devices * passes_per_device
+    return request.param, store, seconds
+
+
+def test_registration_lookups(bench, store):
+    name, store, seconds = store
+    device = "device123450"
+    tag = store.tag(PASS_TYPE, "S123450-2") - 1
+    assert store.updated_since(device, PASS_TYPE, tag) == (["S123450-2"], tag + 1)
+    bench(
+        f"registrations {name} updated_since",
+        lambda: store.updated_since(device, PASS_TYPE, tag),
+        info=f"{devices * passes_per_device} registrations filled in {seconds:.1f} s",
+    )
+    bench(f"registrations {name} push_tokens", lambda: store.push_tokens(PASS_TYPE, "S123450-2"))
+    bench(f"registrations {name} touch", lambda: store.touch(PASS_TYPE, "S000001-1"))
+
+
+def test_registration_scan_reference(bench):
+    """the query as a scan over all registrations, for comparison"""
+    tags = {f"S{device:06}-{device % passes_per_device}": device + 1 for device in range(0, devices, 10)}
+    rows = [(*registration, tags.get(registration.serial_number, 0)) for registration in registrations()]
+    device, tag = "device123450", tags["S123450-2"] - 1
+
+    def scan():
+        return [row[2] for row in rows if row[0] == device and row[1] == PASS_TYPE and row[4] > tag]
+
+    assert scan() == ["S123450-2"]
+    bench("registrations scan updated_since", scan, repeat=3)
@@ -0,0 +1,21 @@
+import uuid
+
+import pytest
+import shortuuid
+
+from edutap.models_apple.serials import RandomSerials, SequentialSerials, TimeOrderedSerials
+
+
+pytestmark = pytest.mark.benchmark
+
+
+def test_serial_allocation(bench):
+    uuid4 = bench("serials uuid4 + shortuuid.encode", lambda: shortuuid.encode(uuid.uuid4()))
+    for name, allocator in (
+        ("random", RandomSerials()),
+        ("time ordered", TimeOrderedSerials()),
+        ("sequential", SequentialSerials()),
+    ):
+        best = bench(f"serials {name} allocate", allocator.allocate)
+        bench(f"serials {name} allocate_many(1000)", lambda: allocator.allocate_many(1000))
+        assert best < uuid4
@@ -0,0 +1,36 @@
+"""
+signing manifests with the signing backends: latency of one signature and throughput
+of signing from several threads (both libraries release the GIL while OpenSSL signs)
+"""
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+import pytest
+
+from edutap.models_apple.signing import PassSigner
+from edutap.models_apple.signing_backends import BACKENDS
+
+
+pytestmark = pytest.mark.benchmark
+
+MANIFEST = b'{"pass.json": "%s", "icon.png": "%s"}' % (b"0" * 40, b"1" * 40)
+SIGNATURES = 256
+
+
+@pytest.mark.parametrize("backend", sorted(BACKENDS))
+def test_signing_backend(bench, certificate_chain, backend):
+    if backend == "cryptography":
+        pytest.importorskip("cryptography")
+    signer = PassSigner(*certificate_chain, backend=backend)
+    for signed_attributes in (True, False):
+        suffix = "" if signed_attributes else " without attributes"
+        bench(f"sign {backend}{suffix}", lambda: signer.sign_der(MANIFEST, signed_attributes=signed_attributes))
+
+    workers = os.cpu_count() or 1
+    with ThreadPoolExecutor(workers) as executor:
+        bench(
+            f"sign {backend} {SIGNATURES} in threads",
+            lambda: list(executor.map(lambda _: signer.sign_der(MANIFEST), range(SIGNATURES))),
+            repeat=3,
+            info=f"{workers} threads",
+        )
@@ -1,7 +1,10 @@
+from datetime import datetime, timedelta, timezone
 import os
 from pathlib import Path
 import uuid
 
+from M2Crypto import ASN1, EVP, RSA, X509
+
 from edutap.models_apple.models import (
     Barcode,
     BarcodeFormat,
@@ -84,3 +87,113 @@ def create_shell_pass_loyalty(
 
     passfile.barcode = stdBarcode
     return passfile
+
+
+PASS_TYPE_IDENTIFIER = "pass.org.edutap.tests"
+"""pass type identifier of the certificate created by create_certificate_chain"""
+
+
+def _name(common_name: str, uid: str | None = None) -> X509.X509_Name:
+    name = X509.X509_Name()
+    name.O = "edutap tests"
+    name.CN = common_name
+    if uid:
+        # pass certificates have the pass type identifier as user id
+        name.add_entry_by_txt("UID", ASN1.MBSTRING_ASC, uid, -1, -1, 0)
+    return name
+
+
+def _certificate(
+    subject: str,
+    key: EVP.PKey,
+    issuer: X509.X509 | None,
+    issuer_key: EVP.PKey,
+    alt_names: str | None = None,
+    uid: str | None = None,
+    ca: bool = False,
+) -> X509.X509:
+    """creates a certificate for `key`, self-signed (and a ca) if no issuer is given"""
+    now = datetime.now(timezone.utc)
+    not_before, not_after = ASN1.ASN1_TIME(), ASN1.ASN1_TIME()
+    not_before.set_datetime(now - timedelta(days=1))
+    not_after.set_datetime(now + timedelta(days=30))
+
+    cert = X509.X509()
+    cert.set_version(2)
+    cert.set_serial_number(int(now.timestamp() * 1000) + (issuer is None))
+    cert.set_subject(_name(subject, uid))
+    cert.set_issuer(_name(subject) if issuer is None else issuer.get_subject())
+    cert.set_pubkey(key)
+    cert.set_not_before(not_before)
+    cert.set_not_after(not_after)
+    cert.add_ext(X509.new_extension("basicConstraints", "CA:TRUE" if issuer is None or ca else "CA:FALSE", critical=1))
+    if alt_names:
+        cert.add_ext(X509.new_extension("subjectAltName", alt_names))
+    cert.sign(issuer_key, "sha256")
+    return cert
+
+
+def _key() -> EVP.PKey:
+    key = EVP.PKey()
+    key.assign_rsa(RSA.gen_key(2048, 65537, callback=lambda *args: None))
+    return key
+
+
+def create_certificate_chain(directory: Path) -> tuple[Path, Path, Path]:
+    """
+    creates a certificate chain for signing passes without apple certificates:
+    a self-signed ca standing in for the wwdr certificate and a pass certificate issued by it
+
+    :return: paths of the pass certificate, its unencrypted key and the ca certificate
+    """
+    ca_key = _key()
+    ca = _certificate("test wwdr", ca_key, None, ca_key)
+    key = _key()
+    cert = _certificate("test pass certificate", key, ca, ca_key, uid=PASS_TYPE_IDENTIFIER)
+
+    paths = directory / "certificate.pem", directory / "private.key", directory / "wwdr_certificate.pem"
+    cert.save_pem(str(paths[0]))
+    key.save_key(str(paths[1]), cipher=None)
+    ca.save_pem(str(paths[2]))
+    return paths
+
+
+def create_rooted_certificate_chain(directory: Path) -> tuple[Path, Path, Path, Path]:
+    """
+    creates a certificate chain like the one of apple: a self-signed root standing in for the
+    apple root ca, an intermediate wwdr certificate issued by it and a pass certificate issued by that
+
+    :return: paths of the pass certificate, its unencrypted key, the wwdr certificate and the root certificate
+    """
+    root_key = _key()
+    root = _certificate("test root", root_key, None, root_key)
+    wwdr_key = _key()
+    wwdr = _certificate("test intermediate wwdr", wwdr_key, root, root_key, ca=True)
+    key = _key()
+    cert = _certificate("test pass certificate", key, wwdr, wwdr_key, uid=PASS_TYPE_IDENTIFIER)
+
+    paths = (
+        directory / "certificate.pem",
+        directory / "private.key",
+        directory / "wwdr_certificate.pem",
+        directory / "root_certificate.pem",
+    )
+    cert.save_pem(str(paths[0]))
+    key.save_key(str(paths[1]), cipher=None)
+    wwdr.save_pem(str(paths[2]))
+    root.save_pem(str(paths[3]))
+    return paths
+
+
+def create_server_certificate(directory: Path) -> tuple[Path, Path]:
+    """
+    creates a self-signed certificate for a tls server on localhost
+
+    :return: paths of the certificate and its unencrypted key
+    """
+    key = _key()
+    cert = _certificate("localhost", key, None, key, alt_names="DNS:localhost,IP:127.0.0.1")
+    paths = directory / "server.pem", directory / "server.key"
+    cert.save_pem(str(paths[0]))
+    key.save_key(str(paths[1]), cipher=None)
+    return paths
@@ -0,0 +1,42 @@
+import pytest
+
+from common import create_certificate_chain
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--benchmark", action="store_true", default=False, help="run the benchmarks in tests/benchmarks"
+    )
+    parser.addoption(
+        "--benchmark-save",
+        action="store_true",
+        default=False,
+        help="store the benchmark results as new baselines in tests/benchmarks/baselines.json",
+    )
+    parser.addoption(
+        "--benchmark-tolerance",
+        type=float,
+        default=2.0,
+        help="a benchmark warns if it is slower than its baseline, scaled to this machine, times this factor",
+    )
+    parser.addoption(
+        "--benchmark-strict",
+        action="store_true",
+        default=False,
+        help="fail benchmarks slower than their baselines instead of warning",
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--benchmark"):
+        return
+    skip = pytest.mark.skip(reason="benchmarks only run with --benchmark")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope="session")
+def certificate_chain(tmp_path_factory):
+    """a locally generated certificate chain, see common.create_certificate_chain"""
+    return create_certificate_chain(tmp_path_factory.mktemp("certs"))
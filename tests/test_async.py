@@ -0,0 +1,131 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import gc
+import io
+import threading
+import time
+import zipfile
+
+import pytest
+
+from common import cert_file, create_shell_pass, key_file, passes, password_file, wwdr_file
+from edutap.models_apple import aio
+from edutap.models_apple.models import Pass
+from edutap.models_apple.signing import PassSigner
+from edutap.models_apple.template import PassTemplate
+
+
+@pytest.fixture
+def password():
+    with open(password_file) as file_:
+        return file_.read().strip()
+
+
+@pytest.fixture
+def signer(password):
+    return PassSigner(cert_file, key_file, wwdr_file, password)
+
+
+def entries(pkpass: io.BytesIO) -> set[str]:
+    with zipfile.ZipFile(pkpass) as zf:
+        return set(zf.namelist())
+
+
+def test_create_async(password):
+    passfile = create_shell_pass()
+    pkpass = asyncio.run(passfile.create_async(cert_file, key_file, wwdr_file, password))
+    assert entries(pkpass) == {"signature", "manifest.json", "pass.json"}
+
+
+def test_event_loop_stays_responsive(signer):
+    """a heartbeat task keeps running while a batch of passes is signed"""
+    passfiles = [create_shell_pass() for _ in range(100)]
+
+    async def main():
+        gaps = []
+        done = asyncio.Event()
+
+        async def heartbeat():
+            last = time.perf_counter()
+            while not done.is_set():
+                await asyncio.sleep(0.001)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+
+        beat = asyncio.create_task(heartbeat())
+        started = time.perf_counter()
+        with ThreadPoolExecutor(4) as executor:
+            pkpasses = await asyncio.gather(*(p.create_async(signer=signer, executor=executor) for p in passfiles))
+        duration = time.perf_counter() - started
+        done.set()
+        await beat
+        return pkpasses, gaps, duration
+
+    # garbage collections of the objects left by earlier tests would pause the loop as well,
+    # they are not what is measured here
+    gc.collect()
+    gc.disable()
+    try:
+        pkpasses, gaps, duration = asyncio.run(main())
+    finally:
+        gc.enable()
+    assert len(pkpasses) == 100
+    assert all("signature" in entries(pkpass) for pkpass in pkpasses)
+    # the loop was never blocked for a large part of the batch
+    assert len(gaps) > 5
+    assert max(gaps) < max(0.05, duration / 4)
+
+
+def test_concurrency_limit(monkeypatch, signer):
+    running = 0
+    most = 0
+    lock = threading.Lock()
+
+    def create(self, *args, **kwargs):
+        nonlocal running, most
+        with lock:
+            running += 1
+            most = max(most, running)
+        time.sleep(0.01)
+        with lock:
+            running -= 1
+        return io.BytesIO()
+
+    monkeypatch.setattr(Pass, "create", create)
+
+    async def main(limit):
+        with ThreadPoolExecutor(8) as executor:
+            await asyncio.gather(
+                *(create_shell_pass().create_async(signer=signer, executor=executor, limit=limit) for _ in range(12))
+            )
+
+    asyncio.run(main(asyncio.Semaphore(2)))
+    assert most == 2
+
+    most = 0
+    monkeypatch.setattr(aio, "DEFAULT_CONCURRENCY", 3)
+    asyncio.run(main(None))
+    assert most == 3
+
+
+def test_errors_are_raised():
+    with pytest.raises(ValueError):
+        asyncio.run(create_shell_pass().create_async())
+
+
+@pytest.mark.parametrize("compiled", [False, True])
+def test_template_create_pkpass_async(signer, compiled):
+    with open(passes / "StoreCard.pkpass", "rb") as f:
+        template = PassTemplate.from_passfile(f, template_identifier="test", backoffice_identifier="test")
+    if compiled:
+        template = template.compile()
+
+    async def main():
+        return await asyncio.gather(
+            *(template.create_pkpass_async(signer=signer, serial_number=str(i)) for i in range(5))
+        )
+
+    pkpasses = asyncio.run(main())
+    assert len(pkpasses) == 5
+    assert all("pass.json" in entries(pkpass) for pkpass in pkpasses)
@@ -0,0 +1,72 @@
+import hashlib
+import json
+
+from common import create_shell_pass, passes, resources
+from edutap.models_apple.attachments import AttachmentStore, attachment_store
+from edutap.models_apple.template import PassTemplate
+
+
+def test_register_returns_stored_instance():
+    store = AttachmentStore()
+    data = b"icon" * 100
+    stored = store.register(data)
+    assert stored is data
+    # same content, different object
+    assert store.register(bytes(bytearray(data))) is data
+    assert len(store) == 1
+    assert store.size == len(data)
+
+
+def test_sha1_is_computed_once_per_content():
+    store = AttachmentStore()
+    data = open(resources / "white_square.png", "rb").read()
+    assert store.sha1(data) == "170eed23019542b0a2890a0bf753effea0db181a"
+    assert store.sha1(bytes(bytearray(data))) == "170eed23019542b0a2890a0bf753effea0db181a"
+    assert store.misses == 1
+    assert store.hits == 1
+    assert store.sha1(bytearray(b"abc")) == hashlib.sha1(b"abc").hexdigest()
+
+
+def test_lru_eviction_by_size():
+    store = AttachmentStore(max_bytes=10)
+    a, b, c = b"a" * 4, b"b" * 4, b"c" * 4
+    store.register(a)
+    store.register(b)
+    store.register(a)  # a is now the most recently used
+    store.register(c)
+    assert a in store
+    assert b not in store
+    assert c in store
+    assert store.size == 8
+
+    # too large to be stored, but hashed
+    big = b"x" * 11
+    assert store.sha1(big) == hashlib.sha1(big).hexdigest()
+    assert big not in store
+    assert store.size == 8
+
+
+def test_passes_share_attachments():
+    icon = open(resources / "white_square.png", "rb").read()
+    pass1 = create_shell_pass()
+    pass1.addFile("icon.png", icon)
+    pass2 = create_shell_pass()
+    pass2.addFile("icon.png", open(resources / "white_square.png", "rb"))
+    assert pass1.files["icon.png"] is pass2.files["icon.png"]
+
+    hits = attachment_store.hits
+    manifest = json.loads(pass2._createManifest())
+    assert manifest["icon.png"] == "170eed23019542b0a2890a0bf753effea0db181a"
+    assert attachment_store.hits > hits
+
+
+def test_template_attachments_are_registered():
+    with open(passes / "StoreCard.pkpass", "rb") as f:
+        template = PassTemplate.from_passfile(f, template_identifier="test", backoffice_identifier="test")
+
+    pass1 = template.create_pass_object()
+    pass2 = template.create_pass_object()
+    assert pass1.files.keys() == pass2.files.keys()
+    for name, data in pass1.files.items():
+        assert pass2.files[name] is data
+        assert data in attachment_store
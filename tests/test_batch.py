@@ -0,0 +1,142 @@
+from array import array
+import zipfile
+
+import pytest
+
+from common import cert_file, key_file, passes, password_file, wwdr_file
+from edutap.models_apple.batch import PassBatch
+from edutap.models_apple.signing import PassSigner
+from edutap.models_apple.template import PassTemplate
+
+
+columns = {
+    "serialNumber": "/serialNumber",
+    "message": "/barcodes/0/message",
+    "balance": "/storeCard/primaryFields/0/value",
+    "voided": "/voided",
+}
+
+
+@pytest.fixture
+def template():
+    with open(passes / "StoreCard.pkpass", "rb") as f:
+        return PassTemplate.from_passfile(f, template_identifier="batch", backoffice_identifier="batch")
+
+
+@pytest.fixture
+def batch(template):
+    batch = PassBatch(template, columns)
+    batch.extend({"serialNumber": f"S{i}", "message": f"M{i}", "balance": float(i)} for i in range(10))
+    return batch
+
+
+def test_columns(batch):
+    assert len(batch) == 10
+    assert batch.columns == list(columns)
+    # Field.value is declared as str | int | float, the values keep their type
+    assert isinstance(batch.column("balance"), list)
+    assert isinstance(batch.column("voided"), array)
+    assert batch.row(3) == {"serialNumber": "S3", "message": "M3", "balance": 3.0, "voided": False}
+
+
+def test_defaults(template):
+    batch = PassBatch(template, columns)
+    batch.append()
+    batch.append()
+    row = batch.row(0)
+    assert row["message"] == template.pass_json["barcodes"][0]["message"]
+    assert row["balance"] == 21.75
+    assert row["serialNumber"] != batch.row(1)["serialNumber"]
+    with pytest.raises(KeyError):
+        batch.append(bogus=1)
+
+
+def test_materialize(batch, template):
+    pass_ = batch[4]
+    assert pass_.serialNumber == "S4"
+    assert pass_.barcodes[0].message == "M4"
+    assert pass_.storeCard.primaryFields[0].value == 4.0
+    assert pass_.voided is False
+    assert set(pass_.files) == set(template.attachments)
+    assert batch[-1].serialNumber == "S9"
+    with pytest.raises(IndexError):
+        batch[10]
+
+    # the same as a pass created from the template with the same patches
+    expected = template.compile().create_pass_object(pass_patches=batch.patches(4))
+    assert pass_.pass_json == expected.pass_json
+
+
+def test_materialized_passes_can_be_changed(batch):
+    pass_ = batch[4]
+    pass_.storeCard.primaryFields[0].value = "changed"
+    pass_.barcodes[0].message = "changed"
+    assert batch[4].storeCard.primaryFields[0].value == 4.0
+    assert batch[5].barcodes[0].message == "M5"
+    assert [p.serialNumber for p in batch] == [f"S{i}" for i in range(10)]
+
+
+def test_masked_updates(batch):
+    even = batch.where("balance", lambda balance: balance % 2 == 0)
+    assert list(even) == [1, 0] * 5
+    batch.set("voided", True, where=even)
+    assert [p.voided for p in batch] == [True, False] * 5
+
+    batch.update("balance", lambda balance: balance + 0.5, where=batch.where("voided", False))
+    assert list(batch.column("balance")) == [0.0, 1.5, 2.0, 3.5, 4.0, 5.5, 6.0, 7.5, 8.0, 9.5]
+
+    batch.set("message", [f"new {i}" for i in range(10)])
+    assert batch[7].barcodes[0].message == "new 7"
+    batch.set("message", "same")
+    assert {batch.row(i)["message"] for i in range(10)} == {"same"}
+
+    selected = [p.serialNumber for p in batch.passes(batch.where("serialNumber", "S3"))]
+    assert selected == ["S3"]
+
+    with pytest.raises(ValueError):
+        batch.set("message", ["too", "few"])
+    with pytest.raises(ValueError):
+        batch.set("message", "x", where=bytearray(3))
+
+
+def test_values_are_validated(batch):
+    batch.set("message", {"no": "string"}, where=batch.where("serialNumber", "S1"))
+    batch[0]
+    with pytest.raises(Exception):
+        batch[1]
+
+
+def test_create_pkpass(batch):
+    with open(password_file) as f:
+        signer = PassSigner(cert_file, key_file, wwdr_file, f.read().strip())
+    with zipfile.ZipFile(batch.create_pkpass(2, signer=signer)) as zf:
+        assert b'"S2"' in zf.read("pass.json")
+
+
+def test_column_types(template):
+    batch = PassBatch(template, {"balance": "/storeCard/primaryFields/0/value", "formatVersion": "/formatVersion"})
+    batch.append(balance=10.5)
+    batch.append(balance="ten", formatVersion=1.0)
+    assert batch.column("balance") == [10.5, "ten"]
+    assert batch.column("formatVersion") == array("q", [1, 1])
+    assert batch[0].storeCard.primaryFields[0].value == 10.5
+    assert batch[1].storeCard.primaryFields[0].value == "ten"
+
+    # lossy conversions are rejected
+    for value in (10.5, "1", None):
+        with pytest.raises(ValueError):
+            batch.set("formatVersion", value)
+    with pytest.raises(ValueError):
+        PassBatch(template, {"voided": "/voided"}).append(voided="no")
+    assert list(batch.column("formatVersion")) == [1, 1]
+    assert list(batch.where("formatVersion", 1.5)) == [0, 0]
+
+
+def test_rejected_append_keeps_the_columns_aligned(batch):
+    with pytest.raises(ValueError):
+        batch.append(message="M10", voided=2)
+    assert len(batch) == 10
+    assert {len(batch.column(name)) for name in batch.columns} == {10}
+    batch.append(serialNumber="S10", message="M10")
+    assert batch.row(10)["serialNumber"] == "S10"
+    assert batch[10].barcodes[0].message == "M10"
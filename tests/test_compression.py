@@ -0,0 +1,76 @@
+import io
+import json
+import zipfile
+
+import pytest
+
+from common import cert_file, create_shell_pass, key_file, password_file, resources, wwdr_file
+from edutap.models_apple.compression import DEFAULT_COMPRESSION, NO_COMPRESSION, CompressionPolicy
+from edutap.models_apple.signing import PassSigner
+
+
+@pytest.fixture
+def signer():
+    with open(password_file) as file_:
+        return PassSigner(cert_file, key_file, wwdr_file, file_.read().strip())
+
+
+@pytest.fixture
+def passfile():
+    passfile = create_shell_pass()
+    passfile.addFile("icon.png", open(resources / "white_square.png", "rb"))
+    passfile.addFile("logo.png", open(resources / "edutap.png", "rb"))
+    passfile.addFile("de.lproj/pass.strings", b'"Name" = "Name";\n' * 50)
+    return passfile
+
+
+def methods(data: bytes) -> dict[str, int]:
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        return {info.filename: info.compress_type for info in zf.infolist()}
+
+
+def test_policy_methods():
+    assert DEFAULT_COMPRESSION.method("pass.json") == zipfile.ZIP_DEFLATED
+    assert DEFAULT_COMPRESSION.method("manifest.json") == zipfile.ZIP_DEFLATED
+    assert DEFAULT_COMPRESSION.method("en.lproj/pass.strings") == zipfile.ZIP_DEFLATED
+    assert DEFAULT_COMPRESSION.method("icon@2x.PNG") == zipfile.ZIP_STORED
+    assert DEFAULT_COMPRESSION.method("signature") == zipfile.ZIP_STORED
+    assert NO_COMPRESSION.method("pass.json") == zipfile.ZIP_STORED
+
+    policy = CompressionPolicy(overrides={".png": zipfile.ZIP_DEFLATED}, default_method=zipfile.ZIP_DEFLATED)
+    assert policy.method("icon.png") == zipfile.ZIP_DEFLATED
+    assert policy.method("pass.json") == zipfile.ZIP_DEFLATED
+    assert policy.method("signature") == zipfile.ZIP_DEFLATED
+
+
+def test_create_compresses_text_entries(passfile, signer):
+    data = passfile.create(signer=signer).getvalue()
+    assert methods(data) == {
+        "signature": zipfile.ZIP_STORED,
+        "manifest.json": zipfile.ZIP_DEFLATED,
+        "pass.json": zipfile.ZIP_DEFLATED,
+        "icon.png": zipfile.ZIP_STORED,
+        "logo.png": zipfile.ZIP_STORED,
+        "de.lproj/pass.strings": zipfile.ZIP_DEFLATED,
+    }
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert json.loads(zf.read("pass.json"))["serialNumber"] == passfile.serialNumber
+        assert zf.read("de.lproj/pass.strings") == passfile.files["de.lproj/pass.strings"]
+
+
+def test_create_with_policy(passfile, signer):
+    stored = passfile.create(signer=signer, compression=NO_COMPRESSION).getvalue()
+    assert set(methods(stored).values()) == {zipfile.ZIP_STORED}
+
+    policy = CompressionPolicy(level=9, overrides={".png": zipfile.ZIP_DEFLATED})
+    deflated = passfile.create(signer=signer, compression=policy).getvalue()
+    assert methods(deflated)["icon.png"] == zipfile.ZIP_DEFLATED
+    assert len(deflated) < len(stored)
+
+
+def test_stream_uses_policy(passfile, signer):
+    policy = CompressionPolicy(overrides={".png": zipfile.ZIP_DEFLATED})
+    data = b"".join(passfile.stream(signer=signer, compression=policy))
+    assert methods(data) == methods(passfile.create(signer=signer, compression=policy).getvalue())
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.testzip() is None
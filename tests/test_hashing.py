@@ -0,0 +1,137 @@
+import hashlib
+import io
+import json
+import os
+import threading
+import zipfile
+
+import pytest
+
+from common import create_certificate_chain, create_shell_pass, resources
+from edutap.models_apple.passfile import PassFile
+from edutap.models_apple.signing import PassSigner
+from edutap.models_apple import hashing
+from edutap.models_apple.attachments import attachment_store
+from edutap.models_apple.hashing import FileAttachment, hash_attachments, read_attachment, read_attachments, sha1_file
+
+
+def sha1(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+
+@pytest.fixture
+def large_files():
+    """new contents, not in the attachment store yet"""
+    return {f"strip{i}.png": os.urandom(2 * 1024 * 1024) for i in range(5)}
+
+
+def test_sha1_file_in_chunks(tmp_path):
+    data = os.urandom(10_000)
+    path = tmp_path / "strip.png"
+    path.write_bytes(data)
+    assert sha1_file(path, chunk_size=1000) == sha1(data)
+    with open(path, "rb") as f:
+        assert sha1_file(f, chunk_size=4096) == sha1(data)
+    assert read_attachment(io.BytesIO(data)) == (data, sha1(data))
+
+
+def test_read_attachments(tmp_path):
+    data = {f"image{i}.png": os.urandom(100_000) for i in range(4)}
+    for name, content in data.items():
+        (tmp_path / name).write_bytes(content)
+    sources = {
+        "image0.png": tmp_path / "image0.png",
+        "image1.png": str(tmp_path / "image1.png"),
+        "image2.png": open(tmp_path / "image2.png", "rb"),
+        "image3.png": data["image3.png"],
+    }
+    for threshold in (0, hashing.PARALLEL_THRESHOLD * 100):
+        result = read_attachments(sources, threshold=threshold)
+        sources["image2.png"].seek(0)
+        assert list(result) == list(data)
+        assert result == {name: (content, sha1(content)) for name, content in data.items()}
+    sources["image2.png"].close()
+
+
+def record_threads(monkeypatch) -> set[str]:
+    threads = set()
+    store_sha1 = attachment_store.sha1
+
+    def recording_sha1(data):
+        threads.add(threading.current_thread().name)
+        return store_sha1(data)
+
+    monkeypatch.setattr(attachment_store, "sha1", recording_sha1)
+    return threads
+
+
+def test_hash_attachments_in_parallel(large_files, monkeypatch):
+    monkeypatch.setattr(hashing, "MAX_WORKERS", 4)
+    threads = record_threads(monkeypatch)
+    digests = hash_attachments(large_files)
+    assert digests == {name: sha1(data) for name, data in large_files.items()}
+    assert list(digests) == list(large_files)
+    assert threads and all(name.startswith("hashing") for name in threads)
+
+
+def test_small_attachments_are_hashed_sequentially(monkeypatch):
+    monkeypatch.setattr(hashing, "MAX_WORKERS", 4)
+    threads = record_threads(monkeypatch)
+    files = {f"icon{i}.png": os.urandom(1000) for i in range(5)}
+    assert hash_attachments(files) == {name: sha1(data) for name, data in files.items()}
+    assert threads == {threading.current_thread().name}
+
+
+def test_cached_digests_are_not_hashed_again(monkeypatch):
+    files = {"icon.png": attachment_store.register(os.urandom(1000))}
+    threads = record_threads(monkeypatch)
+    assert hash_attachments(files) == {"icon.png": sha1(files["icon.png"])}
+    assert not threads
+
+
+def test_manifest_of_large_attachments(large_files, tmp_path):
+    passfile = create_shell_pass()
+    path = tmp_path / "strip.png"
+    path.write_bytes(large_files["strip0.png"])
+    passfile.addFile("strip.png", path)
+    passfile.addFiles({"strip@2x.png": large_files["strip1.png"], "icon.png": resources / "white_square.png"})
+    manifest = json.loads(passfile._createManifest())
+    assert manifest["strip.png"] == sha1(large_files["strip0.png"])
+    assert manifest["strip@2x.png"] == sha1(large_files["strip1.png"])
+    assert manifest["icon.png"] == sha1((resources / "white_square.png").read_bytes())
+    assert passfile.files["strip@2x.png"] == large_files["strip1.png"]
+    assert isinstance(passfile.files["strip.png"], FileAttachment)
+    assert isinstance(passfile.files["icon.png"], FileAttachment)
+
+
+def test_files_added_as_paths_are_not_read_into_memory(large_files, tmp_path, monkeypatch):
+    path = tmp_path / "strip.png"
+    path.write_bytes(large_files["strip0.png"])
+    passfile = create_shell_pass()
+    passfile.addFile("strip.png", path)
+
+    def read(self):
+        raise AssertionError("the file is read into memory")
+
+    monkeypatch.setattr(FileAttachment, "read", read)
+    signer = PassSigner(*create_certificate_chain(tmp_path))
+    for archive in (passfile.create(signer=signer), io.BytesIO(b"".join(passfile.stream(signer=signer)))):
+        with PassFile(archive.getvalue()) as reader:
+            assert reader.attachments["strip.png"] == large_files["strip0.png"]
+            assert reader.manifest["strip.png"] == sha1(large_files["strip0.png"])
+        assert zipfile.ZipFile(archive).testzip() is None
+
+
+def test_changed_files_are_hashed_again(tmp_path):
+    path = tmp_path / "strip.png"
+    path.write_bytes(b"first")
+    passfile = create_shell_pass()
+    passfile.addFile("strip.png", path)
+    build = passfile._prepare()
+    assert passfile._prepare() is build
+    assert json.loads(build.manifest)["strip.png"] == sha1(b"first")
+
+    path.write_bytes(b"second content")
+    rebuilt = passfile._prepare()
+    assert rebuilt is not build
+    assert json.loads(rebuilt.manifest)["strip.png"] == sha1(b"second content")
@@ -0,0 +1,104 @@
+import asyncio
+import threading
+
+import pytest
+
+from common import cert_file, create_shell_pass, key_file, passes, password_file, resources, wwdr_file
+from edutap.models_apple import instrumentation
+from edutap.models_apple.instrumentation import StageEvent, StageStatistics, collect
+from edutap.models_apple.signing import PassSigner
+from edutap.models_apple.template import PassTemplate
+
+
+@pytest.fixture
+def signer():
+    with open(password_file) as file_:
+        return PassSigner(cert_file, key_file, wwdr_file, file_.read().strip())
+
+
+def test_create_stages(signer):
+    passfile = create_shell_pass()
+    passfile.addFile("icon.png", open(resources / "white_square.png", "rb"))
+    events: list[StageEvent] = []
+    with collect(events.append):
+        pkpass = passfile.create(signer=signer)
+
+    assert [event.stage for event in events] == ["serialize", "manifest", "sign", "zip", "create"]
+    stages = {event.stage: event for event in events}
+    assert all(event.duration >= 0 for event in events)
+    assert stages["create"].duration >= stages["sign"].duration
+    pass_json_size = stages["serialize"].bytes_out
+    icon_size = len(passfile.files["icon.png"])
+    assert stages["manifest"].bytes_in == pass_json_size + icon_size
+    assert stages["manifest"].attachments == 1
+    assert stages["sign"].bytes_in > 0
+    assert stages["zip"].bytes_out == stages["create"].bytes_out == len(pkpass.getvalue())
+    assert stages["zip"].bytes_in > pass_json_size + icon_size
+    assert stages["create"].attachments == 1
+
+
+def test_disabled_without_collector(signer, monkeypatch):
+    def fail(*args):
+        raise AssertionError("no measurement expected")
+
+    monkeypatch.setattr(instrumentation, "_Measurement", fail)
+    create_shell_pass().create(signer=signer)
+
+
+def test_collectors_are_scoped(signer):
+    outer, inner, other_thread = StageStatistics(), StageStatistics(), []
+    with collect(outer):
+        with collect(inner):
+            create_shell_pass().create(signer=signer)
+        thread = threading.Thread(target=lambda: other_thread.append(create_shell_pass().create(signer=signer)))
+        thread.start()
+        thread.join()
+        create_shell_pass().create(signer=signer)
+
+    assert inner["create"].count == 1
+    # the thread has its own context
+    assert outer["create"].count == 2
+    assert create_shell_pass().create(signer=signer)
+    assert outer["create"].count == 2
+
+
+def test_async_stages_are_collected(signer):
+    statistics = StageStatistics()
+
+    async def main():
+        with collect(statistics):
+            await asyncio.gather(*(create_shell_pass().create_async(signer=signer) for _ in range(3)))
+
+    asyncio.run(main())
+    assert statistics["sign"].count == 3
+
+
+def test_template_stages(signer):
+    with open(passes / "StoreCard.pkpass", "rb") as f:
+        template = PassTemplate.from_passfile(f, template_identifier="test", backoffice_identifier="test")
+    statistics = StageStatistics()
+    with collect(statistics):
+        template.create_pass_object()
+        template.compile().create_pass_object(trusted=True)
+    assert statistics["create_pass_object"].count == 2
+    assert statistics["create_pass_object"].attachments == 2 * len(template.attachments)
+
+
+def test_statistics():
+    statistics = StageStatistics(buckets=(0.001, 0.01))
+    for duration in (0.0005, 0.001, 0.005, 0.5):
+        statistics(StageEvent("sign", duration, bytes_in=10))
+    statistics(StageEvent("zip", 0.002, bytes_in=100, bytes_out=50, attachments=3))
+
+    sign = statistics["sign"]
+    assert sign.count == 4
+    assert sign.histogram == [2, 1, 1]
+    assert sign.max_duration == 0.5
+    assert sign.mean_duration == pytest.approx(0.5065 / 4)
+    assert sign.bytes_in == 40
+    assert statistics["zip"].bytes_out == 50
+    assert statistics["zip"].attachments == 3
+    assert "create" not in statistics
+
+    statistics.reset()
+    assert "sign" not in statistics
@@ -1,7 +1,9 @@
+import hashlib
 import json
 import os
 from pathlib import Path
 
+import pydantic
 import pytest
 from edutap.models_apple import models
 from common import *
@@ -296,4 +298,216 @@ def test_passbook_creation_from_json():
         json_ = file_.read()
     passfile = models.Pass.model_validate_json(json_)
     assert passfile.barcodes[0].format == BarcodeFormat.PDF417
-    print(passfile)
\ No newline at end of file
+    print(passfile)
+
+def test_pass_json_is_serialized_once_per_build(monkeypatch):
+    calls = []
+    serialize = models.Pass._serialize
+
+    def counting_serialize(self, *args):
+        calls.append(self)
+        return serialize(self, *args)
+
+    monkeypatch.setattr(models.Pass, "_serialize", counting_serialize)
+    passfile = create_shell_pass()
+    passfile.addFile("icon.png", open(resources / "white_square.png", "rb"))
+
+    build = passfile._prepare()
+    assert len(calls) == 1
+    manifest = json.loads(build.manifest)
+    assert manifest["pass.json"] == hashlib.sha1(build.pass_json).hexdigest()
+
+    # an unchanged pass reuses the build
+    assert passfile._prepare() is build
+    assert len(calls) == 1
+
+
+@pytest.mark.parametrize(
+    "change",
+    [
+        lambda p: setattr(p, "description", "changed"),
+        lambda p: setattr(p.passInformation.primaryFields[0], "value", "changed"),
+        lambda p: p.passInformation.addBackField("back", "value", "label"),
+        lambda p: p.passInformation.primaryFields.pop(),
+        lambda p: p.barcodes.append(models.Barcode(message="second")),
+        lambda p: setattr(p, "userInfo", {"a": 1}),
+        lambda p: p.addFile("logo.png", b"logo"),
+        lambda p: p.files.update({"icon.png": b"other icon"}),
+        lambda p: p.mark_dirty(),
+    ],
+)
+def test_changed_pass_is_rebuilt(change):
+    passfile = create_shell_pass()
+    passfile.addFile("icon.png", open(resources / "white_square.png", "rb"))
+    build = passfile._prepare()
+
+    change(passfile)
+    rebuilt = passfile._prepare()
+    assert rebuilt is not build
+    assert rebuilt.pass_json == passfile.pass_json.encode("utf-8")
+
+
+def test_changes_of_other_passes_keep_the_build():
+    passfile, other = create_shell_pass(), create_shell_pass()
+    build = passfile._prepare()
+    other._prepare()
+    other.description = "changed"
+    other.passInformation.addBackField("back", "value", "label")
+    other.passInformation.primaryFields[0].value = "changed"
+    assert passfile._prepare() is build
+
+
+def test_changes_of_added_models_are_tracked():
+    passfile = create_shell_pass()
+    field = models.Field(key="added", value="value")
+    passfile.passInformation.primaryFields.append(field)
+    build = passfile._prepare()
+    field.value = "changed"
+    rebuilt = passfile._prepare()
+    assert rebuilt is not build
+    assert b"changed" in rebuilt.pass_json
+
+
+def test_changes_are_counted_after_the_assignment(monkeypatch):
+    passfile = create_shell_pass()
+    passfile._prepare()
+    field = passfile.passInformation.primaryFields[0]
+    seen = []
+    changed = models._changed
+
+    def recording_changed(node):
+        seen.append(field.value)
+        changed(node)
+
+    monkeypatch.setattr(models, "_changed", recording_changed)
+    field.value = "changed"
+    assert seen == ["changed"]
+
+
+def test_changes_of_models_shared_by_copies_are_tracked():
+    p1 = create_shell_pass()
+    p2 = p1.model_copy()
+    p1._prepare()
+    p2._prepare()
+    p1.storeCard.primaryFields[0].value = "changed-in-p1"
+    assert b"changed-in-p1" in p1._prepare().pass_json
+    assert b"changed-in-p1" in p2._prepare().pass_json
+
+
+def test_changes_of_models_in_several_passes_are_tracked():
+    a, b = create_shell_pass(), create_shell_pass()
+    field = models.Field(key="shared", value="v")
+    a.passInformation.primaryFields.append(field)
+    b.passInformation.primaryFields.append(field)
+    a._prepare()
+    b._prepare()
+    field.value = "new"
+    assert b"new" in a._prepare().pass_json
+    assert b"new" in b._prepare().pass_json
+
+    # a model removed from one pass stops counting its changes there
+    a.passInformation.primaryFields.remove(field)
+    build = a._prepare()
+    b._prepare()
+    field.value = "newer"
+    assert a._prepare() is build
+    assert b"newer" in b._prepare().pass_json
+
+
+def test_changes_of_assigned_models_are_tracked():
+    x, y = create_shell_pass(), create_shell_pass()
+    x._prepare()
+    y.storeCard = x.storeCard
+    y._prepare()
+    x.storeCard.primaryFields[0].value = "changed-in-x"
+    assert b"changed-in-x" in x._prepare().pass_json
+    assert b"changed-in-x" in y._prepare().pass_json
+
+
+def test_tracked_user_info():
+    passfile = create_shell_pass()
+    passfile.userInfo = {"a": 1}
+    build = passfile._prepare()
+    passfile.userInfo["a"] = 2
+    assert passfile._prepare() is not build
+    assert json.loads(passfile._prepare().pass_json)["userInfo"] == {"a": 2}
+
+
+def test_pass_type_keys_are_kept():
+    passfile = create_shell_pass()
+    assert passfile.passType == "storeCard"
+    assert passfile.storeCard is passfile.passInformation
+    assert passfile.coupon is None
+
+    keys = list(passfile.model_dump())
+    assert keys[-6:] == ["boardingPass", "coupon", "eventTicket", "generic", "storeCard", "barcode"]
+    assert "passInformation" not in keys
+    json_ = passfile.model_dump(exclude_none=True)
+    assert "coupon" not in json_
+    assert json_["storeCard"]["primaryFields"][0]["key"] == "name"
+
+    loaded = models.Pass.model_validate_json(passfile.model_dump_json())
+    assert loaded.pass_json == passfile.pass_json
+
+
+def test_pass_type_variant_is_validated_once():
+    data = json.loads(open(jsons / "boarding_pass.json").read())
+    data["transitType"] = "bogus"  # not part of the pass information, ignored
+    pass1 = models.Pass.model_validate(data)
+    assert type(pass1.boardingPass) is models.BoardingPass
+    assert pass1.boardingPass.transitType == models.TransitType(data["boardingPass"]["transitType"])
+
+    data["boardingPass"]["transitType"] = "bogus"
+    with pytest.raises(pydantic.ValidationError) as e:
+        models.Pass.model_validate(data)
+    # only the variant of the pass type reports errors
+    assert [error["loc"][:2] for error in e.value.errors()] == [("passInformation", "boardingPass")]
+
+
+def test_only_one_pass_type():
+    data = json.loads(open(jsons / "minimal_storecard.json").read())
+    data["coupon"] = {}
+    with pytest.raises(ValueError):
+        models.Pass.model_validate(data)
+
+
+def test_set_pass_type():
+    passfile = create_shell_pass()
+    passfile.coupon = models.Coupon()
+    assert passfile.passType == "coupon"
+    assert passfile.storeCard is None
+    assert "storeCard" not in passfile.pass_dict
+    assert passfile.pass_dict["coupon"] == {
+        "headerFields": [], "primaryFields": [], "secondaryFields": [], "backFields": [], "auxiliaryFields": []
+    }
+
+    passfile.coupon = None
+    assert passfile.passInformation is None
+    assert passfile.passType is None
+
+    passfile.create_pass_object("eventTicket")
+    assert type(passfile.eventTicket) is models.EventTicket
+
+
+def test_json_schema_lists_the_pass_type_keys():
+    properties = models.Pass.model_json_schema()["properties"]
+    assert "passInformation" not in properties
+    for name, cls in models.pass_model_registry.items():
+        assert properties[name] == {"anyOf": [{"$ref": f"#/$defs/{cls.__name__}"}, {"type": "null"}], "default": None}
+
+
+def test_include_and_exclude_pass_type_keys():
+    passfile = create_shell_pass()
+    dumped = passfile.model_dump(include={"storeCard", "serialNumber"})
+    assert set(dumped) == {"storeCard", "serialNumber"}
+    assert dumped["storeCard"]["primaryFields"][0]["value"] == "Jähn Doe"
+    assert passfile.model_dump(include={"coupon", "serialNumber"}, exclude_none=True) == {
+        "serialNumber": passfile.serialNumber
+    }
+
+    dumped = json.loads(passfile.model_dump_json(include={"storeCard": {"primaryFields"}}, exclude_none=True))
+    assert dumped == {"storeCard": {"primaryFields": [{"key": "name", "value": "Jähn Doe", "label": "Name", "changeMessage": ""}]}}
+
+    dumped = passfile.model_dump(exclude={"storeCard", "coupon"})
+    assert not set(models.pass_model_registry) & set(dumped)
+    assert "storeCard" in passfile.model_dump(exclude={"coupon"}, exclude_none=True)
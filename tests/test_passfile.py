@@ -0,0 +1,111 @@
+import io
+import mmap
+import zipfile
+
+import pytest
+
+from common import passes
+from edutap.models_apple.models import Pass
+from edutap.models_apple.passfile import PassFile
+from edutap.models_apple.template import PassTemplate
+
+
+storecard = passes / "StoreCard.pkpass"
+
+
+def sources():
+    data = storecard.read_bytes()
+    return {
+        "path": storecard,
+        "str": str(storecard),
+        "bytes": data,
+        "bytearray": bytearray(data),
+        "memoryview": memoryview(data),
+        "file": open(storecard, "rb"),
+        "bytesio": io.BytesIO(data),
+    }
+
+
+@pytest.mark.parametrize("kind", list(sources()))
+def test_read(kind):
+    source = sources()[kind]
+    with zipfile.ZipFile(storecard) as zf:
+        expected = {name: zf.read(name) for name in zf.namelist()}
+
+    with PassFile(source) as reader:
+        assert sorted(reader.names) == sorted(expected)
+        assert reader.pass_json == expected["pass.json"]
+        assert isinstance(reader.pass_object, Pass)
+        assert reader.pass_object is reader.pass_object
+        assert reader.pass_object.files == {}
+        assert reader.pass_dict["passTypeIdentifier"] == reader.pass_object.passTypeIdentifier
+        assert set(reader.manifest) <= set(expected)
+        assert reader.signature == expected["signature"]
+
+        attachments = reader.attachments
+        assert set(attachments) == set(expected) - {"pass.json", "manifest.json", "signature"}
+        assert len(attachments) > 0
+        for name in attachments:
+            assert attachments[name] == expected[name]
+            assert attachments.size(name) == len(expected[name])
+            with attachments.open(name) as f:
+                assert f.read() == expected[name]
+        assert "pass.json" not in attachments
+        with pytest.raises(KeyError):
+            attachments["pass.json"]
+        with pytest.raises(KeyError):
+            attachments["missing.png"]
+
+    if kind in ("file", "bytesio"):
+        # file objects of the caller are left open
+        assert not source.closed
+        source.close()
+
+
+def test_mmap():
+    with open(storecard, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        with PassFile(mapped) as reader:
+            assert reader.pass_object.passType == "storeCard"
+
+
+def test_lazy_access(monkeypatch):
+    read = []
+    original = zipfile.ZipFile.open
+
+    def open_(self, name, *args, **kwargs):
+        read.append(name if isinstance(name, str) else name.filename)
+        return original(self, name, *args, **kwargs)
+
+    monkeypatch.setattr(zipfile.ZipFile, "open", open_)
+    with PassFile(storecard) as reader:
+        assert read == []
+        reader.pass_object
+        assert read == ["pass.json"]
+        name = next(iter(reader.attachments))
+        reader.attachments[name]
+        assert read == ["pass.json", name]
+
+
+def test_to_pass():
+    with PassFile(storecard) as reader:
+        pass_object = reader.to_pass()
+        assert set(pass_object.files) == set(reader.attachments)
+        assert pass_object is not reader.pass_object
+
+
+def test_bad_file(tmp_path):
+    path = tmp_path / "empty.pkpass"
+    path.write_bytes(b"")
+    with pytest.raises(zipfile.BadZipFile):
+        PassFile(path)
+    with pytest.raises(zipfile.BadZipFile):
+        PassFile(b"no zip file")
+
+
+def test_import_from_reader():
+    with PassFile(storecard) as reader:
+        template = PassTemplate.from_passfile(reader, template_identifier="test", backoffice_identifier="test")
+    expected = PassTemplate.from_passfile(storecard.read_bytes(), template_identifier="test", backoffice_identifier="test")
+    assert template.pass_json == expected.pass_json
+    assert template.attachments == expected.attachments
+    assert template.pass_type == "storeCard"
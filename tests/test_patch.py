@@ -0,0 +1,134 @@
+import copy
+
+import jsonpatch
+import pytest
+
+from common import create_shell_pass
+from edutap.models_apple.models import Field, Pass, StoreCard
+from edutap.models_apple.patch import PatchPlan, UnsupportedModelPatch
+
+
+# mostly the examples of RFC 6902, appendix A
+cases = [
+    ({"foo": "bar"}, [{"op": "add", "path": "/baz", "value": "qux"}]),
+    ({"foo": ["bar", "baz"]}, [{"op": "add", "path": "/foo/1", "value": "qux"}]),
+    ({"baz": "qux", "foo": "bar"}, [{"op": "remove", "path": "/baz"}]),
+    ({"foo": ["bar", "qux", "baz"]}, [{"op": "remove", "path": "/foo/1"}]),
+    ({"baz": "qux", "foo": "bar"}, [{"op": "replace", "path": "/baz", "value": "boo"}]),
+    (
+        {"foo": {"bar": "baz", "waldo": "fred"}, "qux": {"corge": "grault"}},
+        [{"op": "move", "from": "/foo/waldo", "path": "/qux/thud"}],
+    ),
+    ({"foo": ["all", "grass", "cows", "eat"]}, [{"op": "move", "from": "/foo/1", "path": "/foo/3"}]),
+    (
+        {"baz": "qux", "foo": ["a", 2, "c"]},
+        [{"op": "test", "path": "/baz", "value": "qux"}, {"op": "test", "path": "/foo/1", "value": 2}],
+    ),
+    ({"baz": "qux"}, [{"op": "test", "path": "/baz", "value": "bar"}]),
+    ({"foo": "bar"}, [{"op": "add", "path": "/child", "value": {"grandchild": {}}}]),
+    ({"foo": "bar"}, [{"op": "add", "path": "/baz/bat", "value": "qux"}]),
+    ({"/": 9, "~1": 10}, [{"op": "test", "path": "/~01", "value": 10}]),
+    ({"foo": ["bar"]}, [{"op": "add", "path": "/foo/-", "value": ["abc", "def"]}]),
+    ({"foo": {"bar": [1, 2]}}, [{"op": "copy", "from": "/foo/bar", "path": "/baz"}]),
+    ({"foo": 1}, [{"op": "replace", "path": "", "value": {"bar": 2}}]),
+    # errors
+    ({"foo": 1}, [{"op": "replace", "path": "/bar", "value": 1}]),
+    ({"foo": [1]}, [{"op": "replace", "path": "/foo/5", "value": 1}]),
+    ({"foo": [1]}, [{"op": "add", "path": "/foo/5", "value": 1}]),
+    ({"foo": [1]}, [{"op": "add", "path": "/foo/01", "value": 1}]),
+    ({"foo": [1]}, [{"op": "remove", "path": "/foo/3"}]),
+    ({"foo": 1}, [{"op": "remove", "path": "/bar"}]),
+    ({"foo": 1}, [{"op": "add", "path": "/foo/bar", "value": 1}]),
+    ({"foo": {"bar": 1}}, [{"op": "move", "from": "/foo", "path": "/foo/baz"}]),
+    # several operations on the same containers
+    (
+        {"a": {"b": [{"c": 1}, {"c": 2}]}, "d": {"e": 1}},
+        [
+            {"op": "replace", "path": "/a/b/0/c", "value": 3},
+            {"op": "add", "path": "/a/b/1/x", "value": 4},
+            {"op": "remove", "path": "/a/b/0"},
+            {"op": "copy", "from": "/a/b/0", "path": "/d/f"},
+            {"op": "replace", "path": "/d/f/c", "value": 5},
+        ],
+    ),
+]
+
+
+def run(function):
+    try:
+        return function()
+    except Exception as e:
+        return type(e)
+
+
+@pytest.mark.parametrize("doc, patch", cases)
+def test_plan_matches_jsonpatch(doc, patch):
+    original = copy.deepcopy(doc)
+    expected = run(lambda: jsonpatch.apply_patch(doc, patch))
+    result = run(lambda: PatchPlan(patch).apply(doc))
+    assert result == expected
+    # the given document is never changed
+    assert doc == original
+
+
+@pytest.mark.parametrize(
+    "operation",
+    [
+        {"op": "bogus", "path": "/a"},
+        {"op": "add", "path": "/a"},
+        {"op": "move", "path": "/a"},
+        {"path": "/a", "value": 1},
+        {"op": "replace", "path": "/a/-", "value": 1},
+    ],
+)
+def test_invalid_operations(operation):
+    with pytest.raises(jsonpatch.InvalidJsonPatch):
+        PatchPlan([operation])
+
+
+def test_plan_shares_untouched_containers():
+    doc = {"a": {"b": [1, 2]}, "c": {"d": 1}, "e": [{"f": 1}, {"f": 2}]}
+    patched = PatchPlan([{"op": "replace", "path": "/e/1/f", "value": 3}]).apply(doc)
+    assert patched == {"a": {"b": [1, 2]}, "c": {"d": 1}, "e": [{"f": 1}, {"f": 3}]}
+    assert patched["a"] is doc["a"]
+    assert patched["c"] is doc["c"]
+    assert patched["e"][0] is doc["e"][0]
+    assert patched["e"] is not doc["e"]
+    assert doc["e"][1] == {"f": 2}
+
+
+def test_plan_with_values():
+    patch = [
+        {"op": "replace", "path": "/serialNumber", "value": "1"},
+        {"op": "test", "path": "/organizationName", "value": "org"},
+        {"op": "remove", "path": "/description"},
+    ]
+    plan = PatchPlan(patch)
+    assert PatchPlan.key(patch) == PatchPlan.key([dict(patch[0], value="2")] + patch[1:])
+
+    doc = {"serialNumber": "0", "organizationName": "org", "description": "x"}
+    values = PatchPlan.values([dict(patch[0], value="2")] + patch[1:])
+    assert plan.apply(doc, values) == {"serialNumber": "2", "organizationName": "org"}
+    assert plan.apply(doc) == {"serialNumber": "1", "organizationName": "org"}
+
+
+def test_prefixed():
+    patch = [{"op": "move", "from": "/a", "path": "/b"}]
+    assert PatchPlan.prefixed(patch, "store/Card") == [{"op": "move", "from": "/store~1Card/a", "path": "/store~1Card/b"}]
+
+
+def test_apply_to_model_resolves_the_fields_once():
+    plan = PatchPlan([{"op": "replace", "path": "/storeCard/primaryFields/0/value", "value": "Jane Doe"}])
+    passfile = create_shell_pass()
+    assert plan.apply_to_model(passfile).storeCard.primaryFields[0].value == "Jane Doe"
+    assert plan._fields == {
+        (Pass, "storeCard"): "passInformation",
+        (StoreCard, "primaryFields"): "primaryFields",
+        (Field, "value"): "value",
+    }
+    assert plan.apply_to_model(passfile, ["John Doe"]).storeCard.primaryFields[0].value == "John Doe"
+    assert passfile.storeCard.primaryFields[0].value == "Jähn Doe"
+
+    # the pass information of another pass type
+    with pytest.raises(UnsupportedModelPatch):
+        PatchPlan([{"op": "replace", "path": "/eventTicket/primaryFields/0/value", "value": "x"}]).apply_to_model(passfile)
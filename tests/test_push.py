@@ -0,0 +1,120 @@
+import asyncio
+import socket
+
+import pytest
+
+pytest.importorskip("httpx")
+pytest.importorskip("h2")
+
+from apns_server import StandInAPNs
+from common import PASS_TYPE_IDENTIFIER, create_server_certificate
+from edutap.models_apple.push import PushReport, PushSender
+from edutap.models_apple.signing import PassSigner
+
+
+@pytest.fixture(scope="module")
+def server_certificate(tmp_path_factory):
+    return create_server_certificate(tmp_path_factory.mktemp("server"))
+
+
+@pytest.fixture
+def apns(server_certificate, certificate_chain):
+    with StandInAPNs(*server_certificate, client_ca=certificate_chain[2]) as server:
+        yield server
+
+
+@pytest.fixture
+def unused_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def sender(apns, server_certificate, certificate_chain):
+    return PushSender(
+        PassSigner(*certificate_chain), url=apns.url, ca_file=server_certificate[0], backoff=0.01
+    )
+
+
+def test_push_one(apns, sender):
+    async def send():
+        async with sender:
+            return await sender.send("abc123")
+
+    result = asyncio.run(send())
+    assert result.ok
+    assert result.apns_id
+    assert result.attempts == 1
+    path, headers = apns.requests[0]
+    assert path == "/3/device/abc123"
+    assert headers["apns-topic"] == PASS_TYPE_IDENTIFIER
+    assert headers[":method"] == "POST"
+
+
+def test_push_many_over_one_connection(apns, sender):
+    tokens = [f"token{i}" for i in range(500)]
+    report = sender.send_all(tokens)
+    assert report.sent == 500
+    assert report.failed == 0
+    assert apns.connections == 1
+    # the requests are multiplexed over the connection
+    assert apns.max_concurrent > 10
+    assert {path.rsplit("/", 1)[-1] for path, _ in apns.requests} == set(tokens)
+
+
+def test_push_connections_are_reused(apns, sender):
+    async def send():
+        async with sender:
+            await sender.send_many(["a", "b"])
+            await sender.send_many(["c", "d"])
+
+    asyncio.run(send())
+    assert apns.connections == 1
+    assert len(apns.requests) == 4
+
+
+def test_push_several_connections(apns, server_certificate, certificate_chain):
+    sender = PushSender(
+        certificate=certificate_chain[0],
+        key=certificate_chain[1],
+        topic="pass.org.edutap.other",
+        url=apns.url,
+        ca_file=server_certificate[0],
+        connections=3,
+    )
+    report = sender.send_all(f"token{i}" for i in range(90))
+    assert report.sent == 90
+    assert apns.connections == 3
+    assert apns.requests[0][1]["apns-topic"] == "pass.org.edutap.other"
+
+
+def test_push_report(apns, sender):
+    tokens = ["ok1", "bad1", "gone1", "busy1", "down1", "ok2", "gone2"]
+    report = PushReport()
+    sender.retries = 2
+    assert sender.send_all(tokens, report=report) is report
+    assert report.sent == 3
+    assert report.failed == 4
+    assert sorted(report.invalid_tokens) == ["bad1", "gone1", "gone2"]
+    [failure] = report.failures
+    assert (failure.token, failure.status, failure.reason, failure.attempts) == ("down1", 503, "ServiceUnavailable", 3)
+    assert apns.attempts["busy1"] == 2
+    assert apns.attempts["down1"] == 3
+    assert report.retries == 3
+    assert report.pushes_per_second > 0
+
+
+def test_push_connection_failure_is_retried(server_certificate, certificate_chain, unused_port):
+    sender = PushSender(
+        PassSigner(*certificate_chain),
+        url=f"https://localhost:{unused_port}",
+        ca_file=server_certificate[0],
+        retries=1,
+        backoff=0.01,
+    )
+    report = sender.send_all(["abc"])
+    [failure] = report.failures
+    assert failure.status is None
+    assert failure.attempts == 2
+    assert "ConnectError" in failure.reason
@@ -0,0 +1,141 @@
+import io
+import zipfile
+
+import pytest
+
+from common import create_shell_pass, resources
+from edutap.models_apple.compression import NO_COMPRESSION
+from edutap.models_apple.passfile import PassFile
+from edutap.models_apple import rebuild
+from edutap.models_apple.rebuild import rebuild_pkpass
+from edutap.models_apple.signing import PassSigner
+from edutap.models_apple.verification import PassVerifier
+
+
+@pytest.fixture(scope="module")
+def signer(certificate_chain):
+    return PassSigner(*certificate_chain)
+
+
+@pytest.fixture(scope="module")
+def verifier(certificate_chain):
+    return PassVerifier(certificate_chain[2])
+
+
+@pytest.fixture
+def passfile():
+    passfile = create_shell_pass()
+    passfile.addFile("icon.png", open(resources / "white_square.png", "rb"))
+    passfile.addFile("strip.jpg", open(resources / "eaie-hero.jpg", "rb"))
+    passfile.addFile("de.lproj/pass.strings", b'"name" = "Name";\n' * 20)
+    return passfile
+
+
+def raw_entries(data: bytes) -> dict[str, bytes]:
+    with PassFile(data) as reader:
+        return {name: reader.read_raw(name)[1] for name in reader.attachments}
+
+
+def test_rebuild_copies_unchanged_attachments(passfile, signer, verifier):
+    previous = passfile.create(signer=signer).getvalue()
+    passfile.storeCard.primaryFields[0].value = "Jane Doe"
+
+    rebuilt = rebuild_pkpass(passfile, previous, signer=signer).getvalue()
+    result = verifier.verify(rebuilt)
+    assert result.valid, result
+    assert raw_entries(rebuilt) == raw_entries(previous)
+    with PassFile(rebuilt) as reader:
+        assert reader.pass_object.storeCard.primaryFields[0].value == "Jane Doe"
+        assert reader.pass_json == passfile._serialize()
+        assert reader.zipfile.testzip() is None
+
+    # the same archive as a full build, apart from the signature
+    with PassFile(passfile.create(signer=signer).getvalue()) as full, PassFile(rebuilt) as reader:
+        assert full.manifest == reader.manifest
+        assert sorted(full.names) == sorted(reader.names)
+
+
+def test_unchanged_attachments_are_not_decompressed(passfile, signer, monkeypatch):
+    previous = passfile.create(signer=signer).getvalue()
+    opened = []
+    original = zipfile.ZipFile.open
+
+    def open_(self, name, mode="r", *args, **kwargs):
+        if mode == "r":
+            opened.append(name if isinstance(name, str) else name.filename)
+        return original(self, name, mode, *args, **kwargs)
+
+    monkeypatch.setattr(zipfile.ZipFile, "open", open_)
+    rebuild_pkpass(passfile, previous, signer=signer)
+    assert opened == ["manifest.json"]
+
+
+def test_rebuild_without_files_keeps_attachments(passfile, signer, verifier):
+    previous = passfile.create(signer=signer).getvalue()
+    changed = create_shell_pass()
+    changed.serialNumber = passfile.serialNumber
+    changed.voided = True
+
+    rebuilt = rebuild_pkpass(changed, PassFile(previous), signer=signer).getvalue()
+    assert verifier.verify(rebuilt).valid
+    assert raw_entries(rebuilt) == raw_entries(previous)
+    assert changed.files == {}
+
+
+def test_rebuild_with_changed_attachments(passfile, signer, verifier, tmp_path):
+    path = tmp_path / "previous.pkpass"
+    path.write_bytes(passfile.create(signer=signer).getvalue())
+    passfile.addFile("icon.png", open(resources / "edutap.png", "rb"))
+    del passfile.files["strip.jpg"]
+    passfile.addFile("logo.png", open(resources / "white_square.png", "rb"))
+
+    rebuilt = rebuild_pkpass(passfile, path, signer=signer).getvalue()
+    assert verifier.verify(rebuilt).valid
+    with PassFile(rebuilt) as reader:
+        assert dict(reader.attachments) == passfile.files
+        assert reader.manifest["icon.png"] != PassFile(path).manifest["icon.png"]
+
+
+def test_rebuild_with_files_added_as_paths(passfile, signer, verifier, tmp_path):
+    previous = passfile.create(signer=signer).getvalue()
+    path = tmp_path / "logo.png"
+    path.write_bytes((resources / "edutap.png").read_bytes())
+    passfile.addFile("logo.png", path)
+
+    rebuilt = rebuild_pkpass(passfile, previous, signer=signer).getvalue()
+    assert verifier.verify(rebuilt).valid
+    with PassFile(rebuilt) as reader:
+        assert reader.attachments["logo.png"] == path.read_bytes()
+        assert reader.zipfile.testzip() is None
+
+
+def test_rebuild_to_non_seekable_sink(passfile, signer, verifier):
+    class Sink:
+        def __init__(self):
+            self.data = bytearray()
+
+        def write(self, data):
+            self.data += data
+            return len(data)
+
+        def flush(self):
+            pass
+
+    previous = passfile.create(signer=signer).getvalue()
+    sink = Sink()
+    rebuild_pkpass(passfile, previous, signer=signer, zip_file=sink)
+    assert verifier.verify(bytes(sink.data)).valid
+
+
+def test_rebuild_without_raw_copies(passfile, signer, verifier, monkeypatch):
+    # e.g. a python version whose zipfile internals are not known
+    monkeypatch.setattr(rebuild, "_RAW_COPY", False)
+    previous = passfile.create(signer=signer, compression=NO_COMPRESSION).getvalue()
+    rebuilt = rebuild_pkpass(passfile, previous, signer=signer).getvalue()
+    assert verifier.verify(rebuilt).valid
+    with PassFile(previous) as old, PassFile(rebuilt) as new:
+        assert dict(new.attachments) == dict(old.attachments)
+        for name in old.attachments:
+            # kept as stored, the default compression of rebuild_pkpass would deflate pass.strings
+            assert new.zipfile.getinfo(name).compress_type == zipfile.ZIP_STORED
+        assert new.zipfile.testzip() is None
@@ -0,0 +1,100 @@
+import pytest
+
+from edutap.models_apple.registrations import InMemoryRegistrationStore, Registration, SQLiteRegistrationStore
+
+
+PASS_TYPE = "pass.org.edutap.tests"
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        yield InMemoryRegistrationStore()
+    else:
+        store = SQLiteRegistrationStore(str(tmp_path / "registrations.sqlite"))
+        yield store
+        store.close()
+
+
+def registration(device: str, serial_number: str, push_token: str | None = None) -> Registration:
+    return Registration(device, PASS_TYPE, serial_number, push_token or f"token-{device}")
+
+
+def test_register_and_unregister(store):
+    assert store.register(registration("d1", "s1"))
+    assert not store.register(registration("d1", "s1", "new-token"))
+    store.register_many([registration("d1", "s2"), registration("d2", "s1")])
+    assert len(store) == 3
+    assert sorted(store.registrations(PASS_TYPE, "s1")) == [
+        registration("d1", "s1", "new-token"),
+        registration("d2", "s1"),
+    ]
+    assert sorted(store.push_tokens(PASS_TYPE, "s1")) == ["new-token", "token-d2"]
+    assert store.push_tokens(PASS_TYPE, "unknown") == []
+
+    assert store.unregister("d1", PASS_TYPE, "s1")
+    assert not store.unregister("d1", PASS_TYPE, "s1")
+    assert len(store) == 2
+    assert store.push_tokens(PASS_TYPE, "s1") == ["token-d2"]
+    assert store.updated_since("d1", PASS_TYPE) == (["s2"], 0)
+
+
+def test_tags_increase(store):
+    store.register(registration("d1", "s1"))
+    assert store.tag(PASS_TYPE, "s1") == 0
+    first = store.touch(PASS_TYPE, "s1")
+    second = store.touch(PASS_TYPE, "unregistered")
+    third = store.touch(PASS_TYPE, "s1")
+    assert 0 < first < second < third
+    assert store.tag(PASS_TYPE, "s1") == third
+    assert store.tag(PASS_TYPE, "unregistered") == second
+
+
+def test_updated_since(store):
+    for serial_number in ("s1", "s2", "s3"):
+        store.register(registration("d1", serial_number))
+    store.register(registration("d2", "s2"))
+    store.register(Registration("d1", "pass.other", "s1", "token"))
+
+    serial_numbers, last = store.updated_since("d1", PASS_TYPE)
+    assert sorted(serial_numbers) == ["s1", "s2", "s3"]
+    assert last == 0
+    assert store.updated_since("d1", PASS_TYPE, last) == ([], 0)
+
+    tag2 = store.touch(PASS_TYPE, "s2")
+    tag1 = store.touch(PASS_TYPE, "s1")
+    assert store.updated_since("d1", PASS_TYPE, 0) == (["s2", "s1"], tag1)
+    assert store.updated_since("d1", PASS_TYPE, tag2) == (["s1"], tag1)
+    assert store.updated_since("d1", PASS_TYPE, tag1) == ([], tag1)
+    assert store.updated_since("d2", PASS_TYPE, 0) == (["s2"], tag2)
+    assert store.updated_since("d1", "pass.other", 0) == ([], 0)
+    assert store.updated_since("unknown", PASS_TYPE) == ([], 0)
+
+    # a pass updated again is reported once, with its new tag
+    tag3 = store.touch(PASS_TYPE, "s2")
+    assert store.updated_since("d1", PASS_TYPE, tag2) == (["s1", "s2"], tag3)
+
+    # a device registering for a pass updated before gets its current tag
+    store.register(registration("d3", "s1"))
+    assert store.updated_since("d3", PASS_TYPE, 0) == (["s1"], tag1)
+    store.unregister("d1", PASS_TYPE, "s2")
+    assert store.updated_since("d1", PASS_TYPE, tag2) == (["s1"], tag1)
+
+
+def test_sqlite_store_is_shared(tmp_path):
+    path = str(tmp_path / "registrations.sqlite")
+    writer, reader = SQLiteRegistrationStore(path), SQLiteRegistrationStore(path)
+    writer.register(registration("d1", "s1"))
+    tag = writer.touch(PASS_TYPE, "s1")
+    assert reader.updated_since("d1", PASS_TYPE, 0) == (["s1"], tag)
+    assert reader.touch(PASS_TYPE, "s2") == tag + 1
+
+
+def test_sqlite_lookups_use_the_indexes():
+    store = SQLiteRegistrationStore()
+    plan = store._connection.execute(
+        "EXPLAIN QUERY PLAN SELECT serial_number, tag FROM registrations"
+        " WHERE device_library_identifier = ? AND pass_type_identifier = ? AND tag > ? ORDER BY tag",
+        ("d1", PASS_TYPE, 0),
+    ).fetchall()
+    assert "INDEX registrations_device_tag" in plan[0][-1]
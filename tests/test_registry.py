@@ -0,0 +1,208 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from common import passes
+from edutap.models_apple.registry import InMemoryTemplateStore, SQLiteTemplateStore, TemplateRegistry
+from edutap.models_apple.template import CompiledPassTemplate, PassTemplate
+
+
+start = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture(scope="module")
+def store_card():
+    with open(passes / "StoreCard.pkpass", "rb") as f:
+        return PassTemplate.from_passfile(f, template_identifier="store", backoffice_identifier="bo-store")
+
+
+def version(template: PassTemplate, days: int, **update) -> PassTemplate:
+    """a new version of the template, `days` after start"""
+    data = template.model_dump(exclude={"id"})
+    data.update({"timestamp": start + timedelta(days=days), **update})
+    return PassTemplate.model_validate(data)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        yield InMemoryTemplateStore()
+    else:
+        store = SQLiteTemplateStore(str(tmp_path / "templates.sqlite"))
+        yield store
+        store.close()
+
+
+@pytest.fixture
+def versions(store, store_card):
+    versions = [
+        version(store_card, 0, title="first"),
+        version(store_card, 10, title="third"),
+        version(store_card, 5, title="second", backoffice_identifier="bo-old"),
+        version(store_card, 0, template_identifier="coupon", backoffice_identifier="bo-coupon"),
+    ]
+    for template in versions:
+        store.add(template)
+    return versions
+
+
+def test_store_lookups(store, versions):
+    assert store.latest("store").title == "third"
+    assert store.latest("missing") is None
+    assert [t.title for t in store.versions("store")] == ["first", "second", "third"]
+    assert store.get(versions[2].id).title == "second"
+    assert store.version("store", start + timedelta(days=5)).title == "second"
+    assert store.version("store", start + timedelta(days=6)) is None
+    assert store.as_of("store", start + timedelta(days=7)).title == "second"
+    assert store.as_of("store", start + timedelta(days=10)).title == "third"
+    assert store.as_of("store", start - timedelta(days=1)) is None
+    assert store.by_backoffice_identifier("bo-store").title == "third"
+    assert store.by_backoffice_identifier("bo-old").title == "second"
+    assert store.by_backoffice_identifier("bo-coupon").template_identifier == "coupon"
+    assert len(store) == 4
+
+
+def test_store_versions_are_unique(store, versions, store_card):
+    with pytest.raises(ValueError):
+        store.add(version(store_card, 5))
+    with pytest.raises(ValueError):
+        store.add(versions[0])
+
+
+def test_sqlite_store_roundtrip(tmp_path, store_card):
+    path = str(tmp_path / "templates.sqlite")
+    template = version(store_card, 1)
+    SQLiteTemplateStore(path).add(template)
+    loaded = SQLiteTemplateStore(path).latest("store")
+    assert loaded == template
+
+
+def test_sqlite_store_normalizes_offsets(tmp_path, store_card):
+    path = str(tmp_path / "templates.sqlite")
+    store = SQLiteTemplateStore(path)
+    utc = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+    # 11:00 UTC, sorted after 12:00 UTC as text with its offset
+    earlier = datetime(2024, 5, 1, 13, 0, tzinfo=timezone(timedelta(hours=2)))
+    store.add(version(store_card, 0, timestamp=utc, title="later"))
+    store.add(version(store_card, 0, timestamp=earlier, title="earlier"))
+    assert store.latest("store").title == "later"
+    assert [t.title for t in store.versions("store")] == ["earlier", "later"]
+    assert store.as_of("store", utc - timedelta(minutes=30)).title == "earlier"
+    assert store.version("store", earlier.astimezone(timezone.utc)).title == "earlier"
+    store.close()
+
+
+def test_naive_timestamps_are_rejected(store, versions, store_card):
+    naive = datetime(2024, 5, 6, 12, 0)
+    with pytest.raises(ValueError):
+        version(store_card, 0, timestamp=naive)
+    with pytest.raises(ValueError):
+        store.version("store", naive)
+    with pytest.raises(ValueError):
+        store.as_of("store", naive)
+    with pytest.raises(ValueError):
+        TemplateRegistry(store).get("store", timestamp=naive)
+    assert store_card.timestamp.tzinfo is not None
+
+
+def test_registry_lookups(store, versions):
+    registry = TemplateRegistry(store)
+    assert registry.latest("store").title == "third"
+    assert registry.get("store").title == "third"
+    assert registry.get("store", timestamp=start + timedelta(days=5)).title == "second"
+    assert registry.get(backoffice_identifier="bo-old").title == "second"
+    assert registry.get(id=versions[0].id).title == "first"
+    assert [t.title for t in registry.versions("store")] == ["first", "second", "third"]
+    assert "store" in registry
+    assert "missing" not in registry
+    with pytest.raises(KeyError):
+        registry.get("store", timestamp=start + timedelta(days=1))
+    with pytest.raises(KeyError):
+        registry.latest("missing")
+
+
+def test_registry_latest_is_not_looked_up_again(versions, store_card, monkeypatch):
+    store = InMemoryTemplateStore()
+    registry = TemplateRegistry(store)
+    registry.add(versions[0])
+    assert registry.latest("store") is versions[0]
+    calls = []
+    monkeypatch.setattr(store, "latest", lambda identifier: calls.append(identifier))
+    assert registry.latest("store") is versions[0]
+    newer = version(store_card, 20)
+    registry.add(newer)
+    assert registry.latest("store") is newer
+    assert calls == []
+
+
+def test_registry_sees_versions_of_other_writers_after_invalidate(store, versions, store_card):
+    registry = TemplateRegistry(store)
+    assert registry.latest("store").title == "third"
+    store.add(version(store_card, 20, title="fourth"))
+    assert registry.latest("store").title == "third"
+    registry.invalidate("store")
+    assert registry.latest("store").title == "fourth"
+
+
+def test_registry_compiles_once(store, versions):
+    registry = TemplateRegistry(store)
+    compiled = registry.compiled("store")
+    assert isinstance(compiled, CompiledPassTemplate)
+    assert compiled.id == versions[1].id
+    assert registry.compiled("store") is compiled
+    assert registry.compiled(id=versions[1].id) is compiled
+    assert (registry.hits, registry.misses) == (2, 1)
+    pass_object = registry.create_pass_object("store", serial_number="1234")
+    assert pass_object.serialNumber == "1234"
+    assert pass_object.files.keys() == compiled.attachments.keys()
+
+
+def test_registry_compiled_does_not_query_the_store_again(store, versions, monkeypatch):
+    registry = TemplateRegistry(store)
+    lookups = [
+        dict(template_identifier="store"),
+        dict(backoffice_identifier="bo-old"),
+        dict(template_identifier="store", timestamp=start),
+        dict(id=versions[3].id),
+    ]
+    compiled = [registry.compiled(**lookup) for lookup in lookups]
+    assert [c.id for c in compiled] == [versions[1].id, versions[2].id, versions[0].id, versions[3].id]
+
+    def fail(*args):
+        raise AssertionError("the store was queried")
+
+    for method in ("get", "latest", "version", "by_backoffice_identifier"):
+        monkeypatch.setattr(store, method, fail)
+    assert [registry.compiled(**lookup) for lookup in lookups] == compiled
+    assert (registry.hits, registry.misses) == (4, 4)
+
+
+def test_registry_backoffice_identifier_follows_new_versions(store, versions, store_card):
+    registry = TemplateRegistry(store)
+    assert registry.compiled(backoffice_identifier="bo-old").id == versions[2].id
+    newer = version(store_card, 20, backoffice_identifier="bo-old")
+    registry.add(newer)
+    assert registry.compiled(backoffice_identifier="bo-old").id == newer.id
+    # added by another process
+    other = version(store_card, 30, backoffice_identifier="bo-old")
+    store.add(other)
+    assert registry.get(backoffice_identifier="bo-old").id == newer.id
+    registry.invalidate()
+    assert registry.get(backoffice_identifier="bo-old").id == other.id
+
+
+def test_registry_cache_is_bounded(store, versions):
+    registry = TemplateRegistry(store)
+    registry.compiled("store")
+    one = registry.size
+    registry.max_bytes = one * 2 + 1
+    registry.compiled("coupon")
+    registry.compiled(id=versions[0].id)
+    assert registry.size <= registry.max_bytes
+    registry.compiled("store", timestamp=start + timedelta(days=5))
+    # the least recently used template was evicted
+    assert registry.misses == 4
+    registry.compiled(id=versions[0].id)
+    assert registry.hits == 1
+    registry.compiled("store")
+    assert registry.misses == 5
@@ -0,0 +1,106 @@
+import io
+import time
+import zipfile
+
+import pytest
+
+from common import create_certificate_chain, create_shell_pass, resources
+from edutap.models_apple.compression import NO_COMPRESSION
+from edutap.models_apple.models import REPRODUCIBLE_DATE_TIME, archive_fingerprint
+from edutap.models_apple.passfile import PassFile
+from edutap.models_apple.signing import PassSigner
+from edutap.models_apple.verification import PassVerifier
+
+
+@pytest.fixture(scope="module")
+def signer(certificate_chain):
+    return PassSigner(*certificate_chain)
+
+
+def build_pass(reverse: bool = False):
+    """the same pass, with files and userInfo set in reverse order if `reverse`"""
+    passfile = create_shell_pass()
+    files = [
+        ("icon.png", resources / "white_square.png"),
+        ("logo.png", resources / "edutap.png"),
+        ("strip.jpg", resources / "eaie-hero.jpg"),
+    ]
+    user_info = [("b", 2), ("a", 1), ("c", {"y": 1, "x": 2})]
+    for name, path in reversed(files) if reverse else files:
+        with open(path, "rb") as f:
+            passfile.addFile(name, f.read())
+    passfile.userInfo = dict(reversed(user_info) if reverse else user_info)
+    passfile.serialNumber = "1234"
+    return passfile
+
+
+def later(monkeypatch):
+    """moves the clock of the zip entries a day ahead"""
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 86400)
+
+
+def test_reproducible_builds_are_identical(signer, monkeypatch):
+    first = build_pass().create(signer=signer, reproducible=True).getvalue()
+    later(monkeypatch)
+    second = build_pass(reverse=True).create(signer=signer, reproducible=True).getvalue()
+    assert first == second
+    assert archive_fingerprint(first) == archive_fingerprint(second)
+
+
+def test_builds_differ_without_reproducible(signer, monkeypatch):
+    first = build_pass().create(signer=signer).getvalue()
+    later(monkeypatch)
+    assert build_pass().create(signer=signer).getvalue() != first
+
+
+def test_reproducible_archive(signer, certificate_chain):
+    data = build_pass(reverse=True).create(signer=signer, reproducible=True).getvalue()
+    assert PassVerifier(certificate_chain[2]).verify(data).valid
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        infos = zf.infolist()
+        assert [info.filename for info in infos] == [
+            "signature", "manifest.json", "pass.json", "icon.png", "logo.png", "strip.jpg"
+        ]
+        assert {info.date_time for info in infos} == {REPRODUCIBLE_DATE_TIME}
+    with PassFile(data) as reader:
+        assert list(reader.manifest) == sorted(reader.manifest)
+        assert list(reader.pass_dict) == sorted(reader.pass_dict)
+        assert list(reader.pass_dict["userInfo"]["c"]) == ["x", "y"]
+
+
+def test_reproducible_stream(signer, monkeypatch):
+    first = b"".join(build_pass().stream(signer=signer, reproducible=True))
+    later(monkeypatch)
+    assert b"".join(build_pass(reverse=True).stream(signer=signer, reproducible=True)) == first
+    with zipfile.ZipFile(io.BytesIO(first)) as zf:
+        assert zf.testzip() is None
+        assert zf.getinfo("pass.json").compress_type == zipfile.ZIP_DEFLATED
+        assert zf.getinfo("icon.png").compress_type == zipfile.ZIP_STORED
+
+
+def test_fingerprint(signer, tmp_path):
+    fingerprint = build_pass().fingerprint(signer=signer)
+    assert build_pass(reverse=True).fingerprint(signer=signer) == fingerprint
+
+    changed = build_pass()
+    changed.userInfo["a"] = 3
+    assert changed.fingerprint(signer=signer) != fingerprint
+    assert build_pass().fingerprint(signer=signer, compression=NO_COMPRESSION) != fingerprint
+    other_signer = PassSigner(*create_certificate_chain(tmp_path))
+    assert build_pass().fingerprint(signer=other_signer) != fingerprint
+
+
+def test_fingerprint_does_not_sign(signer, monkeypatch):
+    passfile = build_pass()
+    monkeypatch.setattr(PassSigner, "sign", lambda *args, **kwargs: pytest.fail("signed"))
+    passfile.fingerprint(signer=signer)
+
+
+def test_normal_and_reproducible_builds_do_not_share_the_cache(signer):
+    passfile = build_pass(reverse=True)
+    normal = passfile._prepare()
+    reproducible = passfile._prepare(reproducible=True)
+    assert reproducible is not normal
+    assert passfile._prepare(reproducible=True) is reproducible
+    assert reproducible.pass_json != normal.pass_json
@@ -0,0 +1,131 @@
+import threading
+import uuid
+
+import pytest
+import shortuuid
+
+from common import create_shell_pass, passes
+from edutap.models_apple import serials
+from edutap.models_apple.models import Pass
+from edutap.models_apple.serials import (
+    RandomSerials,
+    SequentialSerials,
+    SerialAllocator,
+    SerialCollision,
+    TimeOrderedSerials,
+    default_allocator,
+    set_default_allocator,
+)
+from edutap.models_apple.template import PassTemplate
+
+
+@pytest.fixture
+def allocator():
+    allocator = SequentialSerials(prefix="S", width=4, pool_size=10)
+    previous = set_default_allocator(allocator)
+    yield allocator
+    set_default_allocator(previous)
+
+
+def test_random_serials_are_shortuuids():
+    allocated = RandomSerials(pool_size=16).allocate_many(100)
+    assert len(set(allocated)) == 100
+    for serial in allocated:
+        assert len(serial) == serials.LENGTH
+        decoded = shortuuid.decode(serial)
+        assert decoded.version == 4
+        assert decoded.variant == uuid.RFC_4122
+        assert shortuuid.encode(decoded) == serial
+
+
+def test_time_ordered_serials_sort_in_allocation_order():
+    allocator = TimeOrderedSerials(pool_size=8)
+    allocated = [allocator.allocate() for _ in range(20)] + allocator.allocate_many(5000)
+    assert allocated == sorted(allocated)
+    assert len(set(allocated)) == len(allocated)
+    assert shortuuid.decode(allocated[0]).version == 7
+
+
+def test_sequential_serials_reserve_blocks():
+    blocks = []
+    next_number = 100
+
+    def reserve(count):
+        nonlocal next_number
+        blocks.append(count)
+        first, next_number = next_number, next_number + count
+        return first
+
+    allocator = SequentialSerials(reserve, prefix="P-", width=6, pool_size=4)
+    assert allocator.allocate_many(3) == ["P-000100", "P-000101", "P-000102"]
+    assert allocator.allocate() == "P-000103"
+    assert allocator.allocate() == "P-000104"
+    assert allocator.allocate_many(9) == [f"P-{n:06}" for n in range(105, 114)]
+    assert blocks == [4, 4, 6]
+
+
+def test_collisions_with_the_index_are_skipped():
+    index = {"S0002", "S0003"}
+    allocator = SequentialSerials(prefix="S", width=4, pool_size=2, index=index)
+    assert allocator.allocate_many(3) == ["S0001", "S0004", "S0005"]
+    assert allocator.collisions == 2
+    assert {"S0001", "S0004", "S0005"} <= index
+
+    with pytest.raises(SerialCollision):
+        SequentialSerials(prefix="S", width=4, index=index, max_attempts=3).allocate_many(2)
+
+
+def test_allocators_implement_generate():
+    with pytest.raises(TypeError):
+        SerialAllocator()
+
+    class Fixed(SerialAllocator):
+        def _generate(self, count):
+            return [f"F{n}" for n in range(count)]
+
+    allocator = Fixed(pool_size=2)
+    assert [allocator.allocate() for _ in range(3)] == ["F0", "F1", "F0"]
+
+
+def test_allocation_is_thread_safe():
+    allocator = SequentialSerials(pool_size=7)
+    results = []
+
+    def allocate():
+        results.extend(allocator.allocate() for _ in range(1000))
+
+    threads = [threading.Thread(target=allocate) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(results)) == 8000
+
+
+def test_custom_strategy():
+    class Letters(SerialAllocator):
+        def _generate(self, count):
+            return [chr(ord("a") + i) for i in range(count)]
+
+    assert Letters(pool_size=3).allocate_many(2) == ["a", "b"]
+
+
+def test_passes_use_the_default_allocator(allocator):
+    assert default_allocator() is allocator
+    assert create_shell_pass().serialNumber == "S0001"
+    assert create_shell_pass().serialNumber == "S0002"
+
+
+def test_no_serial_is_allocated_when_one_is_supplied(allocator):
+    data = create_shell_pass().model_dump(exclude_none=True)
+    data["serialNumber"] = "given"
+    assert Pass.model_validate(data).serialNumber == "given"
+    assert allocator.allocate() == "S0002"
+
+
+def test_compiled_templates_allocate_serials_lazily(allocator):
+    with open(passes / "StoreCard.pkpass", "rb") as f:
+        compiled = PassTemplate.from_passfile(f, template_identifier="serials", backoffice_identifier="serials").compile()
+    assert compiled.create_pass_object(serial_number="given", trusted=True).serialNumber == "given"
+    assert compiled.create_pass_object(serial_number="given").serialNumber == "given"
+    assert compiled.create_pass_object(trusted=True).serialNumber == "S0001"
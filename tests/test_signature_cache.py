@@ -0,0 +1,122 @@
+import os
+import pickle
+import time
+
+import pytest
+
+from common import create_shell_pass
+from edutap.models_apple.signature_cache import DiskSignatureCache, MemorySignatureCache, SignatureCache
+from edutap.models_apple.signing import PassSigner
+from edutap.models_apple.verification import PassVerifier
+
+
+@pytest.fixture(params=["memory", "disk"])
+def cache(request, tmp_path):
+    if request.param == "memory":
+        return MemorySignatureCache()
+    return DiskSignatureCache(tmp_path / "signatures")
+
+
+def test_key():
+    key = SignatureCache.key("signer", b"manifest")
+    assert key == SignatureCache.key("signer", b"manifest")
+    assert key != SignatureCache.key("other", b"manifest")
+    assert key != SignatureCache.key("signer", b"other manifest")
+    assert key != SignatureCache.key("signer", b"manifest", signed_attributes=False)
+
+
+def test_storage_methods_are_abstract():
+    class Incomplete(SignatureCache):
+        def _get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        Incomplete()
+    with pytest.raises(TypeError):
+        SignatureCache()
+
+
+def test_get_and_set(cache):
+    assert cache.get("a") is None
+    cache.set("a", b"signature", time.time() + 60)
+    assert cache.get("a") == b"signature"
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert len(cache) == 1
+    cache.clear()
+    assert cache.get("a") is None
+
+
+def test_expired_signatures(cache, monkeypatch):
+    now = time.time()
+    cache.set("expired", b"signature", now - 1)
+    assert cache.get("expired") is None
+    cache.set("a", b"signature", now + 60)
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemorySignatureCache(maxsize=2)
+    expires = time.time() + 60
+    cache.set("a", b"1", expires)
+    cache.set("b", b"2", expires)
+    cache.get("a")
+    cache.set("c", b"3", expires)
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1"
+
+
+def test_disk_cache_purge(tmp_path, monkeypatch):
+    cache = DiskSignatureCache(tmp_path)
+    now = time.time()
+    cache.set("a", b"1", now + 10)
+    cache.set("b", b"2", now + 100)
+    monkeypatch.setattr(time, "time", lambda: now + 50)
+    assert cache.purge() == 1
+    assert cache.get("b") == b"2"
+    # shared by the caches on the same directory
+    assert DiskSignatureCache(tmp_path).get("b") == b"2"
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_pickled_cache_resets_counters(cache):
+    cache.set("a", b"1", time.time() + 60)
+    cache.get("a")
+    clone = pickle.loads(pickle.dumps(cache))
+    assert (clone.hits, clone.misses) == (0, 0)
+    clone.get("b")
+    assert clone.misses == 1
+
+
+def test_signer_reuses_cached_signatures(certificate_chain, cache, monkeypatch):
+    signer = PassSigner(*certificate_chain, cache=cache)
+    signs = []
+    sign = PassSigner._sign_der
+
+    def counting_sign(self, *args, **kwargs):
+        signs.append(args)
+        return sign(self, *args, **kwargs)
+
+    monkeypatch.setattr(PassSigner, "_sign_der", counting_sign)
+    passfile = create_shell_pass()
+    passfile.serialNumber = "1234"
+    first = passfile.create(signer=signer, reproducible=True).getvalue()
+    second = passfile.create(signer=signer, reproducible=True).getvalue()
+    assert first == second
+    assert len(signs) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert PassVerifier(certificate_chain[2]).verify(second).valid
+
+    # signatures with signed attributes are cached separately
+    assert PassVerifier(certificate_chain[2]).verify(passfile.create(signer=signer).getvalue()).valid
+    assert len(signs) == 2
+
+
+def test_signatures_expire_with_the_certificate(certificate_chain):
+    cache = MemorySignatureCache()
+    signer = PassSigner(*certificate_chain, cache=cache)
+    signer.sign_der(b"manifest")
+    _, expires = cache._entries[cache.key(signer.fingerprint, b"manifest")]
+    assert expires == (signer.not_after - signer.expiry_margin).timestamp()
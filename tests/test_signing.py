@@ -0,0 +1,222 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import io
+import os
+import pickle
+import shutil
+import zipfile
+
+import pytest
+from M2Crypto import BIO, SMIME, X509
+
+from common import cert_file, create_certificate_chain, create_shell_pass, key_file, passes, password_file, resources, wwdr_file
+from edutap.models_apple.signing import PassSigner, SignerRegistry
+from edutap.models_apple.template import PassTemplate
+
+
+@pytest.fixture
+def password():
+    try:
+        with open(password_file) as file_:
+            return file_.read().strip()
+    except IOError:
+        return ""
+
+
+@pytest.fixture
+def signer(password):
+    return PassSigner(cert_file, key_file, wwdr_file, password)
+
+
+def verify(signer: PassSigner, signature: bytes, manifest: str) -> bytes:
+    smime = signer.smime()
+    store = X509.X509_Store()
+    store.load_info(str(wwdr_file))
+    smime.set_x509_store(store)
+    p7 = SMIME.load_pkcs7_bio_der(BIO.MemoryBuffer(signature))
+    data_bio = BIO.MemoryBuffer(bytes(manifest, encoding="utf8"))
+    return smime.verify(p7, data_bio, flags=SMIME.PKCS7_NOVERIFY)
+
+
+def test_signer_signs_manifest(signer):
+    passfile = create_shell_pass()
+    manifest = passfile._createManifest()
+    signature = passfile._createSignature(manifest, signer=signer)
+
+    assert verify(signer, signature, manifest) == bytes(manifest, encoding="utf8")
+    with pytest.raises(SMIME.PKCS7_Error):
+        verify(signer, signature, '{"pass.json": "foobar"}')
+
+
+def test_create_with_signer(signer):
+    passfile = create_shell_pass()
+    passfile.addFile("icon.png", open(resources / "white_square.png", "rb"))
+    zip_file = passfile.create(signer=signer)
+
+    zf = zipfile.ZipFile(zip_file)
+    assert set(zf.namelist()) == {"signature", "manifest.json", "pass.json", "icon.png"}
+    manifest = zf.read("manifest.json").decode("utf8")
+    assert verify(signer, zf.read("signature"), manifest) == bytes(manifest, encoding="utf8")
+
+
+def test_create_requires_signing_material():
+    passfile = create_shell_pass()
+    with pytest.raises(ValueError):
+        passfile.create()
+
+
+def test_signer_is_thread_safe(signer):
+    passfile = create_shell_pass()
+    manifest = passfile._createManifest()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        signatures = list(executor.map(lambda _: signer.sign_der(manifest), range(64)))
+
+    for signature in signatures:
+        assert verify(signer, signature, manifest) == bytes(manifest, encoding="utf8")
+
+
+def test_signer_reloads_changed_files(tmp_path, password):
+    for path in (cert_file, key_file, wwdr_file):
+        shutil.copy(path, tmp_path / path.name)
+    signer = PassSigner(
+        tmp_path / cert_file.name,
+        tmp_path / key_file.name,
+        tmp_path / wwdr_file.name,
+        password,
+        check_interval=0,
+    )
+    material = signer._material
+    signer.refresh()
+    assert signer._material is material
+
+    stat = os.stat(tmp_path / cert_file.name)
+    os.utime(tmp_path / cert_file.name, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert signer.is_stale()
+    signer.refresh()
+    assert signer._material is not material
+    assert not signer.is_stale()
+
+
+def test_signer_is_stale_before_expiration(password):
+    signer = PassSigner(cert_file, key_file, wwdr_file, password, expiry_margin=timedelta(days=365 * 100))
+    assert signer.is_stale()
+
+
+def test_registry_lookup_and_eviction(password):
+    registry = SignerRegistry(maxsize=1)
+    registry.register("pass.a", "TEAM", cert_file, key_file, wwdr_file, password)
+    registry.register("pass.b", "TEAM", cert_file, key_file, wwdr_file, password)
+    assert len(registry) == 2
+    assert ("pass.a", "TEAM") in registry
+
+    signer_a = registry.get("pass.a", "TEAM")
+    assert registry.get("pass.a", "TEAM") is signer_a
+    registry.get("pass.b", "TEAM")
+    # pass.a was evicted and is loaded again
+    assert registry.get("pass.a", "TEAM") is not signer_a
+
+    with pytest.raises(KeyError):
+        registry.get("pass.c", "TEAM")
+
+
+def test_create_with_registry(password):
+    registry = SignerRegistry()
+    registry.register("Pass Type ID", "Team Identifier", cert_file, key_file, wwdr_file, password)
+    passfile = create_shell_pass()
+    zip_file = passfile.create(signer=registry)
+    assert "signature" in zipfile.ZipFile(zip_file).namelist()
+
+
+def test_create_pkpass_from_template_with_signer(signer):
+    with open(passes / "StoreCard.pkpass", "rb") as f:
+        template = PassTemplate.from_passfile(f, template_identifier="test", backoffice_identifier="test")
+
+    pkpass = template.create_pkpass(
+        passinfo_patches=[{"path": "/primaryFields/0/changeMessage", "op": "replace", "value": "new msg"}],
+        signer=signer,
+    )
+    zf = zipfile.ZipFile(pkpass)
+    assert "signature" in zf.namelist()
+    assert "icon.png" in zf.namelist()
+
+
+def test_signer_can_be_pickled(signer, password):
+    clone = pickle.loads(pickle.dumps(signer))
+    manifest = create_shell_pass()._createManifest()
+    assert verify(signer, clone.sign_der(manifest), manifest) == bytes(manifest, encoding="utf8")
+
+    registry = SignerRegistry()
+    registry.register("pass.a", "TEAM", cert_file, key_file, wwdr_file, password)
+    registry.get("pass.a", "TEAM")
+    clone = pickle.loads(pickle.dumps(registry))
+    assert clone.get("pass.a", "TEAM").certificate == cert_file
+
+
+class NonSeekableSink:
+    """a write-only target like a socket or a wsgi body"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+def test_stream(signer):
+    passfile = create_shell_pass()
+    passfile.addFile("icon.png", open(resources / "white_square.png", "rb"))
+    large = os.urandom(1024 * 1024)
+    passfile.addFile("strip.png", large)
+
+    chunks = list(passfile.stream(signer=signer, chunk_size=16 * 1024))
+    assert max(len(chunk) for chunk in chunks) <= 16 * 1024 + 1024
+
+    zf = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+    assert zf.testzip() is None
+    assert zf.namelist() == ["signature", "manifest.json", "pass.json", "icon.png", "strip.png"]
+    assert zf.read("strip.png") == large
+    assert zf.read("pass.json") == passfile.pass_json.encode("utf-8")
+    manifest = zf.read("manifest.json").decode("utf8")
+    assert verify(signer, zf.read("signature"), manifest) == bytes(manifest, encoding="utf8")
+
+
+def test_write_to_non_seekable_sink(signer):
+    passfile = create_shell_pass()
+    passfile.addFile("icon.png", open(resources / "white_square.png", "rb"))
+
+    sink = NonSeekableSink()
+    passfile.write_to(sink, signer=signer)
+    zf = zipfile.ZipFile(io.BytesIO(b"".join(sink.chunks)))
+    assert zf.read("icon.png") == open(resources / "white_square.png", "rb").read()
+
+    # create also accepts a non-seekable target
+    sink = NonSeekableSink()
+    passfile.create(signer=signer, zip_file=sink)
+    assert zipfile.ZipFile(io.BytesIO(b"".join(sink.chunks))).testzip() is None
+
+
+def test_sign_der_reloads_changed_files(tmp_path):
+    signer = PassSigner(*create_certificate_chain(tmp_path), check_interval=0)
+    material = signer._material
+    signer.sign_der(b"manifest")
+    assert signer._material is material
+
+    stat = os.stat(signer.certificate)
+    os.utime(signer.certificate, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    signer.sign_der(b"manifest")
+    assert signer._material is not material
+
+
+def test_expiring_certificate_is_not_reloaded_while_unchanged(tmp_path, monkeypatch):
+    signer = PassSigner(*create_certificate_chain(tmp_path), check_interval=0, expiry_margin=timedelta(days=365 * 100))
+    assert signer.is_stale()
+    loads = []
+    monkeypatch.setattr(signer.backend, "load", lambda *args: loads.append(args))
+    signer.sign_der(b"manifest")
+    signer.refresh()
+    assert loads == []
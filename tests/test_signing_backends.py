@@ -0,0 +1,84 @@
+import pytest
+from M2Crypto import BIO, SMIME, X509
+
+from common import create_shell_pass
+from edutap.models_apple.signing import PassSigner
+from edutap.models_apple.signing_backends import BACKENDS, M2CryptoBackend, get_backend
+from edutap.models_apple.verification import PassVerifier
+
+
+@pytest.fixture(params=sorted(BACKENDS))
+def backend(request):
+    if request.param == "cryptography":
+        pytest.importorskip("cryptography")
+    return request.param
+
+
+def verify(wwdr_certificate, signature: bytes, manifest: bytes) -> bytes:
+    """verifies a detached DER signature against the chain, raises SMIME.PKCS7_Error if it is invalid"""
+    smime = SMIME.SMIME()
+    store = X509.X509_Store()
+    store.load_info(str(wwdr_certificate))
+    smime.set_x509_store(store)
+    smime.set_x509_stack(X509.X509_Stack())
+    p7 = SMIME.load_pkcs7_bio_der(BIO.MemoryBuffer(signature))
+    return smime.verify(p7, BIO.MemoryBuffer(manifest), flags=SMIME.PKCS7_DETACHED | SMIME.PKCS7_BINARY)
+
+
+@pytest.mark.parametrize("signed_attributes", [True, False])
+def test_backends_sign_detached_der(certificate_chain, backend, signed_attributes):
+    signer = PassSigner(*certificate_chain, backend=backend)
+    manifest = b'{"pass.json": "0123456789abcdef"}'
+    signature = signer.sign_der(manifest, signed_attributes=signed_attributes)
+
+    # the wwdr certificate is included, the chain verifies with the wwdr certificate as only trust anchor
+    assert verify(certificate_chain[2], signature, manifest) == manifest
+    with pytest.raises(SMIME.PKCS7_Error):
+        verify(certificate_chain[2], signature, b'{"pass.json": "foobar"}')
+
+
+def test_backends_have_the_same_fingerprint(certificate_chain):
+    pytest.importorskip("cryptography")
+    m2crypto = PassSigner(*certificate_chain, backend="m2crypto")
+    cryptography = PassSigner(*certificate_chain, backend="cryptography")
+    assert m2crypto.fingerprint == cryptography.fingerprint
+    assert m2crypto.not_after == cryptography.not_after
+
+
+def test_create_with_backend(certificate_chain, backend):
+    passfile = create_shell_pass()
+    pkpass = passfile.create(signer=PassSigner(*certificate_chain, backend=backend)).getvalue()
+    assert PassVerifier(certificate_chain[2]).verify(pkpass).valid
+
+
+def test_encrypted_key(certificate_chain, backend, tmp_path):
+    serialization = pytest.importorskip("cryptography.hazmat.primitives.serialization")
+    with open(certificate_chain[1], "rb") as f:
+        key = serialization.load_pem_private_key(f.read(), None)
+    encrypted = tmp_path / "encrypted.key"
+    encrypted.write_bytes(
+        key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.BestAvailableEncryption(b"secret"),
+        )
+    )
+    signer = PassSigner(certificate_chain[0], encrypted, certificate_chain[2], "secret", backend=backend)
+    assert verify(certificate_chain[2], signer.sign_der(b"manifest"), b"manifest") == b"manifest"
+
+
+def test_m2crypto_objects_need_the_m2crypto_backend(certificate_chain):
+    pytest.importorskip("cryptography")
+    signer = PassSigner(*certificate_chain, backend="cryptography")
+    with pytest.raises(TypeError):
+        signer.smime()
+    with pytest.raises(TypeError):
+        create_shell_pass()._sign_manifest("{}", signer=signer)
+
+
+def test_get_backend():
+    backend = M2CryptoBackend()
+    assert get_backend(backend) is backend
+    assert isinstance(get_backend("m2crypto"), M2CryptoBackend)
+    with pytest.raises(ValueError):
+        get_backend("nss")
@@ -1,11 +1,17 @@
+import json
 import os
+import uuid
 import zipfile
 import io
+import jsonpatch
+import jsonpointer
+import pydantic
 import pytest
 import common
 from common import passes
-from edutap.models_apple.models import Pass
-from edutap.models_apple.template import PassTemplate
+from edutap.models_apple import template as template_module
+from edutap.models_apple.models import Field, Pass, StoreCard
+from edutap.models_apple.template import CompiledPassTemplate, PassCreationError, PassTemplate
 
 
 def test_pass_template_import():
@@ -104,3 +110,237 @@ def test_create_pkpass_from_template(created_pass_object: Pass, tmp_path):
     
     os.system("open " + str(pass_filename))
     
+
+
+@pytest.fixture
+def signer():
+    from edutap.models_apple.signing import PassSigner
+
+    with open(common.password_file) as f:
+        password = f.read().strip()
+    return PassSigner(common.cert_file, common.key_file, common.wwdr_file, password)
+
+
+def test_create_pass_object_with_serial_number(imported_template: PassTemplate):
+    pass_ = imported_template.create_pass_object(serial_number="1234")
+    assert pass_.serialNumber == "1234"
+
+
+def test_create_pkpasses(imported_template: PassTemplate, signer):
+    patch_sets = [
+        {
+            "serial_number": f"serial-{i}",
+            "pass_patches": [{"path": "/barcodes/0/message", "op": "replace", "value": f"message {i}"}],
+        }
+        for i in range(6)
+    ]
+    # an invalid patch must not abort the batch
+    patch_sets.append({"serial_number": "broken", "pass_patches": [{"path": "/nonexisting/0", "op": "replace", "value": 1}]})
+    # without serial number one is generated
+    patch_sets.append({})
+
+    results = dict(imported_template.create_pkpasses(patch_sets, signer=signer, workers=2))
+
+    assert len(results) == 8
+    assert isinstance(results.pop("broken"), PassCreationError)
+    for serial_number, data in results.items():
+        zf = zipfile.ZipFile(io.BytesIO(data))
+        assert json.loads(zf.read("pass.json"))["serialNumber"] == serial_number
+        assert "signature" in zf.namelist()
+        assert "icon.png" in zf.namelist()
+    assert json.loads(zipfile.ZipFile(io.BytesIO(results["serial-3"])).read("pass.json"))["barcodes"][0]["message"] == "message 3"
+
+
+def test_create_pkpasses_bounds_pending_passes(imported_template: PassTemplate, signer):
+    pulled = 0
+
+    def patch_sets():
+        nonlocal pulled
+        for i in range(20):
+            pulled += 1
+            yield {"serial_number": str(i)}
+
+    results = imported_template.create_pkpasses(patch_sets(), signer=signer, workers=1, window=3)
+    next(results)
+    assert pulled <= 3
+    assert len(list(results)) == 19
+    assert pulled == 20
+
+
+def test_compile_is_cached(imported_template: PassTemplate):
+    compiled = imported_template.compile()
+    assert isinstance(compiled, CompiledPassTemplate)
+    assert imported_template.compile() is compiled
+    assert compiled.pass_type == "storeCard"
+    assert compiled.passinfo_class is StoreCard
+
+    other = imported_template.model_copy(update={"id": uuid.uuid4()})
+    assert other.compile() is not compiled
+
+
+def test_compiled_template_decodes_attachments_once(imported_template: PassTemplate, monkeypatch):
+    compiled = imported_template.compile()
+    with pytest.raises(TypeError):
+        compiled.attachments["icon.png"] = b""
+
+    def fail(*args, **kwargs):
+        raise AssertionError("attachments must not be decoded again")
+
+    monkeypatch.setattr(template_module.base64, "b64decode", fail)
+    pass1 = compiled.create_pass_object(serial_number="1")
+    pass2 = compiled.create_pass_object(serial_number="2")
+    for name, data in compiled.all_attachments():
+        assert pass1.files[name] is data
+        assert pass2.files[name] is data
+
+
+def test_compiled_template_creates_same_pass(imported_template: PassTemplate):
+    patches = dict(
+        serial_number="1234",
+        pass_patches=[{"path": "/barcodes/0/message", "op": "replace", "value": "new barcode message"}],
+        passinfo_patches=[{"path": "/primaryFields/0/changeMessage", "op": "replace", "value": "new msg"}],
+    )
+    expected = imported_template.create_pass_object(**patches)
+    pass_ = imported_template.compile().create_pass_object(**patches)
+    assert pass_.pass_json == expected.pass_json
+    assert pass_.files == expected.files
+
+
+def test_compiled_template_validates_patches(imported_template: PassTemplate):
+    compiled = imported_template.compile()
+    compiled.validate_patches(pass_patches=[{"path": "/barcodes/0/message", "op": "replace", "value": "x"}])
+    with pytest.raises(jsonpatch.JsonPatchConflict):
+        compiled.validate_patches(passinfo_patches=[{"path": "/primaryFields/7", "op": "replace", "value": {}}])
+    with pytest.raises(jsonpointer.JsonPointerException):
+        compiled.validate_patches(pass_patches=[{"path": "/nonexisting/0", "op": "replace", "value": 1}])
+
+
+def test_compiled_template_reuses_patch_plans(imported_template: PassTemplate):
+    compiled = imported_template.compile()
+    passes_ = [
+        compiled.create_pass_object(
+            serial_number=str(i),
+            pass_patches=[{"path": "/barcodes/0/message", "op": "replace", "value": f"message {i}"}],
+        )
+        for i in range(3)
+    ]
+    assert [p.barcodes[0].message for p in passes_] == ["message 0", "message 1", "message 2"]
+    assert len(compiled._plans) == 1
+    # the template is not changed by the patches
+    assert compiled.pass_json["barcodes"][0]["message"] == imported_template.pass_json["barcodes"][0]["message"]
+
+
+trusted_patch_sets = [
+    dict(serial_number="1234"),
+    dict(
+        serial_number="1234",
+        passtype_identifier="pass.demo",
+        team_identifier="TEAM",
+        pass_patches=[
+            {"path": "/barcodes/0/message", "op": "replace", "value": "new barcode message"},
+            {"path": "/nfc", "op": "add", "value": {"message": "nfc", "encryptionPublicKey": "key"}},
+            {"path": "/userInfo", "op": "add", "value": {"a": [1, 2]}},
+            {"path": "/userInfo/a/-", "op": "add", "value": 3},
+        ],
+        passinfo_patches=[
+            {"path": "/primaryFields/0/value", "op": "replace", "value": "Jane Doe"},
+            {"path": "/primaryFields/0/changeMessage", "op": "replace", "value": "new msg"},
+            {"path": "/backFields/-", "op": "add", "value": {"key": "terms", "value": "terms", "label": "Terms"}},
+            {"path": "/backFields/0", "op": "remove"},
+        ],
+    ),
+    # not supported in trusted mode, falls back to full validation
+    dict(serial_number="1234", pass_patches=[{"path": "/description", "op": "test", "value": "nope"}]),
+    dict(serial_number="1234", pass_patches=[{"path": "/barcodes", "op": "remove"}]),
+]
+
+
+@pytest.mark.parametrize("patch_set", trusted_patch_sets)
+def test_trusted_pass_object(imported_template: PassTemplate, patch_set):
+    compiled = imported_template.compile()
+    prototype_json = compiled.prototype.pass_json
+
+    expected = run(lambda: compiled.create_pass_object(**patch_set))
+    pass_ = run(lambda: compiled.create_pass_object(trusted=True, **patch_set))
+    if isinstance(expected, Pass):
+        assert pass_.pass_json == expected.pass_json
+        assert pass_.files == expected.files
+    else:
+        assert pass_ is expected
+    # the shared models of the template are not changed
+    assert compiled.prototype.pass_json == prototype_json
+
+
+def run(function):
+    try:
+        return function()
+    except Exception as e:
+        return type(e)
+
+
+def test_trusted_pass_object_validates_patched_values(imported_template: PassTemplate):
+    compiled = imported_template.compile()
+    with pytest.raises(pydantic.ValidationError):
+        compiled.create_pass_object(
+            trusted=True, passinfo_patches=[{"path": "/primaryFields/0/value", "op": "replace", "value": {"no": "value"}}]
+        )
+
+
+def test_trusted_pass_objects_get_own_serial_numbers(imported_template: PassTemplate):
+    compiled = imported_template.compile()
+    pass1 = compiled.create_pass_object(trusted=True)
+    pass2 = compiled.create_pass_object(trusted=True)
+    assert pass1.serialNumber != pass2.serialNumber
+    assert pass1.serialNumber != compiled.prototype.serialNumber
+    assert pass1.files is not pass2.files
+
+
+def test_trusted_passinfo_patches_are_applied_to_the_model(imported_template: PassTemplate, monkeypatch):
+    compiled = imported_template.compile()
+    compiled.prototype
+
+    def fail(*args):
+        raise AssertionError("trusted mode fell back to validating the whole pass")
+
+    monkeypatch.setattr(template_module, "_pass_from_json", fail)
+    pass_ = compiled.create_pass_object(
+        trusted=True, passinfo_patches=[{"path": "/primaryFields/0/value", "op": "replace", "value": "Jane Doe"}]
+    )
+    assert pass_.passInformation.primaryFields[0].value == "Jane Doe"
+    assert pass_.passInformation is not compiled.prototype.passInformation
+    assert compiled.prototype.passInformation.primaryFields[0].value != "Jane Doe"
+
+    # replacing the whole pass information is validated as a whole
+    monkeypatch.undo()
+    pass_ = compiled.create_pass_object(
+        trusted=True, pass_patches=[{"path": f"/{compiled.pass_type}", "op": "replace", "value": {}}]
+    )
+    assert pass_.passInformation.primaryFields == []
+
+
+def test_trusted_pass_objects_do_not_share_containers(imported_template: PassTemplate):
+    compiled = imported_template.compile()
+    pass1 = compiled.create_pass_object(trusted=True)
+    back_fields = list(compiled.prototype.passInformation.backFields)
+    pass1.passInformation.backFields.append(Field(key="terms", value="terms"))
+    pass1.barcodes.clear()
+    pass1.userInfo = {"a": 1}
+
+    pass2 = compiled.create_pass_object(trusted=True)
+    assert pass2.passInformation.backFields == back_fields
+    assert compiled.prototype.passInformation.backFields == back_fields
+    assert pass2.barcodes and pass2.barcodes[0].message == imported_template.pass_json["barcodes"][0]["message"]
+    assert json.loads(pass2.pass_json) == json.loads(compiled.prototype.pass_json) | {"serialNumber": pass2.serialNumber}
+
+
+def test_shared_models_of_trusted_pass_objects_are_read_only(imported_template: PassTemplate):
+    compiled = imported_template.compile()
+    pass1 = compiled.create_pass_object(trusted=True)
+    value = compiled.prototype.passInformation.primaryFields[0].value
+    with pytest.raises(TypeError, match="read-only"):
+        pass1.passInformation.primaryFields[0].value = "Jane Doe"
+    # replacing the shared model is fine
+    pass1.passInformation.primaryFields[0] = Field(key="name", value="Jane Doe")
+    pass2 = compiled.create_pass_object(trusted=True)
+    assert pass2.passInformation.primaryFields[0].value == value
+    assert json.loads(pass1.pass_json)["storeCard"]["primaryFields"][0]["value"] == "Jane Doe"
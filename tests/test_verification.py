@@ -0,0 +1,137 @@
+import io
+import zipfile
+
+import pytest
+
+from common import cert_file, create_rooted_certificate_chain, create_shell_pass, key_file, password_file, resources, wwdr_file
+from edutap.models_apple.signing import PassSigner
+from edutap.models_apple.verification import PassVerifier, VerificationStats
+
+
+@pytest.fixture(scope="module")
+def chain_signer(certificate_chain):
+    return PassSigner(*certificate_chain)
+
+
+@pytest.fixture(scope="module")
+def verifier(certificate_chain):
+    return PassVerifier(certificate_chain[2])
+
+
+@pytest.fixture(scope="module")
+def pkpass(chain_signer) -> bytes:
+    passfile = create_shell_pass()
+    passfile.addFile("icon.png", open(resources / "white_square.png", "rb"))
+    return passfile.create(signer=chain_signer).getvalue()
+
+
+def rewrite(data: bytes, replace: dict[str, bytes | None]) -> bytes:
+    """returns a copy of the archive with entries replaced, removed (None) or added"""
+    out = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(data)) as source, zipfile.ZipFile(out, "w") as target:
+        for name in source.namelist():
+            if name not in replace:
+                target.writestr(name, source.read(name))
+        for name, content in replace.items():
+            if content is not None:
+                target.writestr(name, content)
+    return out.getvalue()
+
+
+def test_valid(verifier, pkpass, tmp_path):
+    result = verifier.verify(pkpass)
+    assert result.valid, result.errors
+    assert result.size == len(pkpass)
+    assert result.errors == ()
+
+    path = tmp_path / "valid.pkpass"
+    path.write_bytes(pkpass)
+    result = verifier.verify(path)
+    assert result.valid
+    assert result.source == str(path)
+
+
+@pytest.mark.parametrize(
+    "replace, mismatched, missing, extra",
+    [
+        ({"icon.png": b"changed"}, ("icon.png",), (), ()),
+        ({"icon.png": None}, (), ("icon.png",), ()),
+        ({"logo.png": b"unlisted"}, (), (), ("logo.png",)),
+    ],
+)
+def test_manifest_errors(verifier, pkpass, replace, mismatched, missing, extra):
+    result = verifier.verify(rewrite(pkpass, replace))
+    assert not result.valid
+    assert not result.manifest_valid
+    # the manifest itself is unchanged, so is its signature
+    assert result.signature_valid and result.chain_valid
+    assert (result.mismatched, result.missing, result.extra) == (mismatched, missing, extra)
+
+
+def test_changed_manifest(verifier, pkpass):
+    with zipfile.ZipFile(io.BytesIO(pkpass)) as zf:
+        manifest = zf.read("manifest.json").replace(b"{", b'{"logo.png": "0", ', 1)
+    result = verifier.verify(rewrite(pkpass, {"manifest.json": manifest}))
+    assert result.missing == ("logo.png",)
+    assert not result.signature_valid
+    assert not result.chain_valid
+    assert [error.split(":")[0] for error in result.errors] == ["chain", "signature"]
+
+
+def test_untrusted_certificate(verifier):
+    with open(password_file) as f:
+        # the test certificate is self-signed, not issued by the ca of the chain
+        signer = PassSigner(cert_file, key_file, wwdr_file, f.read().strip())
+    result = verifier.verify(create_shell_pass().create(signer=signer).getvalue())
+    assert result.manifest_valid
+    assert result.signature_valid
+    assert not result.chain_valid
+    assert not result.valid
+
+
+def test_intermediate_wwdr_certificate(tmp_path):
+    certificate, key, wwdr, root = create_rooted_certificate_chain(tmp_path)
+    pkpass = create_shell_pass().create(signer=PassSigner(certificate, key, wwdr)).getvalue()
+    # the wwdr certificate is trusted without the root issuing it
+    result = PassVerifier(wwdr).verify(pkpass)
+    assert result.chain_valid, result.errors
+    assert result.valid
+    # so is the root, the signature contains the wwdr certificate
+    assert PassVerifier(root).verify(pkpass).valid
+
+    (tmp_path / "other").mkdir()
+    other_wwdr = create_rooted_certificate_chain(tmp_path / "other")[2]
+    result = PassVerifier(other_wwdr).verify(pkpass)
+    assert result.signature_valid
+    assert not result.chain_valid
+
+
+@pytest.mark.parametrize("data", [b"no zip file", None])
+def test_unreadable(verifier, pkpass, data):
+    data = rewrite(pkpass, {"signature": None, "manifest.json": None}) if data is None else data
+    result = verifier.verify(data)
+    assert not result.valid
+    assert len(result.errors) == 1
+
+
+@pytest.mark.parametrize("processes", [False, True])
+def test_verify_directory(verifier, pkpass, tmp_path, processes):
+    invalid = rewrite(pkpass, {"icon.png": b"changed"})
+    for i in range(10):
+        (tmp_path / f"{i}.pkpass").write_bytes(invalid if i % 5 == 0 else pkpass)
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "x.pkpass").write_bytes(pkpass)
+
+    stats = VerificationStats()
+    results = list(verifier.verify_directory(tmp_path, workers=2, processes=processes, stats=stats))
+    assert len(results) == 11
+    assert sorted(r.source for r in results if not r.valid) == [str(tmp_path / "0.pkpass"), str(tmp_path / "5.pkpass")]
+    assert (stats.files, stats.valid, stats.invalid) == (11, 9, 2)
+    assert stats.bytes == sum(r.size for r in results)
+    assert stats.files_per_second > 0
+    assert stats.finished is not None
+
+
+def test_verify_many_bytes(verifier, pkpass):
+    results = list(verifier.verify_many(iter([pkpass, b"broken", pkpass]), window=2))
+    assert sorted((r.source, r.valid) for r in results) == [("#0", True), ("#1", False), ("#2", True)]